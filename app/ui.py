@@ -1,9 +1,13 @@
 from __future__ import annotations
 
+import hashlib
 import logging
 import os
+import queue
 import sys
 import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 from typing import Dict, List, Optional
 
@@ -13,7 +17,14 @@ ROOT_DIR = Path(__file__).resolve().parents[1]
 if str(ROOT_DIR) not in sys.path:
     sys.path.append(str(ROOT_DIR))
 
-from backend.core import asr, evidence, fact_extractor, post_writer, video_utils, visual_extractor  # noqa: E402  pylint: disable=wrong-import-position
+from backend.core import (  # noqa: E402  pylint: disable=wrong-import-position
+    artifact_store,
+    asr,
+    pipeline,
+    post_writer,
+    stage_cache,
+    visual_extractor,
+)
 from shared import iflow_api  # noqa: E402  pylint: disable=wrong-import-position
 from tools import exporter  # noqa: E402  pylint: disable=wrong-import-position
 
@@ -59,13 +70,40 @@ def _render_config_panel() -> int:
         st.write(f"重试次数: {runtime_cfg['retries']}")
         st.write(f"API: {runtime_cfg['api_url']}")
         st.write(f"缓存目录: {runtime_cfg['cache_dir']}")
+        whisper_stats = asr.whisper_stats()
+        if whisper_stats.get("ready"):
+            memory_mb = (whisper_stats.get("memory_bytes") or 0) / (1024 * 1024)
+            st.write(
+                f"Whisper: {whisper_stats.get('name')} 已就绪（加载 {whisper_stats.get('load_time_s', 0.0):.1f}s，"
+                f"约 {memory_mb:.0f} MB）"
+            )
+        elif whisper_stats.get("loading"):
+            st.write("Whisper: 预热中")
+        store_stats = artifact_store.get_store().stats()
+        st.write(
+            f"帧存储: {store_stats['used_bytes'] / (1024 * 1024):.0f} / {store_stats['max_bytes'] / (1024 * 1024):.0f} MB，"
+            f"{store_stats['files']} 个文件（{store_stats['pinned_files']} 个展示中），已淘汰 {store_stats['evictions']} 个"
+        )
+        image_stats = iflow_api.image_stats()
+        if image_stats["images"]:
+            st.write(
+                f"视觉上传: {image_stats['images']} 张，{image_stats['sent_bytes'] / (1024 * 1024):.1f} MB"
+                f"（原图 {image_stats['original_bytes'] / (1024 * 1024):.1f} MB，"
+                f"节省 {image_stats['saved_bytes'] / (1024 * 1024):.1f} MB）"
+            )
 
     with st.container():
         cols_actions = st.columns([1, 2])
         with cols_actions[0]:
             if st.button("清空缓存"):
-                removed = iflow_api.clear_cache()
-                st.success(f"已清空 {removed} 条缓存")
+                removed = (
+                    iflow_api.clear_cache()
+                    + asr.clear_segment_cache()
+                    + visual_extractor.clear_frame_cache()
+                    + stage_cache.get_stage_cache().clear()
+                )
+                removed_files = artifact_store.get_store().clear()
+                st.success(f"已清空 {removed} 条缓存、{removed_files} 个帧文件")
         with cols_actions[1]:
             vl_budget = st.slider(
                 "VL 帧预算",
@@ -80,45 +118,60 @@ def _render_config_panel() -> int:
 
 
 def _save_uploaded_file(uploaded_file) -> Path:
+    # Streamlit reruns the script on every interaction; only write the upload once. Two different files can
+    # share a name and size, so key on the upload id or, failing that, the content.
+    upload_key = getattr(uploaded_file, "file_id", None) or hashlib.sha1(uploaded_file.getbuffer()).hexdigest()
+    saved_path = st.session_state.get("uploaded_video_path")
+    if saved_path and st.session_state.get("uploaded_video_key") == upload_key and Path(saved_path).exists():
+        return Path(saved_path)
+
+    store = artifact_store.get_store()
     suffix = Path(uploaded_file.name).suffix or ".mp4"
-    temp_dir = Path(tempfile.mkdtemp(prefix="uploaded_video_"))
-    output_path = temp_dir / f"video{suffix}"
+    output_path = store.new_dir("uploaded_video_") / f"video{suffix}"
     with open(output_path, "wb") as dest:
         dest.write(uploaded_file.getbuffer())
+    store.add([output_path])
+    store.acquire([output_path])
+    if saved_path:
+        store.release([saved_path])
+    st.session_state["uploaded_video_key"] = upload_key
     return output_path
 
 
+def _pin_result_frames(result: Optional[dict]) -> None:
+    """Keep the frames shown in the grid and evidence panel on disk while this result is on screen."""
+    store = artifact_store.get_store()
+    paths = [frame["path"] for frame in (result or {}).get("frames", []) if frame.get("path")]
+    store.acquire(paths)
+    store.release(st.session_state.get("pinned_frame_paths", []))
+    st.session_state["pinned_frame_paths"] = paths
+
+
 def _run_pipeline(video_path: Path, vl_budget: int) -> Optional[dict]:
+    transcript_box = st.empty()
+    asr_updates: "queue.Queue[Dict]" = queue.Queue()
+    transcript_lines: List[str] = []
     try:
-        asr_result = asr.transcribe(str(video_path))
-        scenes = video_utils.detect_scenes(str(video_path))
-        frames_info = video_utils.extract_frames(str(video_path), fps=1)
-        keyframe_selection = video_utils.select_keyframes(scenes, frames_info, k=9, budget=vl_budget)
-        chosen_frames = keyframe_selection.get("chosen", [])
-        chosen_paths = [frame["path"] for frame in chosen_frames]
-        visual_raw = visual_extractor.extract_visual_facts(chosen_paths)
-        visual_result: List[Dict] = []
-        for path, raw in zip(chosen_paths, visual_raw):
-            enriched = dict(raw)
-            enriched["image_path"] = path
-            visual_result.append(enriched)
-
-        facts_raw = fact_extractor.extract_facts(asr_result, visual_result)
-        evidences = evidence.build_evidences(asr_result, keyframe_selection, visual_result)
-        facts_bundle = evidence.attach_facts(facts_raw, evidences)
-
-        writer_payload = dict(facts_bundle.get("facts_strict", {}))
-        writer_payload["missing"] = facts_bundle.get("missing", [])
-        post = post_writer.generate_post(writer_payload)
-        return {
-            "facts": facts_bundle,
-            "post": post,
-            "frames": chosen_frames,
-            "keyframe_selection": keyframe_selection,
-            "evidences": evidences,
-            "visual": visual_result,
-            "asr": asr_result,
-        }
+        # Streamlit widgets must be updated from the script thread, so the pipeline runs in a worker
+        # and streamed ASR segments are drained here while it is busy.
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            future = executor.submit(
+                pipeline.run_pipeline, video_path, vl_budget, k=9, fps=1, on_asr_segment=asr_updates.put
+            )
+            while True:
+                finished = future.done()
+                while not asr_updates.empty():
+                    segment = asr_updates.get_nowait()
+                    transcript_lines.append(f"`{float(segment.get('start', 0.0)):.1f}s` {segment.get('text', '')}")
+                if transcript_lines:
+                    transcript_box.markdown("**实时字幕**\n\n" + "\n\n".join(transcript_lines[-8:]))
+                if finished:
+                    break
+                time.sleep(0.3)
+            result = future.result()
+        transcript_box.empty()
+        LOGGER.info("Pipeline timings: %s", result.get("timings"))
+        return result
     except Exception as exc:  # noqa: BLE001
         LOGGER.exception("Pipeline failed: %s", exc)
         st.error(f"处理失败：{exc}")
@@ -236,125 +289,165 @@ def _handle_rewrite(paragraph_index: int, paragraph_text: str, result: Dict) ->
     st.session_state["pipeline_result"] = result
 
 
-st.set_page_config(page_title="AI-Media2Doc 小红书生成", layout="wide")
-st.title("🎬 视频转小红书图文")
-st.write("上传一段短视频，系统将自动识别语音、理解画面，并生成符合小红书风格的图文内容。")
+def main() -> None:
+    st.set_page_config(page_title="AI-Media2Doc 小红书生成", layout="wide")
+    st.title("🎬 视频转小红书图文")
+    st.write("上传一段短视频，系统将自动识别语音、理解画面，并生成符合小红书风格的图文内容。")
 
-vl_budget = _render_config_panel()
+    if _get_env_value("WHISPER_PRELOAD", "false").strip().lower() in {"1", "true", "yes", "on"}:
+        asr.warm_up_whisper(background=True)
 
-if "pipeline_result" not in st.session_state:
-    st.session_state["pipeline_result"] = None
+    vl_budget = _render_config_panel()
 
-uploaded_video = st.file_uploader("上传视频文件", type=["mp4", "mov", "mkv", "avi"])
+    if "pipeline_result" not in st.session_state:
+        st.session_state["pipeline_result"] = None
+    # Every interaction refreshes this session's pins; pins of abandoned sessions lapse after ARTIFACT_STORE_PIN_TTL_S.
+    _session_files = list(st.session_state.get("pinned_frame_paths", []))
+    if st.session_state.get("uploaded_video_path"):
+        _session_files.append(st.session_state["uploaded_video_path"])
+    artifact_store.get_store().touch(_session_files)
 
-if uploaded_video is not None:
-    video_path = _save_uploaded_file(uploaded_video)
-    st.session_state["uploaded_video_path"] = str(video_path)
-    st.video(str(video_path))
+    uploaded_video = st.file_uploader("上传视频文件", type=["mp4", "mov", "mkv", "avi"])
 
-if st.button("生成图文", type="primary"):
-    video_path_str = st.session_state.get("uploaded_video_path")
-    if not video_path_str:
-        st.warning("请先上传视频文件。")
-    else:
-        with st.spinner("正在分析视频，请稍候..."):
-            result = _run_pipeline(Path(video_path_str), vl_budget)
-            st.session_state["pipeline_result"] = result
-            st.session_state.pop("rewrite_feedback", None)
-        if result:
-            st.success("生成完成！")
+    if uploaded_video is not None:
+        video_path = _save_uploaded_file(uploaded_video)
+        st.session_state["uploaded_video_path"] = str(video_path)
+        st.video(str(video_path))
 
-result = st.session_state.get("pipeline_result")
-if result:
-    feedback = st.session_state.pop("rewrite_feedback", None)
-    if feedback:
-        st.success(feedback)
-
-    post = result.get("post") or {}
-    facts_bundle = result.get("facts") or {}
-    evidences = result.get("evidences") or []
-    frames = result.get("frames") or []
-
-    _ensure_cover_state(frames)
-    cover_path = st.session_state.get("cover_frame")
-    evidence_index = {item.get("id"): item for item in evidences if isinstance(item, dict)}
-
-    cols = st.columns([1.1, 1.4, 1.1])
+    if st.button("生成图文", type="primary"):
+        video_path_str = st.session_state.get("uploaded_video_path")
+        if not video_path_str:
+            st.warning("请先上传视频文件。")
+        else:
+            with st.spinner("正在分析视频，请稍候..."):
+                result = _run_pipeline(Path(video_path_str), vl_budget)
+                _pin_result_frames(result)
+                st.session_state["pipeline_result"] = result
+                st.session_state.pop("rewrite_feedback", None)
+            if result:
+                st.success("生成完成！")
+
+    result = st.session_state.get("pipeline_result")
+    if result:
+        feedback = st.session_state.pop("rewrite_feedback", None)
+        if feedback:
+            st.success(feedback)
+
+        post = result.get("post") or {}
+        facts_bundle = result.get("facts") or {}
+        evidences = result.get("evidences") or []
+        frames = result.get("frames") or []
+
+        _ensure_cover_state(frames)
+        cover_path = st.session_state.get("cover_frame")
+        evidence_index = {item.get("id"): item for item in evidences if isinstance(item, dict)}
+
+        cols = st.columns([1.1, 1.4, 1.1])
+
+        with cols[0]:
+            st.subheader("关键帧九宫格")
+            for row_start in range(0, len(frames), 3):
+                row_cols = st.columns(3)
+                for offset, col in enumerate(row_cols):
+                    idx = row_start + offset
+                    if idx >= len(frames):
+                        continue
+                    frame = frames[idx]
+                    frame_path = frame.get("path")
+                    caption_parts = [frame.get("frame_id", f"frame_{idx:02d}")]
+                    score = frame.get("final_score")
+                    if isinstance(score, (int, float)):
+                        caption_parts.append(f"评分 {float(score):.2f}")
+                    brief = frame.get("vlm", {}).get("brief") if isinstance(frame.get("vlm"), dict) else None
+                    if brief:
+                        caption_parts.append(brief)
+                    with col:
+                        caption = " | ".join(part for part in caption_parts if part)
+                        st.image(frame_path, caption=caption, use_column_width=True)
+                        if frame_path == cover_path:
+                            st.caption("✅ 当前封面")
+                        if st.button("设为封面", key=f"cover_{frame.get('frame_id', idx)}"):
+                            st.session_state["cover_frame"] = frame_path
+                            st.success("已更新封面")
+            if not frames:
+                st.info("暂无关键帧，请重新生成。")
+
+        with cols[1]:
+            st.subheader(post.get("title", "生成结果"))
+            markdown_text = post.get("markdown", "")
+            if markdown_text:
+                st.markdown(markdown_text)
+            paragraphs = _split_paragraphs(markdown_text)
+            for idx, paragraph in enumerate(paragraphs):
+                st.markdown("---")
+                st.markdown(paragraph)
+                if st.button("仅重写本段", key=f"rewrite_{idx}"):
+                    try:
+                        _handle_rewrite(idx, paragraph, result)
+                        st.session_state["rewrite_feedback"] = f"已重写第 {idx + 1} 段"
+                    except Exception as exc:  # noqa: BLE001
+                        LOGGER.exception("Paragraph rewrite failed: %s", exc)
+                        st.session_state["rewrite_feedback"] = f"重写失败：{exc}"
+                    st.experimental_rerun()
+
+        with cols[2]:
+            st.subheader("结构化事实")
+            st.json(facts_bundle, expanded=False)
+            strict = facts_bundle.get("facts_strict", {})
+            weak = facts_bundle.get("facts_weak", {})
+            missing = facts_bundle.get("missing", [])
+            _render_fact_section(st, "严格可信", strict, evidence_index)
+            st.markdown("---")
+            _render_fact_section(st, "弱证据（待确认）", weak, evidence_index)
+            if missing:
+                st.warning("缺失字段：" + "、".join(missing))
+
+        if (result.get("asr_stats") or {}).get("partial"):
+            st.warning("语音转写超时，仅保留已完成的片段，字幕可能不完整。")
+
+        timings = result.get("timings") or {}
+        if timings:
+            with st.expander("⏱️ 阶段耗时", expanded=False):
+                for stage_name, timing in timings.items():
+                    st.write(
+                        f"{stage_name}: {timing.get('duration', 0.0):.2f}s"
+                        f"（{timing.get('start', 0.0):.2f}s → {timing.get('end', 0.0):.2f}s）"
+                    )
+                cache_hits = (result.get("cache") or {}).get("hits")
+                if cache_hits:
+                    st.caption("复用缓存的阶段：" + "、".join(cache_hits))
+                vad_stats = (result.get("asr_stats") or {}).get("vad")
+                if vad_stats:
+                    st.caption(
+                        f"VAD：语音 {vad_stats.get('speech_s', 0.0):.1f}s / 共 {vad_stats.get('total_s', 0.0):.1f}s，"
+                        f"跳过 {vad_stats.get('skipped_s', 0.0):.1f}s"
+                    )
 
-    with cols[0]:
-        st.subheader("关键帧九宫格")
-        for row_start in range(0, len(frames), 3):
-            row_cols = st.columns(3)
-            for offset, col in enumerate(row_cols):
-                idx = row_start + offset
-                if idx >= len(frames):
-                    continue
-                frame = frames[idx]
-                frame_path = frame.get("path")
-                caption_parts = [frame.get("frame_id", f"frame_{idx:02d}")]
-                score = frame.get("final_score")
-                if isinstance(score, (int, float)):
-                    caption_parts.append(f"评分 {float(score):.2f}")
-                brief = frame.get("vlm", {}).get("brief") if isinstance(frame.get("vlm"), dict) else None
-                if brief:
-                    caption_parts.append(brief)
-                with col:
-                    st.image(frame_path, caption=" | ".join(part for part in caption_parts if part), use_column_width=True)
-                    if frame_path == cover_path:
-                        st.caption("✅ 当前封面")
-                    if st.button("设为封面", key=f"cover_{frame.get('frame_id', idx)}"):
-                        st.session_state["cover_frame"] = frame_path
-                        st.success("已更新封面")
-        if not frames:
-            st.info("暂无关键帧，请重新生成。")
+        st.markdown("---")
 
-    with cols[1]:
-        st.subheader(post.get("title", "生成结果"))
-        markdown_text = post.get("markdown", "")
-        if markdown_text:
-            st.markdown(markdown_text)
-        paragraphs = _split_paragraphs(markdown_text)
-        for idx, paragraph in enumerate(paragraphs):
-            st.markdown("---")
-            st.markdown(paragraph)
-            if st.button("仅重写本段", key=f"rewrite_{idx}"):
+        export_col1, export_col2 = st.columns([1, 1])
+        with export_col1:
+            st.markdown("**导出结果**")
+        with export_col2:
+            if st.button("导出"):
                 try:
-                    _handle_rewrite(idx, paragraph, result)
-                    st.session_state["rewrite_feedback"] = f"已重写第 {idx + 1} 段"
+                    temp_dir = Path(tempfile.mkdtemp(prefix="bundle_"))
+                    video_path_str = st.session_state.get("uploaded_video_path", "")
+                    video_name = Path(video_path_str).stem if video_path_str else "export"
+                    post_payload = dict(post)
+                    post_payload.setdefault("video_name", video_name)
+                    post_payload["cover_path"] = cover_path
+                    zip_path = exporter.export_bundle(temp_dir, post_payload, facts_bundle, frames)
+                    with open(zip_path, "rb") as fp:
+                        st.download_button(
+                            "下载导出包", data=fp.read(), file_name=Path(zip_path).name, mime="application/zip"
+                        )
                 except Exception as exc:  # noqa: BLE001
-                    LOGGER.exception("Paragraph rewrite failed: %s", exc)
-                    st.session_state["rewrite_feedback"] = f"重写失败：{exc}"
-                st.experimental_rerun()
+                    LOGGER.exception("Export failed: %s", exc)
+                    st.error(f"导出失败：{exc}")
 
-    with cols[2]:
-        st.subheader("结构化事实")
-        st.json(facts_bundle, expanded=False)
-        strict = facts_bundle.get("facts_strict", {})
-        weak = facts_bundle.get("facts_weak", {})
-        missing = facts_bundle.get("missing", [])
-        _render_fact_section(st, "严格可信", strict, evidence_index)
-        st.markdown("---")
-        _render_fact_section(st, "弱证据（待确认）", weak, evidence_index)
-        if missing:
-            st.warning("缺失字段：" + "、".join(missing))
-
-    st.markdown("---")
-
-    export_col1, export_col2 = st.columns([1, 1])
-    with export_col1:
-        st.markdown("**导出结果**")
-    with export_col2:
-        if st.button("导出"):
-            try:
-                temp_dir = Path(tempfile.mkdtemp(prefix="bundle_"))
-                video_path_str = st.session_state.get("uploaded_video_path", "")
-                video_name = Path(video_path_str).stem if video_path_str else "export"
-                post_payload = dict(post)
-                post_payload.setdefault("video_name", video_name)
-                post_payload["cover_path"] = cover_path
-                zip_path = exporter.export_bundle(temp_dir, post_payload, facts_bundle, frames)
-                with open(zip_path, "rb") as fp:
-                    st.download_button("下载导出包", data=fp.read(), file_name=Path(zip_path).name, mime="application/zip")
-            except Exception as exc:  # noqa: BLE001
-                LOGGER.exception("Export failed: %s", exc)
-                st.error(f"导出失败：{exc}")
+
+# multiprocessing's spawn start method re-runs the main script as ``__mp_main__`` in every worker process, and under
+# Streamlit the main script is this file; only render the page when Streamlit itself runs it.
+if __name__ == "__main__":
+    main()
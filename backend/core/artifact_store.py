@@ -0,0 +1,226 @@
+from __future__ import annotations
+
+import logging
+import os
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Dict, Iterable, Optional
+
+LOGGER = logging.getLogger(__name__)
+
+DEFAULT_MAX_MB = 2048.0
+DEFAULT_MIN_AGE_S = 300.0
+DEFAULT_PIN_TTL_S = 86400.0
+
+
+def _float_from_env(name: str, default: float) -> float:
+    value = os.getenv(name)
+    if value is None:
+        return default
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        LOGGER.warning("Invalid float for %s=%s, using default %.2f", name, value, default)
+        return default
+
+
+@dataclass
+class _Entry:
+    size: int
+    last_used: float
+    refs: int = 0
+
+
+class ArtifactStore:
+    """Disk-bounded home for generated files (frame JPEGs, extracted audio, uploads).
+
+    Files are tracked individually in least-recently-used order. When the total size passes
+    ``max_bytes`` the oldest files are deleted, except files pinned with ``acquire`` (e.g. frames
+    still shown in the UI) and files used within the last ``min_age_s`` seconds, so a run in
+    progress never loses the frames it just wrote. A pin that has not been touched for
+    ``pin_ttl_s`` seconds (a browser session that went away) no longer protects its file.
+    """
+
+    def __init__(
+        self,
+        root: str | os.PathLike[str],
+        max_bytes: int,
+        min_age_s: float = DEFAULT_MIN_AGE_S,
+        pin_ttl_s: float = DEFAULT_PIN_TTL_S,
+    ) -> None:
+        self.root = Path(root).expanduser().resolve()
+        self.root.mkdir(parents=True, exist_ok=True)
+        self.max_bytes = max_bytes
+        self.min_age_s = min_age_s
+        self.pin_ttl_s = pin_ttl_s
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[Path, _Entry]" = OrderedDict()
+        self._used_bytes = 0
+        self._evictions = 0
+        self._evicted_bytes = 0
+        self._adopt_existing()
+
+    def _adopt_existing(self) -> None:
+        # Files left by an earlier process count against the quota, oldest first.
+        found = []
+        for path in self.root.rglob("*"):
+            try:
+                if path.is_file():
+                    stat = path.stat()
+                    found.append((stat.st_mtime, path, stat.st_size))
+            except OSError:
+                continue
+        for mtime, path, size in sorted(found):
+            self._entries[path] = _Entry(size=size, last_used=mtime)
+            self._used_bytes += size
+
+    def new_dir(self, prefix: str) -> Path:
+        """Create a fresh directory inside the store for one run's files."""
+        return Path(tempfile.mkdtemp(prefix=prefix, dir=self.root))
+
+    def add(self, paths: Iterable[str | os.PathLike[str]]) -> None:
+        """Register files written inside the store, mark them most recently used and enforce the quota."""
+        now = time.time()
+        with self._lock:
+            for path in paths:
+                path = Path(path).resolve()
+                try:
+                    size = path.stat().st_size
+                except OSError:
+                    continue
+                entry = self._entries.pop(path, None)
+                if entry is not None:
+                    self._used_bytes -= entry.size
+                    entry.size, entry.last_used = size, now
+                else:
+                    entry = _Entry(size=size, last_used=now)
+                self._entries[path] = entry
+                self._used_bytes += size
+            self._enforce(now)
+
+    def touch(self, paths: Iterable[str | os.PathLike[str]]) -> None:
+        """Mark files as just used; also keeps their pins alive."""
+        now = time.time()
+        with self._lock:
+            for path in paths:
+                path = Path(path).resolve()
+                entry = self._entries.get(path)
+                if entry is not None:
+                    entry.last_used = now
+                    self._entries.move_to_end(path)
+
+    def acquire(self, paths: Iterable[str | os.PathLike[str]]) -> None:
+        """Pin files so eviction skips them until every ``acquire`` is matched by a ``release``."""
+        now = time.time()
+        with self._lock:
+            for path in paths:
+                path = Path(path).resolve()
+                entry = self._entries.get(path)
+                if entry is not None:
+                    entry.refs += 1
+                    entry.last_used = now
+                    self._entries.move_to_end(path)
+
+    def release(self, paths: Iterable[str | os.PathLike[str]]) -> None:
+        with self._lock:
+            for path in paths:
+                entry = self._entries.get(Path(path).resolve())
+                if entry is not None and entry.refs > 0:
+                    entry.refs -= 1
+            self._enforce(time.time())
+
+    def _enforce(self, now: float) -> None:
+        if self._used_bytes <= self.max_bytes:
+            return
+        for path in list(self._entries):
+            if self._used_bytes <= self.max_bytes:
+                break
+            entry = self._entries[path]
+            idle_s = now - entry.last_used
+            if idle_s < self.min_age_s or (entry.refs > 0 and idle_s < self.pin_ttl_s):
+                continue
+            self._remove(path, entry)
+            self._evictions += 1
+            self._evicted_bytes += entry.size
+        if self._used_bytes > self.max_bytes:
+            LOGGER.warning(
+                "Artifact store over quota (%d of %d bytes) with only pinned or recent files left",
+                self._used_bytes,
+                self.max_bytes,
+            )
+
+    def _remove(self, path: Path, entry: _Entry) -> None:
+        del self._entries[path]
+        self._used_bytes -= entry.size
+        try:
+            path.unlink()
+        except FileNotFoundError:
+            pass
+        except OSError as exc:
+            LOGGER.warning("Failed to evict %s: %s", path, exc)
+        parent = path.parent
+        while parent != self.root and self.root in parent.parents:
+            try:
+                parent.rmdir()
+            except OSError:
+                break
+            parent = parent.parent
+
+    def clear(self) -> int:
+        """Delete every unpinned file not used within ``min_age_s``. Returns the number of files removed.
+
+        Recent files are kept for the same reason as in eviction: a run in progress may still be reading them.
+        """
+        removed = 0
+        now = time.time()
+        with self._lock:
+            for path, entry in list(self._entries.items()):
+                if entry.refs == 0 and now - entry.last_used >= self.min_age_s:
+                    self._remove(path, entry)
+                    removed += 1
+        return removed
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            pinned = [entry for entry in self._entries.values() if entry.refs > 0]
+            return {
+                "root": str(self.root),
+                "max_bytes": self.max_bytes,
+                "used_bytes": self._used_bytes,
+                "files": len(self._entries),
+                "pinned_files": len(pinned),
+                "pinned_bytes": sum(entry.size for entry in pinned),
+                "evictions": self._evictions,
+                "evicted_bytes": self._evicted_bytes,
+            }
+
+
+_STORE: Optional[ArtifactStore] = None
+_STORE_LOCK = threading.Lock()
+
+
+def get_store() -> ArtifactStore:
+    """Process-wide store configured by the ``ARTIFACT_STORE_*`` environment variables."""
+    global _STORE
+    with _STORE_LOCK:
+        if _STORE is None:
+            root = os.getenv("ARTIFACT_STORE_DIR") or Path(tempfile.gettempdir()) / "ai-media2doc-artifacts"
+            max_mb = _float_from_env("ARTIFACT_STORE_MAX_MB", DEFAULT_MAX_MB)
+            _STORE = ArtifactStore(
+                root,
+                max_bytes=int(max_mb * 1024 * 1024),
+                min_age_s=_float_from_env("ARTIFACT_STORE_MIN_AGE_S", DEFAULT_MIN_AGE_S),
+                pin_ttl_s=_float_from_env("ARTIFACT_STORE_PIN_TTL_S", DEFAULT_PIN_TTL_S),
+            )
+        return _STORE
+
+
+def reset_store() -> None:
+    """Forget the process-wide store so the next ``get_store`` re-reads the environment."""
+    global _STORE
+    with _STORE_LOCK:
+        _STORE = None
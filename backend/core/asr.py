@@ -2,21 +2,26 @@ from __future__ import annotations
 
 import base64
 import contextlib
-import importlib
-import importlib.util
+import hashlib
+import io
 import json
 import logging
 import math
 import os
+import queue
 import re
-import tempfile
+import threading
+import wave
 from concurrent.futures import ThreadPoolExecutor, TimeoutError as FuturesTimeout
-from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+from pathlib import Path
+from typing import Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
 
-import ffmpeg
+import numpy as np
 from shared import iflow_api
 
-from .video_utils import extract_audio
+from . import asr_backends, model_registry, vad
+from .deadline import Deadline, DeadlineExceeded
+from .video_utils import AUDIO_CODECS, AUDIO_SAMPLE_RATE, decode_audio, encode_audio
 
 LOGGER = logging.getLogger(__name__)
 
@@ -24,6 +29,10 @@ IFLOW_MODEL_ASR = os.getenv("IFLOW_MODEL_ASR", "qwen3-max")
 
 DEFAULT_TIMEOUT_S = 180.0
 DEFAULT_SEGMENT_S = 45.0
+DEFAULT_IFLOW_AUDIO_FORMAT = "mp3"
+
+_SEGMENT_CACHE_DIR = Path(iflow_api.get_runtime_config()["cache_dir"]) / "asr_segments"
+_SEGMENT_CACHE_VERSION = 1
 
 
 def _bool_from_env(name: str, default: bool) -> bool:
@@ -44,62 +53,112 @@ def _float_from_env(name: str, default: float) -> float:
         return default
 
 
-def _load_whisper() -> Optional[object]:
-    spec = importlib.util.find_spec("whisper")
-    if spec is None:
-        return None
-    return importlib.import_module("whisper")
-
-
-def _get_audio_duration(audio_path: str) -> float:
-    probe = ffmpeg.probe(audio_path)
-    duration = probe.get("format", {}).get("duration")
-    return float(duration) if duration else 0.0
-
-
 def _clamp_segment_length(segment_length: float) -> float:
     if math.isfinite(segment_length) and segment_length > 0:
         return max(30.0, min(segment_length, 60.0))
     return 45.0
 
 
-def _split_audio_segments(audio_path: str, segment_length: float) -> Iterable[Tuple[float, float, str, bool]]:
-    duration = _get_audio_duration(audio_path)
-    if duration <= 0:
-        yield (0.0, 0.0, audio_path, False)
-        return
+AudioWindow = Tuple[float, float, np.ndarray]
+
 
-    segment_length = _clamp_segment_length(segment_length)
-    if duration <= segment_length:
-        yield (0.0, duration, audio_path, False)
+def _split_audio_segments(samples: np.ndarray, segment_length: float) -> Iterable[AudioWindow]:
+    """Yield ``(start, end, samples)`` windows; the samples are views into the decoded buffer."""
+    total = len(samples)
+    if total == 0:
         return
 
-    start = 0.0
-    while start < duration:
-        end = min(duration, start + segment_length)
-        with tempfile.NamedTemporaryFile(suffix=".wav", delete=False) as temp_file:
-            temp_path = temp_file.name
-        try:
-            (
-                ffmpeg
-                .input(audio_path, ss=start, t=end - start)
-                .output(
-                    temp_path,
-                    format="wav",
-                    acodec="pcm_s16le",
-                    ac=1,
-                    ar=16000,
-                )
-                .overwrite_output()
-                .run(quiet=True)
-            )
-        except ffmpeg.Error as exc:  # noqa: BLE001
-            LOGGER.error("Failed to split audio segment %.2f-%.2f: %s", start, end, exc)
-            with contextlib.suppress(FileNotFoundError):
-                os.remove(temp_path)
-            raise
-        yield (start, end, temp_path, True)
-        start = end
+    window = int(_clamp_segment_length(segment_length) * AUDIO_SAMPLE_RATE)
+    offset = 0
+    while offset < total:
+        stop = min(total, offset + window)
+        yield (offset / AUDIO_SAMPLE_RATE, stop / AUDIO_SAMPLE_RATE, samples[offset:stop])
+        offset = stop
+
+
+def _plan_audio_windows(
+    samples: np.ndarray,
+    segment_length: float,
+    stats: Optional[Dict] = None,
+) -> List[AudioWindow]:
+    """Pick the windows to transcribe: speech-only VAD windows by default, fixed slices otherwise."""
+    if not _bool_from_env("ASR_VAD_ENABLE", True):
+        return list(_split_audio_segments(samples, segment_length))
+
+    plan = vad.plan_speech_windows(samples, AUDIO_SAMPLE_RATE, _clamp_segment_length(segment_length))
+    LOGGER.info(
+        "VAD kept %.1fs of speech in %d windows, skipped %.1fs of %.1fs",
+        plan.speech_s,
+        len(plan.windows),
+        plan.skipped_s,
+        plan.total_s,
+    )
+    if stats is not None:
+        stats["vad"] = plan.as_dict()
+    return [(start / AUDIO_SAMPLE_RATE, end / AUDIO_SAMPLE_RATE, samples[start:end]) for start, end in plan.windows]
+
+
+def _segment_cache_key(audio: np.ndarray | bytes, backend: str, model_name: str, params: Dict) -> str:
+    """Hash of the audio actually transcribed (decoded PCM, or the encoded upload) plus its settings."""
+    digest = hashlib.sha256()
+    digest.update(audio if isinstance(audio, bytes) else np.ascontiguousarray(audio, dtype=np.float32))
+    settings = {
+        "backend": backend,
+        "model": model_name,
+        "sample_rate": AUDIO_SAMPLE_RATE,
+        "params": params,
+        "version": _SEGMENT_CACHE_VERSION,
+    }
+    digest.update(json.dumps(settings, sort_keys=True).encode("utf-8"))
+    return digest.hexdigest()
+
+
+def _segment_cache_enabled() -> bool:
+    return _bool_from_env("ASR_CACHE_ENABLE", True)
+
+
+def _load_segment_cache(cache_key: str) -> Optional[List[Dict]]:
+    path = _SEGMENT_CACHE_DIR / f"{cache_key}.json"
+    if not path.exists():
+        return None
+    try:
+        with path.open("r", encoding="utf-8") as cache_file:
+            return json.load(cache_file)["segments"]
+    except Exception as exc:  # noqa: BLE001
+        LOGGER.warning("Failed to read ASR segment cache %s: %s", path, exc)
+        return None
+
+
+def _store_segment_cache(cache_key: str, segments: List[Dict]) -> None:
+    """Store segments with timestamps relative to the window start, so moved windows still hit."""
+    path = _SEGMENT_CACHE_DIR / f"{cache_key}.json"
+    temp_path = path.with_suffix(f".{threading.get_ident()}.tmp")
+    try:
+        _SEGMENT_CACHE_DIR.mkdir(parents=True, exist_ok=True)
+        with temp_path.open("w", encoding="utf-8") as cache_file:
+            json.dump({"segments": segments}, cache_file, ensure_ascii=False)
+        os.replace(temp_path, path)
+    except Exception as exc:  # noqa: BLE001
+        LOGGER.warning("Failed to write ASR segment cache %s: %s", path, exc)
+        with contextlib.suppress(FileNotFoundError):
+            temp_path.unlink()
+
+
+def _shift_segments(segments: Sequence[Dict], offset: float) -> List[Dict]:
+    return [
+        {"start": float(item["start"]) + offset, "end": float(item["end"]) + offset, "text": item["text"]}
+        for item in segments
+    ]
+
+
+def clear_segment_cache() -> int:
+    """Remove cached per-segment transcriptions. Returns the number of files removed."""
+    removed = 0
+    for path in _SEGMENT_CACHE_DIR.glob("*.json"):
+        with contextlib.suppress(FileNotFoundError):
+            path.unlink()
+            removed += 1
+    return removed
 
 
 def _post_process_text(text: str) -> str:
@@ -123,10 +182,39 @@ def _post_process_text(text: str) -> str:
     return text
 
 
-def _call_iflow_for_segment(audio_path: str, timeout: float) -> str:
-    with open(audio_path, "rb") as audio_file:
-        audio_bytes = audio_file.read()
-    audio_b64 = base64.b64encode(audio_bytes).decode("utf-8")
+def _encode_wav_bytes(samples: np.ndarray) -> bytes:
+    pcm = (np.clip(samples, -1.0, 1.0) * 32767.0).astype("<i2")
+    buffer = io.BytesIO()
+    with wave.open(buffer, "wb") as wav_file:
+        wav_file.setnchannels(1)
+        wav_file.setsampwidth(2)
+        wav_file.setframerate(AUDIO_SAMPLE_RATE)
+        wav_file.writeframes(pcm.tobytes())
+    return buffer.getvalue()
+
+
+def _iflow_audio_format() -> str:
+    audio_format = os.getenv("ASR_IFLOW_AUDIO_FORMAT", DEFAULT_IFLOW_AUDIO_FORMAT).strip().lower()
+    if audio_format != "wav" and audio_format not in AUDIO_CODECS:
+        LOGGER.warning("Unsupported ASR_IFLOW_AUDIO_FORMAT=%s, using %s", audio_format, DEFAULT_IFLOW_AUDIO_FORMAT)
+        return DEFAULT_IFLOW_AUDIO_FORMAT
+    return audio_format
+
+
+def _encode_iflow_audio(samples: np.ndarray) -> Tuple[bytes, str]:
+    """Compress a window for upload; falls back to WAV if the encoder is unavailable."""
+    audio_format = _iflow_audio_format()
+    if audio_format != "wav":
+        try:
+            bitrate = os.getenv("ASR_IFLOW_AUDIO_BITRATE") or None
+            return encode_audio(samples, audio_format, bitrate=bitrate), audio_format
+        except Exception as exc:  # noqa: BLE001
+            LOGGER.warning("Failed to encode audio as %s, sending WAV: %s", audio_format, exc)
+    return _encode_wav_bytes(samples), "wav"
+
+
+def _call_iflow_for_segment(payload: bytes, audio_format: str, timeout: float) -> str:
+    audio_b64 = base64.b64encode(payload).decode("utf-8")
 
     messages = [
         {
@@ -138,7 +226,7 @@ def _call_iflow_for_segment(audio_path: str, timeout: float) -> str:
             "content": [
                 {
                     "type": "input_audio",
-                    "audio_format": "wav",
+                    "audio_format": audio_format,
                     "audio": audio_b64,
                 }
             ],
@@ -161,167 +249,284 @@ def _call_iflow_for_segment(audio_path: str, timeout: float) -> str:
     return _post_process_text(text)
 
 
-def _select_whisper_model(whisper_module: object) -> Optional[object]:
-    with contextlib.suppress(ImportError):
-        import torch
+def _select_local_backend() -> Optional[asr_backends.AsrBackend]:
+    """Local ASR engine chosen by ``WHISPER_BACKEND`` (``openai`` or ``faster``), or None if disabled."""
+    if not _bool_from_env("WHISPER_ENABLE", True):
+        return None
+    return asr_backends.get_backend(os.getenv("WHISPER_BACKEND", "openai"))
 
-        if torch.cuda.is_available():
-            return _try_load_whisper_models(whisper_module, ("small", "tiny"))
-    return _try_load_whisper_models(whisper_module, ("tiny", "small"))
 
+def warm_up_whisper(background: bool = True) -> bool:
+    """Load the local ASR model before the first request. Returns False when no backend is available."""
 
-def _try_load_whisper_models(whisper_module: object, preferred: Sequence[str]) -> Optional[object]:
-    for model_size in preferred:
-        try:
-            LOGGER.info("Loading Whisper model: %s", model_size)
-            return whisper_module.load_model(model_size)
-        except Exception as exc:  # noqa: BLE001
-            LOGGER.warning("Failed to load Whisper model %s: %s", model_size, exc)
-    return None
+    backend = _select_local_backend()
+    if backend is None:
+        return False
+    backend.warm_up(background=background)
+    return True
 
 
-def _transcribe_with_whisper(
-    audio_path: str,
-    whisper_module: object,
-    segment_length: float,
-) -> List[Dict]:
-    model = _select_whisper_model(whisper_module)
-    if model is None:
-        raise RuntimeError("Unable to load Whisper model.")
+def whisper_ready() -> bool:
+    return bool(whisper_stats().get("ready"))
 
-    segments: List[Dict] = []
-    last_end = 0.0
-    for start, end, segment_path, cleanup in _split_audio_segments(audio_path, segment_length):
-        try:
-            result = model.transcribe(
-                segment_path,
-                task="transcribe",
-                word_timestamps=False,
-                language="zh",
-                temperature=0,
-                verbose=False,
+
+def whisper_stats() -> Dict:
+    """Load time, estimated memory and hit count of the shared local ASR model (empty if never loaded).
+
+    Reads the model registry only; the backend is chosen with ``find_spec`` checks, so calling this on
+    every page render never imports whisper or torch.
+    """
+    backend = _select_local_backend()
+    if backend is None:
+        return {}
+    return model_registry.REGISTRY.stats().get(backend.registry_key, {})
+
+
+WindowResult = Tuple[int, List[Dict]]
+
+
+class _SegmentAssembler:
+    """Applies the monotonic timestamp rules incrementally as window results arrive."""
+
+    def __init__(self) -> None:
+        self.last_end = 0.0
+
+    def add(self, raw_segments: Sequence[Dict], window_end: Optional[float] = None) -> List[Dict]:
+        if not raw_segments:
+            # iFlow windows without speech still advance the timeline.
+            if window_end is not None:
+                self.last_end = float(window_end)
+            return []
+
+        segments: List[Dict] = []
+        for raw in raw_segments:
+            seg_start = max(float(raw["start"]), self.last_end)
+            seg_end = max(float(raw["end"]), seg_start)
+            segments.append(
+                {
+                    "start": float(seg_start),
+                    "end": float(seg_end),
+                    "text": raw["text"],
+                }
             )
-        finally:
-            if cleanup:
-                with contextlib.suppress(FileNotFoundError):
-                    os.remove(segment_path)
-
-        chunk_segments = result.get("segments") if isinstance(result, dict) else None
-        if chunk_segments:
-            for chunk in chunk_segments:
-                raw_text = str(chunk.get("text", ""))
-                cleaned = _post_process_text(raw_text)
-                if not cleaned:
-                    continue
-                chunk_start = start + float(chunk.get("start", 0.0))
-                chunk_end = start + float(chunk.get("end", 0.0))
-                chunk_start = max(chunk_start, last_end)
-                if chunk_end < chunk_start:
-                    chunk_end = chunk_start
-                segments.append(
-                    {
-                        "start": float(chunk_start),
-                        "end": float(chunk_end),
-                        "text": cleaned,
-                    }
-                )
-                last_end = float(chunk_end)
-        else:
-            raw_text = str(result.get("text", "")) if isinstance(result, dict) else str(result)
-            cleaned = _post_process_text(raw_text)
-            if cleaned:
-                seg_start = max(start, last_end)
-                seg_end = max(seg_start, end)
-                segments.append(
-                    {
-                        "start": float(seg_start),
-                        "end": float(seg_end),
-                        "text": cleaned,
-                    }
-                )
-                last_end = float(seg_end)
+            self.last_end = float(seg_end)
+        return segments
 
-    # Ensure timestamps are monotonically increasing.
-    for idx in range(1, len(segments)):
-        prev_end = segments[idx - 1]["end"]
-        if segments[idx]["start"] < prev_end:
-            segments[idx]["start"] = prev_end
-        if segments[idx]["end"] < segments[idx]["start"]:
-            segments[idx]["end"] = segments[idx]["start"]
 
+def _clean_segments(raw_segments: Sequence[Dict]) -> List[Dict]:
+    segments: List[Dict] = []
+    for raw in raw_segments:
+        cleaned = _post_process_text(str(raw.get("text", "")))
+        if cleaned:
+            segments.append({"start": float(raw["start"]), "end": float(raw["end"]), "text": cleaned})
     return segments
 
 
-def _transcribe_with_iflow(
-    audio_path: str,
-    segment_length: float,
+_LOCAL_PARAMS = {"task": "transcribe", "language": "zh", "temperature": 0, "word_timestamps": False}
+
+
+def _iter_local(
+    windows: Sequence[AudioWindow],
+    backend: asr_backends.AsrBackend,
+    deadline: Optional[Deadline] = None,
+) -> Iterator[WindowResult]:
+    """Run the local backend on cache misses only, yielding ``(window_index, segments)`` in order.
+
+    With the segment cache on, the model is loaded first (once per process) so that cache keys name
+    the model size that actually loaded; only cache misses are transcribed. The backend checks
+    ``deadline`` between windows and stops early, so fewer windows than requested may be yielded: the
+    output stops at the first window that was neither cached nor transcribed.
+    """
+    use_cache = _segment_cache_enabled()
+    hits: Dict[int, List[Dict]] = {}
+    if use_cache:
+        model_name = backend.cache_name()
+        for idx, (start, _, samples) in enumerate(windows):
+            cached = _load_segment_cache(_segment_cache_key(samples, "local", model_name, _LOCAL_PARAMS))
+            if cached is not None:
+                hits[idx] = _shift_segments(cached, start)
+
+    misses = [idx for idx in range(len(windows)) if idx not in hits]
+    next_idx = 0
+    if misses:
+        for local_idx, raw_segments in backend.transcribe_windows([windows[idx] for idx in misses], deadline):
+            idx = misses[local_idx]
+            while next_idx < idx:
+                yield next_idx, hits[next_idx]
+                next_idx += 1
+            segments = _clean_segments(raw_segments)
+            if use_cache:
+                start, _, samples = windows[idx]
+                _store_segment_cache(
+                    _segment_cache_key(samples, "local", model_name, _LOCAL_PARAMS),
+                    _shift_segments(segments, -start),
+                )
+            yield idx, segments
+            next_idx = idx + 1
+    # Once the backend stops at the deadline, only the cache hits up to the first unfinished miss can
+    # follow; the missing indices tell the caller the local run is partial.
+    while next_idx in hits:
+        yield next_idx, hits[next_idx]
+        next_idx += 1
+    if next_idx < len(windows):
+        LOGGER.info("Local ASR stopped early; %d of %d windows finished", next_idx, len(windows))
+
+
+def _transcribe_iflow_window(samples: np.ndarray, timeout: float, deadline: Optional[Deadline] = None) -> Optional[str]:
+    """Transcribe one window, or return None without calling iFlow once ``deadline`` has passed."""
+    if deadline is not None:
+        if deadline.expired():
+            return None
+        timeout = max(1.0, deadline.clamp(timeout))
+    payload, audio_format = _encode_iflow_audio(samples)
+    LOGGER.debug("iFlow ASR payload: %d bytes (%s)", len(payload), audio_format)
+    if not _segment_cache_enabled():
+        return _call_iflow_for_segment(payload, audio_format, timeout)
+    cache_key = _segment_cache_key(payload, "iflow", IFLOW_MODEL_ASR, {"temperature": 0.2, "format": audio_format})
+    cached = _load_segment_cache(cache_key)
+    if cached is not None:
+        return cached[0]["text"] if cached else ""
+    text = _call_iflow_for_segment(payload, audio_format, timeout)
+    duration = len(samples) / float(AUDIO_SAMPLE_RATE)
+    _store_segment_cache(cache_key, [{"start": 0.0, "end": duration, "text": text}] if text else [])
+    return text
+
+
+def _iter_iflow(
+    windows: Sequence[AudioWindow],
     timeout: float,
-) -> List[Dict]:
-    segments: List[Dict] = []
-    last_end = 0.0
-    for start, end, segment_path, cleanup in _split_audio_segments(audio_path, segment_length):
-        try:
-            text = _call_iflow_for_segment(segment_path, timeout)
-        finally:
-            if cleanup:
-                with contextlib.suppress(FileNotFoundError):
-                    os.remove(segment_path)
-
-        if not text:
-            last_end = end
-            continue
-        seg_start = max(start, last_end)
-        seg_end = max(seg_start, end)
-        segments.append(
-            {
-                "start": float(seg_start),
-                "end": float(seg_end),
-                "text": text,
-            }
-        )
-        last_end = float(seg_end)
+    deadline: Optional[Deadline] = None,
+) -> Iterator[WindowResult]:
+    """Send all windows concurrently and yield them in timestamp order as soon as each prefix is complete.
+
+    Once ``deadline`` passes, queued windows are dropped and only windows that already finished are
+    yielded, so the caller can tell a partial run by the missing indices.
+    """
+    if not windows:
+        return
+    deadline = deadline or Deadline()
+
+    # Segments are independent requests; iflow_api bounds the actual HTTP concurrency.
+    workers = min(iflow_api.MAX_WORKERS, len(windows))
+    executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="asr-iflow")
+    futures = [executor.submit(_transcribe_iflow_window, window, timeout, deadline) for _, _, window in windows]
+    try:
+        for idx, ((start, end, _), future) in enumerate(zip(windows, futures)):
+            try:
+                text = future.result(timeout=deadline.remaining())
+            except FuturesTimeout:
+                continue
+            if text is None:
+                continue
+            yield idx, ([{"start": start, "end": end, "text": text}] if text else [])
+    finally:
+        # In-flight requests are bounded by the clamped HTTP timeout; do not block on them here.
+        executor.shutdown(wait=False, cancel_futures=True)
 
-    return segments
 
+_STREAM_DONE = object()
+
+
+def _iter_in_thread(results: Iterator[WindowResult], deadline: Deadline) -> Iterator[WindowResult]:
+    """Drive ``results`` on a worker thread so the caller can stop waiting once ``deadline`` passes.
+
+    ``results`` must honour the same deadline so the worker exits after its current window.
+    """
+    items: "queue.Queue[object]" = queue.Queue()
+
+    def produce() -> None:
+        try:
+            for item in results:
+                items.put(item)
+        except BaseException as exc:  # noqa: BLE001
+            items.put(exc)
+        else:
+            items.put(_STREAM_DONE)
 
-def transcribe(video_path: str) -> List[Dict]:
-    audio_path = extract_audio(video_path)
+    threading.Thread(target=produce, name="asr-stream", daemon=True).start()
+    while True:
+        if deadline.expired():
+            raise DeadlineExceeded()
+        try:
+            item = items.get(timeout=deadline.remaining())
+        except queue.Empty:
+            raise DeadlineExceeded() from None
+        if item is _STREAM_DONE:
+            return
+        if isinstance(item, BaseException):
+            raise item
+        yield item  # type: ignore[misc]
+
+
+def transcribe_iter(video_path: str, stats: Optional[Dict] = None) -> Iterator[Dict]:
+    """Yield ``{start, end, text}`` segments in timestamp order as each audio window finishes.
+
+    Whisper is tried first under an ``ASR_TIMEOUT_S`` deadline; when it fails or runs out of time
+    part-way it stops after its current window and only the unfinished windows are sent to iFlow,
+    under a fresh deadline. If iFlow also runs out of time the segments finished so far are kept
+    and ``stats["partial"]`` is set to True instead of raising. ``stats`` also receives the VAD summary.
+    """
+    stats = {} if stats is None else stats
+    stats["partial"] = False
+    audio = decode_audio(video_path)
+    if len(audio) == 0:
+        LOGGER.info("No audio stream decoded from %s", video_path)
+        return
 
-    whisper_enabled = _bool_from_env("WHISPER_ENABLE", True)
     timeout_s = _float_from_env("ASR_TIMEOUT_S", DEFAULT_TIMEOUT_S)
     segment_length = _clamp_segment_length(_float_from_env("ASR_SEGMENT_S", DEFAULT_SEGMENT_S))
+    windows = _plan_audio_windows(audio, segment_length, stats)
+    if not windows:
+        LOGGER.info("No speech detected in %s", video_path)
+        return
 
-    whisper_module = _load_whisper() if whisper_enabled else None
+    backend = _select_local_backend()
+    assembler = _SegmentAssembler()
+    finished: set[int] = set()
+    emitted = 0
 
-    if whisper_enabled and whisper_module is not None:
-        LOGGER.info("Using Whisper for transcription.")
+    if backend is not None:
+        LOGGER.info("Using Whisper (%s backend) for transcription.", backend.name)
+        local_deadline = Deadline(timeout_s)
         try:
-            with ThreadPoolExecutor(max_workers=1) as executor:
-                future = executor.submit(
-                    _transcribe_with_whisper,
-                    audio_path,
-                    whisper_module,
-                    segment_length,
-                )
-                result = future.result(timeout=timeout_s)
-            if result:
-                return result
-        except FuturesTimeout:
+            for idx, raw_segments in _iter_in_thread(_iter_local(windows, backend, local_deadline), local_deadline):
+                finished.add(idx)
+                for segment in assembler.add(raw_segments):
+                    emitted += 1
+                    yield segment
+            if emitted and len(finished) == len(windows):
+                return
+        except DeadlineExceeded:
             LOGGER.warning("Whisper transcription timed out after %.1fs", timeout_s)
         except Exception as exc:  # noqa: BLE001
             LOGGER.warning("Whisper transcription failed: %s", exc)
+        finally:
+            local_deadline.cancel()  # the worker stops before its next window
+        if not emitted:
+            finished.clear()
 
-    LOGGER.info("Falling back to Qwen3-Max transcription via iFlow API.")
+    pending = [window for idx, window in enumerate(windows) if idx not in finished]
+    if not pending:
+        return
+    LOGGER.info("Falling back to Qwen3-Max transcription via iFlow API for %d windows.", len(pending))
+    iflow_deadline = Deadline(timeout_s)
+    completed = 0
     try:
-        with ThreadPoolExecutor(max_workers=1) as executor:
-            future = executor.submit(
-                _transcribe_with_iflow,
-                audio_path,
-                segment_length,
-                timeout_s,
-            )
-            result = future.result(timeout=timeout_s)
-        return result
-    except FuturesTimeout:
-        LOGGER.error("iFlow transcription timed out after %.1fs", timeout_s)
-        raise
+        for idx, raw_segments in _iter_iflow(pending, timeout_s, iflow_deadline):
+            completed += 1
+            yield from assembler.add(raw_segments, window_end=pending[idx][1])
+    finally:
+        iflow_deadline.cancel()
+    if completed < len(pending):
+        LOGGER.error(
+            "iFlow transcription hit its %.1fs deadline; returning %d of %d windows",
+            timeout_s,
+            completed,
+            len(pending),
+        )
+        stats["partial"] = True
+
+
+def transcribe(video_path: str, stats: Optional[Dict] = None) -> List[Dict]:
+    """Transcribe a video. When ``stats`` is given it receives the VAD summary (speech vs skipped seconds)."""
+    return list(transcribe_iter(video_path, stats=stats))
@@ -0,0 +1,284 @@
+from __future__ import annotations
+
+import bisect
+import contextlib
+import importlib
+import importlib.util
+import logging
+import os
+from typing import Any, Dict, Iterator, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from . import model_registry
+from .deadline import Deadline
+from .video_utils import AUDIO_SAMPLE_RATE
+
+LOGGER = logging.getLogger(__name__)
+
+AudioWindow = Tuple[float, float, np.ndarray]
+WindowResult = Tuple[int, List[Dict]]
+
+
+def _int_from_env(name: str, default: int) -> int:
+    value = os.getenv(name)
+    if value is None:
+        return default
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        LOGGER.warning("Invalid integer for %s=%s, using default %d", name, value, default)
+        return default
+
+
+def _installed(module_name: str) -> bool:
+    """Check for a module without importing it (importing whisper pulls in torch)."""
+    return importlib.util.find_spec(module_name) is not None
+
+
+def _import_optional(module_name: str) -> Optional[Any]:
+    if not _installed(module_name):
+        return None
+    return importlib.import_module(module_name)
+
+
+def _preferred_sizes() -> Sequence[str]:
+    with contextlib.suppress(ImportError):
+        import torch
+
+        if torch.cuda.is_available():
+            return ("small", "tiny")
+    return ("tiny", "small")
+
+
+class AsrBackend:
+    """A local speech-to-text engine that transcribes pre-cut audio windows.
+
+    ``transcribe_windows`` yields ``(window_index, segments)`` in window order. Segment timestamps
+    are absolute and the text is raw model output; post-processing and caching happen in ``asr``.
+    Implementations stop before the next forward pass once ``deadline`` has expired.
+    """
+
+    name = "base"
+    registry_key = ""
+
+    def is_available(self) -> bool:
+        raise NotImplementedError
+
+    def _load(self) -> Tuple[str, Any]:
+        raise NotImplementedError
+
+    def transcribe_windows(
+        self, windows: Sequence[AudioWindow], deadline: Optional[Deadline] = None
+    ) -> Iterator[WindowResult]:
+        raise NotImplementedError
+
+    def preferred_sizes(self) -> Sequence[str]:
+        return _preferred_sizes()
+
+    def load(self) -> model_registry.LoadedModel:
+        return model_registry.REGISTRY.get(self.registry_key, self._load)
+
+    def warm_up(self, background: bool = True) -> None:
+        model_registry.REGISTRY.warm_up(self.registry_key, self._load, background=background)
+
+    def stats(self) -> Dict[str, Any]:
+        return model_registry.REGISTRY.stats().get(self.registry_key, {})
+
+    def cache_name(self) -> str:
+        """Identity used in segment cache keys: the backend and the model size that actually loaded.
+
+        Loads the model if needed; the preferred size may fail to load and fall back to the next one,
+        so naming the cache before loading would key lookups and stores differently.
+        """
+        return f"{self.name}:{self.load().name}"
+
+
+class OpenAIWhisperBackend(AsrBackend):
+    """Reference ``openai-whisper`` backend (fp32 on CPU), one window per forward pass."""
+
+    name = "openai"
+    registry_key = "whisper"
+
+    def __init__(self, whisper_module: Optional[Any] = None) -> None:
+        self._module = whisper_module
+
+    def _whisper(self) -> Optional[Any]:
+        if self._module is None:
+            self._module = _import_optional("whisper")
+        return self._module
+
+    def is_available(self) -> bool:
+        return self._module is not None or _installed("whisper")
+
+    def _load(self) -> Tuple[str, Any]:
+        whisper_module = self._whisper()
+        if whisper_module is None:
+            raise RuntimeError("openai-whisper is not installed.")
+        for model_size in self.preferred_sizes():
+            try:
+                LOGGER.info("Loading Whisper model: %s", model_size)
+                return model_size, whisper_module.load_model(model_size)
+            except Exception as exc:  # noqa: BLE001
+                LOGGER.warning("Failed to load Whisper model %s: %s", model_size, exc)
+        raise RuntimeError("Unable to load Whisper model.")
+
+    def transcribe_windows(
+        self, windows: Sequence[AudioWindow], deadline: Optional[Deadline] = None
+    ) -> Iterator[WindowResult]:
+        loaded = self.load()
+        for idx, (start, end, window) in enumerate(windows):
+            if deadline is not None and deadline.expired():
+                return
+            with loaded.lock:
+                result = loaded.model.transcribe(
+                    window,
+                    task="transcribe",
+                    word_timestamps=False,
+                    language="zh",
+                    temperature=0,
+                    verbose=False,
+                )
+            yield idx, _whisper_result_segments(result, start, end)
+
+
+def _whisper_result_segments(result: Any, start: float, end: float) -> List[Dict]:
+    chunk_segments = result.get("segments") if isinstance(result, dict) else None
+    if chunk_segments:
+        return [
+            {
+                "start": start + float(chunk.get("start", 0.0)),
+                "end": start + float(chunk.get("end", 0.0)),
+                "text": str(chunk.get("text", "")),
+            }
+            for chunk in chunk_segments
+        ]
+    raw_text = str(result.get("text", "")) if isinstance(result, dict) else str(result)
+    return [{"start": start, "end": end, "text": raw_text}]
+
+
+class FasterWhisperBackend(AsrBackend):
+    """int8 CTranslate2 backend (``faster-whisper``) that decodes several windows per forward pass.
+
+    Windows are packed into clips of at most 30 s (Whisper's receptive field) and sent through
+    ``BatchedInferencePipeline`` ``WHISPER_BATCH_SIZE`` clips at a time, using every CPU core.
+    """
+
+    name = "faster"
+    registry_key = "faster-whisper"
+    CLIP_S = 30.0
+
+    def __init__(self, faster_whisper_module: Optional[Any] = None) -> None:
+        self._module = faster_whisper_module
+        self.compute_type = os.getenv("WHISPER_COMPUTE_TYPE", "int8")
+        self.cpu_threads = max(1, _int_from_env("WHISPER_CPU_THREADS", os.cpu_count() or 1))
+        self.batch_size = max(1, _int_from_env("WHISPER_BATCH_SIZE", 8))
+
+    def _faster_whisper(self) -> Optional[Any]:
+        if self._module is None:
+            self._module = _import_optional("faster_whisper")
+        return self._module
+
+    def is_available(self) -> bool:
+        return self._module is not None or _installed("faster_whisper")
+
+    def cache_name(self) -> str:
+        return f"{super().cache_name()}:{self.compute_type}"
+
+    def _load(self) -> Tuple[str, Any]:
+        module = self._faster_whisper()
+        if module is None:
+            raise RuntimeError("faster-whisper is not installed.")
+        for model_size in self.preferred_sizes():
+            try:
+                LOGGER.info("Loading faster-whisper model: %s (%s)", model_size, self.compute_type)
+                model = module.WhisperModel(
+                    model_size,
+                    device="cpu",
+                    compute_type=self.compute_type,
+                    cpu_threads=self.cpu_threads,
+                )
+                return model_size, model
+            except Exception as exc:  # noqa: BLE001
+                LOGGER.warning("Failed to load faster-whisper model %s: %s", model_size, exc)
+        raise RuntimeError("Unable to load faster-whisper model.")
+
+    def _pack(
+        self, windows: Sequence[AudioWindow]
+    ) -> Tuple[np.ndarray, List[Dict[str, float]], List[Tuple[float, int]]]:
+        """Concatenate windows and describe them as <=30 s clips on the packed timeline."""
+        clips: List[Dict[str, float]] = []
+        clip_owner: List[Tuple[float, int]] = []
+        offset = 0.0
+        for local_idx, (_, _, samples) in enumerate(windows):
+            duration = len(samples) / float(AUDIO_SAMPLE_RATE)
+            clip_start = 0.0
+            while clip_start < duration:
+                clip_end = min(duration, clip_start + self.CLIP_S)
+                clips.append({"start": offset + clip_start, "end": offset + clip_end})
+                clip_owner.append((offset, local_idx))
+                clip_start = clip_end
+            offset += duration
+        packed = np.concatenate([np.asarray(samples, dtype=np.float32) for _, _, samples in windows])
+        return packed, clips, clip_owner
+
+    def transcribe_windows(
+        self, windows: Sequence[AudioWindow], deadline: Optional[Deadline] = None
+    ) -> Iterator[WindowResult]:
+        loaded = self.load()
+        pipeline = self._faster_whisper().BatchedInferencePipeline(model=loaded.model)
+        group_size = self.batch_size
+        for group_start in range(0, len(windows), group_size):
+            if deadline is not None and deadline.expired():
+                return
+            group = windows[group_start : group_start + group_size]
+            packed, clips, clip_owner = self._pack(group)
+            clip_starts = [clip["start"] for clip in clips]
+            per_window: List[List[Dict]] = [[] for _ in group]
+            with loaded.lock:
+                segments, _ = pipeline.transcribe(
+                    packed,
+                    language="zh",
+                    task="transcribe",
+                    temperature=0.0,
+                    clip_timestamps=clips,
+                    batch_size=self.batch_size,
+                    word_timestamps=False,
+                )
+                for segment in segments:
+                    clip_idx = max(0, bisect.bisect_right(clip_starts, float(segment.start) + 1e-6) - 1)
+                    window_offset, local_idx = clip_owner[clip_idx]
+                    window_start = group[local_idx][0]
+                    per_window[local_idx].append(
+                        {
+                            "start": window_start + float(segment.start) - window_offset,
+                            "end": window_start + float(segment.end) - window_offset,
+                            "text": str(segment.text),
+                        }
+                    )
+            for local_idx, raw_segments in enumerate(per_window):
+                yield group_start + local_idx, raw_segments
+
+
+BACKENDS = {
+    OpenAIWhisperBackend.name: OpenAIWhisperBackend,
+    FasterWhisperBackend.name: FasterWhisperBackend,
+}
+
+
+def get_backend(name: str) -> Optional[AsrBackend]:
+    """Return an available backend by name, falling back to ``openai`` when the requested one is missing."""
+
+    backend_cls = BACKENDS.get(name.strip().lower())
+    if backend_cls is None:
+        LOGGER.warning("Unknown WHISPER_BACKEND=%s, using openai", name)
+        backend_cls = OpenAIWhisperBackend
+    backend = backend_cls()
+    if backend.is_available():
+        return backend
+    if backend_cls is not OpenAIWhisperBackend:
+        LOGGER.warning("ASR backend %s is not installed, using openai", backend.name)
+        fallback = OpenAIWhisperBackend()
+        if fallback.is_available():
+            return fallback
+    return None
@@ -0,0 +1,45 @@
+from __future__ import annotations
+
+import threading
+import time
+from typing import Optional
+
+
+class DeadlineExceeded(TimeoutError):
+    """Raised when waiting for work that did not finish before its deadline."""
+
+
+class Deadline:
+    """A cancellable point in monotonic time, checked by workers between units of work.
+
+    Long-running loops call ``expired()`` before starting the next segment and stop on their own,
+    so no thread is left computing results nobody will read.
+    """
+
+    def __init__(self, timeout_s: Optional[float] = None) -> None:
+        self.timeout_s = timeout_s
+        self._expires_at = None if timeout_s is None else time.monotonic() + max(0.0, timeout_s)
+        self._cancelled = threading.Event()
+
+    def remaining(self) -> Optional[float]:
+        """Seconds left, 0 once expired or cancelled, None when there is no time limit."""
+        if self._cancelled.is_set():
+            return 0.0
+        if self._expires_at is None:
+            return None
+        return max(0.0, self._expires_at - time.monotonic())
+
+    def expired(self) -> bool:
+        return self.remaining() == 0.0
+
+    def cancel(self) -> None:
+        self._cancelled.set()
+
+    def check(self) -> None:
+        if self.expired():
+            raise DeadlineExceeded(f"deadline of {self.timeout_s}s exceeded")
+
+    def clamp(self, timeout_s: float) -> float:
+        """Shorten a per-call timeout so the call cannot outlive the deadline."""
+        remaining = self.remaining()
+        return timeout_s if remaining is None else max(0.0, min(timeout_s, remaining))
@@ -0,0 +1,289 @@
+from __future__ import annotations
+
+import logging
+import multiprocessing
+import os
+from concurrent.futures import Future, ProcessPoolExecutor
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import cv2
+import numpy as np
+
+LOGGER = logging.getLogger(__name__)
+
+DEFAULT_MAX_EDGE = 480
+DEFAULT_BATCH_SIZE = 64
+EMPTY_METRICS = {"clarity": 0.0, "entropy": 0.0, "edge_density": 0.0, "text_score": 0.0}
+# Text detection: frames whose edge mask covers this share of the image are texture (foliage, gravel) and
+# score 0; glyph candidates need background bands at most this dense; the pairwise line grouping is capped.
+TEXT_TEXTURE_DENSITY = 0.3
+TEXT_MAX_BAND_DENSITY = 0.08
+TEXT_MAX_CANDIDATES = 1500
+
+
+def _int_from_env(name: str, default: int) -> int:
+    value = os.getenv(name)
+    if value is None:
+        return default
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        LOGGER.warning("Invalid integer for %s=%s, using default %d", name, value, default)
+        return default
+
+
+def _bool_from_env(name: str, default: bool) -> bool:
+    value = os.getenv(name)
+    if value is None:
+        return default
+    return value.strip().lower() in {"1", "true", "yes", "on"}
+
+
+def to_gray(image: np.ndarray, max_edge: Optional[int] = None) -> np.ndarray:
+    """Grayscale copy of a BGR frame whose longest edge is at most ``FRAME_METRICS_MAX_EDGE`` pixels."""
+    max_edge = _int_from_env("FRAME_METRICS_MAX_EDGE", DEFAULT_MAX_EDGE) if max_edge is None else max_edge
+    gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY) if image.ndim == 3 else image
+    height, width = gray.shape[:2]
+    longest = max(height, width)
+    if max_edge > 0 and longest > max_edge:
+        scale = max_edge / float(longest)
+        size = (max(1, round(width * scale)), max(1, round(height * scale)))
+        gray = cv2.resize(gray, size, interpolation=cv2.INTER_AREA)
+    return np.ascontiguousarray(gray, dtype=np.uint8)
+
+
+def dhash(gray: np.ndarray) -> int:
+    """64-bit difference hash: each bit says whether a pixel of a 9x8 thumbnail is brighter than its left neighbour."""
+    thumb = cv2.resize(gray, (9, 8), interpolation=cv2.INTER_AREA).astype(np.int16)
+    bits = (thumb[:, 1:] > thumb[:, :-1]).ravel()
+    return int(np.packbits(bits).view(">u8")[0])
+
+
+def hamming(left: int, right: int) -> int:
+    return (left ^ right).bit_count()
+
+
+class HashIndex:
+    """Look up the earliest added 64-bit hash within ``max_distance`` bits of a query.
+
+    The hash is split into ``max_distance + 1`` bands; by the pigeonhole principle two hashes that differ
+    in at most ``max_distance`` bits agree exactly on at least one band, so a query is only compared with
+    entries sharing a band value instead of with every entry.
+    """
+
+    def __init__(self, max_distance: int) -> None:
+        self.max_distance = max_distance
+        band_count = min(max(max_distance + 1, 1), 64)
+        widths = [64 // band_count + (1 if idx < 64 % band_count else 0) for idx in range(band_count)]
+        self._bands: List[Tuple[int, int]] = []
+        shift = 0
+        for width in widths:
+            self._bands.append((shift, (1 << width) - 1))
+            shift += width
+        self._buckets: List[Dict[int, List[int]]] = [{} for _ in self._bands]
+        self._keys: List[object] = []
+        self._hashes: List[int] = []
+
+    def __len__(self) -> int:
+        return len(self._keys)
+
+    def add(self, key: object, value: int) -> None:
+        position = len(self._keys)
+        self._keys.append(key)
+        self._hashes.append(value)
+        for (shift, mask), bucket in zip(self._bands, self._buckets):
+            bucket.setdefault((value >> shift) & mask, []).append(position)
+
+    def find(self, value: int) -> Optional[object]:
+        """Key of the first added entry within ``max_distance`` bits of ``value``, or None."""
+        if self.max_distance < 0 or not self._keys:
+            return None
+        if self.max_distance >= 64:
+            return self._keys[0]
+        best: Optional[int] = None
+        for (shift, mask), bucket in zip(self._bands, self._buckets):
+            # Bucket entries are in insertion order, so the first match is the earliest in this band.
+            for position in bucket.get((value >> shift) & mask, ()):
+                if best is not None and position >= best:
+                    break
+                if (value ^ self._hashes[position]).bit_count() <= self.max_distance:
+                    best = position
+                    break
+        return None if best is None else self._keys[best]
+
+
+def text_likelihood(gray: np.ndarray) -> float:
+    """Score in [0, 1] for how likely a frame shows readable text (signage, price boards, subtitles).
+
+    Pure OpenCV stroke heuristics, no model: the thresholded morphological gradient outlines glyphs,
+    and its connected components with glyph-like size and fill, standing on a clean band of background
+    (unlike foliage or gravel), are character candidates. Candidates with a neighbour of similar height
+    on the same baseline, or wide enough to be a run of touching glyphs, form text lines; the score grows
+    with the share of the frame those lines cover (10% coverage saturates it).
+    """
+    height, width = gray.shape[:2]
+    if height < 16 or width < 16:
+        return 0.0
+    gradient = cv2.morphologyEx(gray, cv2.MORPH_GRADIENT, cv2.getStructuringElement(cv2.MORPH_ELLIPSE, (3, 3)))
+    otsu, _ = cv2.threshold(gradient, 0, 255, cv2.THRESH_BINARY | cv2.THRESH_OTSU)
+    _, strokes = cv2.threshold(gradient, max(otsu, 40.0), 255, cv2.THRESH_BINARY)
+    strokes = strokes // 255
+    if np.count_nonzero(strokes) >= TEXT_TEXTURE_DENSITY * strokes.size:
+        return 0.0
+
+    _, _, stats, _ = cv2.connectedComponentsWithStats(strokes, connectivity=8)
+    x, y, box_w, box_h, area = stats[1:].T
+    fill = area / np.maximum(box_w * box_h, 1)
+    aspect = box_w / np.maximum(box_h, 1)
+    glyphs = (
+        (box_h >= 6) & (box_h <= 0.2 * height) & (aspect >= 0.1) & (aspect <= 25.0) & (fill >= 0.15) & (fill <= 0.9)
+    )
+    if np.count_nonzero(glyphs) < 3:
+        return 0.0
+    x, y, box_w, box_h = x[glyphs], y[glyphs], box_w[glyphs], box_h[glyphs]
+
+    # Stroke density in the bands of half a glyph height above and below each candidate.
+    integral = cv2.integral(strokes)
+    pad = (box_h + 1) // 2
+    top, bottom, right = np.maximum(y - pad, 0), np.minimum(y + box_h + pad, height), x + box_w
+
+    def box_sum(row0: np.ndarray, row1: np.ndarray) -> np.ndarray:
+        return integral[row1, right] - integral[row0, right] - integral[row1, x] + integral[row0, x]
+
+    bands = box_sum(top, bottom) - box_sum(y, y + box_h)
+    clean = bands <= TEXT_MAX_BAND_DENSITY * np.maximum((bottom - top - box_h) * box_w, 1)
+    if np.count_nonzero(clean) < 3:
+        return 0.0
+    x, y, box_w, box_h = x[clean], y[clean], box_w[clean], box_h[clean]
+    if len(x) > TEXT_MAX_CANDIDATES:
+        keep = np.argsort(-(box_w * box_h), kind="stable")[:TEXT_MAX_CANDIDATES]
+        x, y, box_w, box_h = x[keep], y[keep], box_w[keep], box_h[keep]
+
+    center_y = y + box_h / 2.0
+    low = np.minimum(box_h[:, None], box_h[None, :])
+    high = np.maximum(box_h[:, None], box_h[None, :])
+    gap = np.maximum(x[:, None], x[None, :]) - np.minimum(x[:, None] + box_w[:, None], x[None, :] + box_w[None, :])
+    aligned = (
+        (np.abs(center_y[:, None] - center_y[None, :]) <= 0.4 * low)
+        & (high <= 1.8 * low)
+        & (gap <= 1.2 * high)
+        & (gap > -0.5 * low)
+    )
+    np.fill_diagonal(aligned, False)
+    in_line = aligned.any(axis=1) | (box_w >= 3 * box_h)
+    if np.count_nonzero(in_line) < 3:
+        return 0.0
+
+    covered = np.zeros((height, width), dtype=bool)
+    for left, row, box_width, box_height in zip(x[in_line], y[in_line], box_w[in_line], box_h[in_line]):
+        covered[row : row + box_height, left : left + box_width] = True
+    return float(min(1.0, 10.0 * np.count_nonzero(covered) / covered.size))
+
+
+def _histograms(grays: Sequence[np.ndarray]) -> np.ndarray:
+    count = len(grays)
+    if len({gray.shape for gray in grays}) == 1:
+        # One bincount over the whole stack: frame i's pixel values are shifted into bins [256 i, 256 i + 256).
+        stack = np.stack(grays).reshape(count, -1).astype(np.int64)
+        stack += (np.arange(count, dtype=np.int64) * 256)[:, None]
+        return np.bincount(stack.ravel(), minlength=256 * count).reshape(count, 256)
+    return np.stack([np.bincount(gray.ravel(), minlength=256) for gray in grays])
+
+
+def batch_metrics(grays: Sequence[np.ndarray]) -> List[Dict[str, float]]:
+    """Clarity (Laplacian variance), histogram entropy (nats), Canny edge density and text likelihood for a batch.
+
+    ``text_score`` (see ``text_likelihood``) is 0 when ``FRAME_TEXT_SCORE_ENABLE`` is off.
+    """
+    if not len(grays):
+        return []
+    with_text = _bool_from_env("FRAME_TEXT_SCORE_ENABLE", True)
+    hist = _histograms(grays).astype(np.float64)
+    probs = hist / np.maximum(hist.sum(axis=1, keepdims=True), 1.0)
+    entropy = -np.sum(probs * np.log(probs + 1e-12), axis=1)
+
+    results: List[Dict[str, float]] = []
+    for gray, frame_entropy in zip(grays, entropy):
+        results.append(
+            {
+                "clarity": float(cv2.Laplacian(gray, cv2.CV_64F).var()),
+                "entropy": float(frame_entropy),
+                "edge_density": float(np.count_nonzero(cv2.Canny(gray, 100, 200)) / gray.size),
+                "text_score": text_likelihood(gray) if with_text else 0.0,
+            }
+        )
+    return results
+
+
+class MetricsBatcher:
+    """Collect downscaled grayscale frames and score them in batches as they arrive.
+
+    With ``workers`` > 1 (default ``FRAME_METRICS_WORKERS``, 0 = in-process) full batches are
+    scored in a process pool while the caller keeps decoding.
+    """
+
+    def __init__(self, workers: Optional[int] = None, batch_size: int = DEFAULT_BATCH_SIZE) -> None:
+        workers = _int_from_env("FRAME_METRICS_WORKERS", 0) if workers is None else workers
+        self._executor = (
+            ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"))
+            if workers > 1
+            else None
+        )
+        self._batch_size = max(1, batch_size)
+        self._batch: List[Optional[np.ndarray]] = []
+        self._parts: List[Future | List[Dict[str, float]]] = []
+        self.hashes: List[Optional[int]] = []
+
+    def add(self, gray: Optional[np.ndarray]) -> None:
+        """Queue one frame; ``None`` stands for an unreadable frame and scores all zeros."""
+        self.hashes.append(dhash(gray) if gray is not None else None)
+        self._batch.append(gray)
+        if len(self._batch) >= self._batch_size:
+            self._flush()
+
+    def _flush(self) -> None:
+        batch, self._batch = self._batch, []
+        if not batch:
+            return
+        if self._executor is not None:
+            self._parts.append(self._executor.submit(_score_batch, batch))
+        else:
+            self._parts.append(_score_batch(batch))
+
+    def results(self) -> List[Dict[str, float]]:
+        """Metrics for every added frame, in insertion order."""
+        self._flush()
+        try:
+            metrics: List[Dict[str, float]] = []
+            for part in self._parts:
+                metrics.extend(part.result() if isinstance(part, Future) else part)
+            return metrics
+        finally:
+            self.close()
+
+    def close(self) -> None:
+        self._parts = []
+        if self._executor is not None:
+            self._executor.shutdown(cancel_futures=True)
+            self._executor = None
+
+
+def _score_batch(batch: Sequence[Optional[np.ndarray]]) -> List[Dict[str, float]]:
+    valid = [gray for gray in batch if gray is not None]
+    scored = iter(batch_metrics(valid))
+    return [dict(EMPTY_METRICS) if gray is None else next(scored) for gray in batch]
+
+
+def score_paths(
+    image_paths: Sequence[str], workers: Optional[int] = None
+) -> Tuple[List[Dict[str, float]], List[Optional[int]]]:
+    """Read, downscale and score image files; returns metrics and dHashes (unreadable: zeros / None)."""
+    batcher = MetricsBatcher(workers=workers)
+    for image_path in image_paths:
+        image = cv2.imread(image_path)
+        batcher.add(to_gray(image) if image is not None else None)
+    return batcher.results(), batcher.hashes
+
+
+def metrics_for_paths(image_paths: Sequence[str], workers: Optional[int] = None) -> List[Dict[str, float]]:
+    return score_paths(image_paths, workers=workers)[0]
@@ -0,0 +1,156 @@
+from __future__ import annotations
+
+import logging
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, Optional, Tuple
+
+LOGGER = logging.getLogger(__name__)
+
+Loader = Callable[[], Tuple[str, Any]]
+
+
+@dataclass
+class LoadedModel:
+    """A model shared across requests. Hold ``lock`` while running inference on it."""
+
+    name: str
+    model: Any
+    load_time_s: float
+    memory_bytes: Optional[int]
+    loaded_at: float
+    lock: threading.Lock = field(default_factory=threading.Lock, repr=False)
+    hits: int = 0
+
+
+def _estimate_model_bytes(model: Any) -> Optional[int]:
+    """Sum parameter and buffer sizes for torch-style models; ``None`` when unknown."""
+
+    total = 0
+    found = False
+    for attr in ("parameters", "buffers"):
+        tensors = getattr(model, attr, None)
+        if not callable(tensors):
+            continue
+        try:
+            for tensor in tensors():
+                total += int(tensor.numel()) * int(tensor.element_size())
+                found = True
+        except Exception:  # noqa: BLE001
+            return None
+    return total if found else None
+
+
+class ModelRegistry:
+    """Process-wide cache that loads each model key once and hands the same instance to every caller."""
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._models: Dict[str, LoadedModel] = {}
+        self._load_locks: Dict[str, threading.Lock] = {}
+        self._loading: set[str] = set()
+        self._errors: Dict[str, str] = {}
+
+    def _load_lock(self, key: str) -> threading.Lock:
+        with self._lock:
+            return self._load_locks.setdefault(key, threading.Lock())
+
+    def get(self, key: str, loader: Loader) -> LoadedModel:
+        """Return the model for ``key``, loading it with ``loader`` on first use.
+
+        Concurrent callers for the same key wait for a single load. A failed load is not cached,
+        so the next call retries.
+        """
+
+        with self._lock:
+            loaded = self._models.get(key)
+            if loaded is not None:
+                loaded.hits += 1
+                return loaded
+
+        with self._load_lock(key):
+            with self._lock:
+                loaded = self._models.get(key)
+                if loaded is not None:
+                    loaded.hits += 1
+                    return loaded
+                self._loading.add(key)
+            try:
+                started = time.monotonic()
+                name, model = loader()
+                load_time = time.monotonic() - started
+            except Exception as exc:  # noqa: BLE001
+                with self._lock:
+                    self._loading.discard(key)
+                    self._errors[key] = str(exc)
+                raise
+
+            loaded = LoadedModel(
+                name=name,
+                model=model,
+                load_time_s=round(load_time, 3),
+                memory_bytes=_estimate_model_bytes(model),
+                loaded_at=time.time(),
+                hits=1,
+            )
+            with self._lock:
+                self._models[key] = loaded
+                self._loading.discard(key)
+                self._errors.pop(key, None)
+            LOGGER.info("Loaded model %s (%s) in %.2fs", key, name, load_time)
+            return loaded
+
+    def warm_up(self, key: str, loader: Loader, background: bool = True) -> Optional[threading.Thread]:
+        """Load ``key`` ahead of the first request. Returns the loader thread when ``background``."""
+
+        with self._lock:
+            if key in self._models or key in self._loading:
+                return None
+
+        def run() -> None:
+            try:
+                self.get(key, loader)
+            except Exception as exc:  # noqa: BLE001
+                LOGGER.warning("Model warm-up failed for %s: %s", key, exc)
+
+        if not background:
+            run()
+            return None
+        thread = threading.Thread(target=run, name=f"warmup-{key}", daemon=True)
+        thread.start()
+        return thread
+
+    def is_ready(self, key: str) -> bool:
+        with self._lock:
+            return key in self._models
+
+    def stats(self) -> Dict[str, Dict[str, Any]]:
+        with self._lock:
+            report: Dict[str, Dict[str, Any]] = {}
+            for key, loaded in self._models.items():
+                report[key] = {
+                    "ready": True,
+                    "name": loaded.name,
+                    "load_time_s": loaded.load_time_s,
+                    "memory_bytes": loaded.memory_bytes,
+                    "hits": loaded.hits,
+                    "loaded_at": loaded.loaded_at,
+                }
+            for key in self._loading:
+                report.setdefault(key, {"ready": False, "loading": True})
+            for key, error in self._errors.items():
+                report.setdefault(key, {"ready": False, "loading": False, "error": error})
+            return report
+
+    def clear(self, key: Optional[str] = None) -> None:
+        with self._lock:
+            if key is None:
+                self._models.clear()
+                self._errors.clear()
+            else:
+                self._models.pop(key, None)
+                self._errors.pop(key, None)
+
+
+REGISTRY = ModelRegistry()
@@ -0,0 +1,370 @@
+from __future__ import annotations
+
+import logging
+import os
+import time
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+from . import asr, evidence, fact_extractor, post_writer, stage_cache, video_utils, visual_extractor
+from .artifact_store import get_store
+
+LOGGER = logging.getLogger(__name__)
+
+PIPELINE_MAX_WORKERS = max(1, int(os.getenv("PIPELINE_MAX_WORKERS", "4")))
+
+# Environment variables that change each cached stage's output and therefore belong in its cache key.
+ASR_CACHE_ENV = (
+    "WHISPER_ENABLE",
+    "WHISPER_BACKEND",
+    "WHISPER_COMPUTE_TYPE",
+    "IFLOW_MODEL_ASR",
+    "ASR_SEGMENT_S",
+    "ASR_VAD_ENABLE",
+    "ASR_IFLOW_AUDIO_FORMAT",
+    "ASR_IFLOW_AUDIO_BITRATE",
+)
+VIDEO_CACHE_ENV = (
+    "FRAME_SAMPLING_MODE",
+    "FRAME_GRID_S",
+    "FRAME_SPARSE_MAX",
+    "SCENE_DETECT_MODE",
+    "SCENE_FAST_MIN_S",
+    "FRAME_METRICS_MAX_EDGE",
+    "FRAME_TEXT_SCORE_ENABLE",
+)
+VISION_IMAGE_ENV = ("VISION_IMAGE_MAX_EDGE", "VISION_IMAGE_QUALITY", "VISION_IMAGE_FORMAT", "VISION_IMAGE_GRAYSCALE")
+KEYFRAME_CACHE_ENV = (
+    "KEYFRAME_DEDUP_DISTANCE",
+    "KEYFRAME_TEXT_WEIGHT",
+    "LIGHT_RANK_CHUNK_SIZE",
+    "LIGHT_RANK_FULL_SCHEMA",
+    *VISION_IMAGE_ENV,
+)
+VISUAL_CACHE_ENV = ("LIGHT_RANK_FULL_SCHEMA", "VISUAL_BATCH_SIZE", *VISION_IMAGE_ENV)
+
+
+class PipelineError(RuntimeError):
+    """Raised when a stage fails; keeps the failing stage name for reporting."""
+
+    def __init__(self, stage: str, exc: BaseException):
+        super().__init__(f"Stage '{stage}' failed: {exc}")
+        self.stage = stage
+
+
+@dataclass
+class Stage:
+    """A pipeline step. ``func`` receives the outputs of ``deps`` as keyword arguments."""
+
+    name: str
+    func: Callable[..., Any]
+    deps: Sequence[str] = field(default_factory=tuple)
+
+
+def _topological_order(stages: Sequence[Stage]) -> List[str]:
+    by_name: Dict[str, Stage] = {}
+    for stage in stages:
+        if stage.name in by_name:
+            raise ValueError(f"Duplicate stage name: {stage.name}")
+        by_name[stage.name] = stage
+
+    for stage in stages:
+        for dep in stage.deps:
+            if dep not in by_name:
+                raise ValueError(f"Stage '{stage.name}' depends on unknown stage '{dep}'")
+
+    order: List[str] = []
+    visiting: set[str] = set()
+    done: set[str] = set()
+
+    def visit(name: str) -> None:
+        if name in done:
+            return
+        if name in visiting:
+            raise ValueError(f"Stage graph has a cycle at '{name}'")
+        visiting.add(name)
+        for dep in by_name[name].deps:
+            visit(dep)
+        visiting.discard(name)
+        done.add(name)
+        order.append(name)
+
+    for stage in stages:
+        visit(stage.name)
+    return order
+
+
+def run_stages(
+    stages: Sequence[Stage],
+    max_workers: Optional[int] = None,
+) -> Tuple[Dict[str, Any], Dict[str, Dict[str, float]]]:
+    """Run a stage graph, starting every stage as soon as its dependencies are done.
+
+    Returns ``(results, timings)``; timings hold ``start``/``end`` offsets relative to the
+    run start and the stage ``duration`` in seconds.
+    """
+
+    order = _topological_order(stages)
+    by_name = {stage.name: stage for stage in stages}
+    results: Dict[str, Any] = {}
+    timings: Dict[str, Dict[str, float]] = {}
+    pending = list(order)
+    running: Dict[Future, str] = {}
+    run_start = time.monotonic()
+
+    def execute(stage: Stage, kwargs: Dict[str, Any]) -> Tuple[Any, float, float]:
+        started = time.monotonic()
+        value = stage.func(**kwargs)
+        return value, started, time.monotonic()
+
+    workers = max_workers or PIPELINE_MAX_WORKERS
+    executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="pipeline")
+    try:
+        while pending or running:
+            for name in list(pending):
+                stage = by_name[name]
+                if all(dep in results for dep in stage.deps):
+                    pending.remove(name)
+                    kwargs = {dep: results[dep] for dep in stage.deps}
+                    running[executor.submit(execute, stage, kwargs)] = name
+
+            done, _ = wait(list(running), return_when=FIRST_COMPLETED)
+            for future in done:
+                name = running.pop(future)
+                try:
+                    value, started, finished = future.result()
+                except Exception as exc:  # noqa: BLE001
+                    raise PipelineError(name, exc) from exc
+                results[name] = value
+                timings[name] = {
+                    "start": round(started - run_start, 3),
+                    "end": round(finished - run_start, 3),
+                    "duration": round(finished - started, 3),
+                }
+                LOGGER.info("Stage %s finished in %.2fs", name, finished - started)
+    except BaseException:
+        # Report the failure now instead of waiting for sibling stages still running (a long ASR, say);
+        # they finish in the background and stages not started yet are dropped.
+        executor.shutdown(wait=False, cancel_futures=True)
+        raise
+    executor.shutdown()
+
+    elapsed = round(time.monotonic() - run_start, 3)
+    timings["total"] = {"start": 0.0, "end": elapsed, "duration": elapsed}
+    return results, timings
+
+
+def _video_fingerprint(path: str) -> Optional[str]:
+    try:
+        return video_utils.video_fingerprint(path)
+    except Exception as exc:  # noqa: BLE001
+        LOGGER.warning("Stage cache disabled for %s: cannot fingerprint video (%s)", path, exc)
+        return None
+
+
+def _selection_degraded(selection: Dict) -> bool:
+    """True when light_rank failed for any frame of the selection (failed chunk or missing answer)."""
+    for frame in [*selection.get("chosen", []), *selection.get("rejected", [])]:
+        if (frame.get("debug") or {}).get("vlm_error") or (frame.get("vlm") or {}).get("vlm_error"):
+            return True
+    return False
+
+
+def _restore_frame_images(selection: Dict, video_path: str) -> bool:
+    """Re-decode chosen frames whose JPEGs were evicted from the artifact store; False if that is impossible."""
+    chosen = selection.get("chosen", [])
+    missing = [frame for frame in chosen if not frame.get("path") or not Path(frame["path"]).exists()]
+    if missing:
+        if any(frame.get("frame_index") is None for frame in missing):
+            return False
+        for frame in missing:
+            frame["path"] = None
+        video_utils.write_frame_images(video_path, missing)
+        if any(not frame.get("path") for frame in missing):
+            return False
+    get_store().touch(frame["path"] for frame in chosen)
+    return True
+
+
+def build_stages(
+    video_path: str | Path,
+    vl_budget: int,
+    k: int = 9,
+    fps: int = 1,
+    stats: Optional[Dict[str, Any]] = None,
+    on_asr_segment: Optional[Callable[[Dict], None]] = None,
+    cache: Optional[stage_cache.StageCache] = None,
+    cache_report: Optional[Dict[str, Any]] = None,
+) -> List[Stage]:
+    """Describe the video-to-post pipeline; ASR and the video decode branch have no shared inputs.
+
+    ``stats`` collects the ASR report (VAD speech/skipped seconds) when provided, and
+    ``on_asr_segment`` is called with each transcript segment as soon as it is ready.
+
+    The ASR, video, keyframes and visual stages are cached by video fingerprint plus their parameters
+    (``cache``, default ``stage_cache.get_stage_cache()``); ``cache_report`` receives the fingerprint
+    and the names of the stages served from the cache.
+    """
+
+    path = str(video_path)
+    asr_stats = stats if stats is not None else {}
+    cache = stage_cache.get_stage_cache() if cache is None else cache
+    report = cache_report if cache_report is not None else {}
+    fingerprint = _video_fingerprint(path) if cache.enabled else None
+    report.update({"fingerprint": fingerprint, "hits": []})
+
+    def stage_key(stage: str, params: Dict[str, Any], upstream: Sequence[Optional[str]] = ()) -> Optional[str]:
+        if fingerprint is None or any(key is None for key in upstream):
+            return None
+        return cache.key(stage, fingerprint, params, upstream)
+
+    def load(stage: str, key: Optional[str]) -> Optional[Any]:
+        value = cache.load(stage, key) if key else None
+        if value is not None:
+            report["hits"].append(stage)
+            LOGGER.info("Stage %s served from cache", stage)
+        return value
+
+    asr_key = stage_key("asr", stage_cache.env_params(ASR_CACHE_ENV))
+    video_key = stage_key("video", {"fps": fps, **stage_cache.env_params(VIDEO_CACHE_ENV)})
+    keyframes_params = {
+        "k": k,
+        "budget": vl_budget,
+        "vision_model": visual_extractor.IFLOW_MODEL_VISION,
+        **stage_cache.env_params(KEYFRAME_CACHE_ENV),
+    }
+    keyframes_key = stage_key("keyframes", keyframes_params, (video_key,))
+
+    def run_asr() -> List[Dict]:
+        cached = load("asr", asr_key)
+        if cached is not None:
+            asr_stats.update(cached["stats"])
+            for segment in cached["segments"]:
+                if on_asr_segment is not None:
+                    on_asr_segment(segment)
+            return cached["segments"]
+
+        segments: List[Dict] = []
+        for segment in asr.transcribe_iter(path, stats=asr_stats):
+            segments.append(segment)
+            if on_asr_segment is not None:
+                on_asr_segment(segment)
+        # A transcript cut short by the ASR deadline is not worth replaying.
+        if asr_key and not asr_stats.get("partial"):
+            cache.store("asr", asr_key, {"segments": segments, "stats": asr_stats})
+        return segments
+
+    def run_video() -> Dict:
+        # One decode pass yields scene cuts, fps-sampled frames and their metrics.
+        cached = load("video", video_key)
+        if cached is not None:
+            return cached
+        result = video_utils.analyze_video(path, fps=fps)
+        if video_key:
+            cache.store("video", video_key, result)
+        return result
+
+    def run_keyframes(video: Dict) -> Dict:
+        cached = load("keyframes", keyframes_key)
+        if cached is not None and _restore_frame_images(cached, path):
+            return cached
+        if cached is not None:
+            report["hits"].remove("keyframes")
+        selection = video_utils.select_keyframes(
+            video["scenes"], video["frames"], k=k, budget=vl_budget, video_path=path
+        )
+        # A selection ranked without (some of) the light_rank answers is not worth replaying either.
+        if keyframes_key and not _selection_degraded(selection):
+            cache.store("keyframes", keyframes_key, selection)
+        return selection
+
+    def run_visual(keyframes: Dict) -> List[Dict]:
+        chosen = keyframes.get("chosen", [])
+        chosen_paths = [frame["path"] for frame in chosen]
+        visual_params = {
+            "vision_model": visual_extractor.IFLOW_MODEL_VISION,
+            "frames": [frame.get("frame_id") for frame in chosen],
+            **stage_cache.env_params(VISUAL_CACHE_ENV),
+        }
+        # Keyed by the chosen frames rather than the selection settings: a new budget that picks the
+        # same frames reuses their visual facts.
+        visual_key = stage_key("visual", visual_params, (video_key,))
+        visual_raw = load("visual", visual_key)
+        if visual_raw is None:
+            # With LIGHT_RANK_FULL_SCHEMA the ranking pass already described the chosen frames.
+            prefetched = [(frame.get("vlm") or {}).get("visual") for frame in chosen]
+            visual_raw = visual_extractor.extract_visual_facts(chosen_paths, prefetched=prefetched, keep_failed=True)
+            # Failed frames stay as None so the facts keep lining up with their images; only complete
+            # results are cached.
+            if visual_key and len(visual_raw) == len(chosen) and all(raw is not None for raw in visual_raw):
+                cache.store("visual", visual_key, visual_raw)
+        visual_result: List[Dict] = []
+        for frame_path, raw in zip(chosen_paths, visual_raw):
+            if raw is None:
+                continue
+            enriched = dict(raw)
+            enriched["image_path"] = frame_path
+            visual_result.append(enriched)
+        return visual_result
+
+    def run_post(facts_bundle: Dict) -> Dict:
+        writer_payload = dict(facts_bundle.get("facts_strict", {}))
+        writer_payload["missing"] = facts_bundle.get("missing", [])
+        return post_writer.generate_post(writer_payload)
+
+    return [
+        Stage("asr", run_asr),
+        Stage("video", run_video),
+        Stage("keyframes", run_keyframes, ("video",)),
+        Stage("visual", run_visual, ("keyframes",)),
+        Stage("facts", lambda asr, visual: fact_extractor.extract_facts(asr, visual), ("asr", "visual")),
+        Stage(
+            "evidences",
+            lambda asr, keyframes, visual: evidence.build_evidences(asr, keyframes, visual),
+            ("asr", "keyframes", "visual"),
+        ),
+        Stage(
+            "facts_bundle",
+            lambda facts, evidences: evidence.attach_facts(facts, evidences),
+            ("facts", "evidences"),
+        ),
+        Stage("post", run_post, ("facts_bundle",)),
+    ]
+
+
+def run_pipeline(
+    video_path: str | Path,
+    vl_budget: int,
+    k: int = 9,
+    fps: int = 1,
+    on_asr_segment: Optional[Callable[[Dict], None]] = None,
+) -> Dict[str, Any]:
+    """视频 → 图文全流程，独立分支并发执行，并返回各阶段耗时"""
+
+    asr_stats: Dict[str, Any] = {}
+    cache_report: Dict[str, Any] = {}
+    stages = build_stages(
+        video_path,
+        vl_budget,
+        k=k,
+        fps=fps,
+        stats=asr_stats,
+        on_asr_segment=on_asr_segment,
+        cache_report=cache_report,
+    )
+    results, timings = run_stages(stages)
+    keyframe_selection = results["keyframes"]
+    return {
+        "facts": results["facts_bundle"],
+        "post": results["post"],
+        "frames": keyframe_selection.get("chosen", []),
+        "keyframe_selection": keyframe_selection,
+        "evidences": results["evidences"],
+        "visual": results["visual"],
+        "asr": results["asr"],
+        "asr_stats": asr_stats,
+        "cache": cache_report,
+        "timings": timings,
+    }
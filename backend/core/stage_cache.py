@@ -0,0 +1,97 @@
+from __future__ import annotations
+
+import contextlib
+import hashlib
+import json
+import logging
+import os
+import threading
+from pathlib import Path
+from typing import Any, Dict, Optional, Sequence
+
+from shared import iflow_api
+
+LOGGER = logging.getLogger(__name__)
+
+STAGE_CACHE_VERSION = 2
+
+
+def _bool_from_env(name: str, default: bool) -> bool:
+    value = os.getenv(name)
+    if value is None:
+        return default
+    return value.strip().lower() in {"1", "true", "yes", "on"}
+
+
+def env_params(names: Sequence[str]) -> Dict[str, Optional[str]]:
+    """Current values of the environment variables that change a stage's output, for use in cache keys."""
+    return {name: os.getenv(name) for name in names}
+
+
+class StageCache:
+    """JSON results of pipeline stages, keyed by video fingerprint, stage parameters and upstream keys.
+
+    Chaining the keys of the stages a result was computed from means that changing a downstream
+    parameter (e.g. the VL frame budget) only misses for that stage and the stages after it.
+    """
+
+    def __init__(self, root: str | os.PathLike[str], enabled: bool = True) -> None:
+        self.root = Path(root)
+        self.enabled = enabled
+
+    def key(self, stage: str, fingerprint: str, params: Dict[str, Any], upstream: Sequence[str] = ()) -> str:
+        basis = {
+            "stage": stage,
+            "fingerprint": fingerprint,
+            "params": params,
+            "upstream": list(upstream),
+            "version": STAGE_CACHE_VERSION,
+        }
+        encoded = json.dumps(basis, ensure_ascii=False, sort_keys=True, default=str).encode("utf-8")
+        return hashlib.sha256(encoded).hexdigest()
+
+    def _path(self, stage: str, key: str) -> Path:
+        return self.root / stage / f"{key}.json"
+
+    def load(self, stage: str, key: str) -> Optional[Any]:
+        if not self.enabled:
+            return None
+        path = self._path(stage, key)
+        if not path.exists():
+            return None
+        try:
+            with path.open("r", encoding="utf-8") as cache_file:
+                return json.load(cache_file)["value"]
+        except Exception as exc:  # noqa: BLE001
+            LOGGER.warning("Failed to read stage cache %s: %s", path, exc)
+            return None
+
+    def store(self, stage: str, key: str, value: Any) -> None:
+        if not self.enabled:
+            return
+        path = self._path(stage, key)
+        temp_path = path.with_suffix(f".{threading.get_ident()}.tmp")
+        try:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            with temp_path.open("w", encoding="utf-8") as cache_file:
+                json.dump({"value": value}, cache_file, ensure_ascii=False)
+            os.replace(temp_path, path)
+        except Exception as exc:  # noqa: BLE001
+            LOGGER.warning("Failed to write stage cache %s: %s", path, exc)
+            with contextlib.suppress(FileNotFoundError):
+                temp_path.unlink()
+
+    def clear(self) -> int:
+        """Remove every cached stage result. Returns the number of files removed."""
+        removed = 0
+        for path in self.root.glob("*/*.json"):
+            with contextlib.suppress(FileNotFoundError):
+                path.unlink()
+                removed += 1
+        return removed
+
+
+def get_stage_cache() -> StageCache:
+    """Stage cache under ``<cache dir>/stages``, switched by ``PIPELINE_CACHE_ENABLE``."""
+    root = Path(iflow_api.get_runtime_config()["cache_dir"]) / "stages"
+    return StageCache(root, enabled=_bool_from_env("PIPELINE_CACHE_ENABLE", True))
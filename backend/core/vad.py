@@ -0,0 +1,175 @@
+from __future__ import annotations
+
+from dataclasses import dataclass, field
+from typing import Dict, List, Tuple
+
+import numpy as np
+
+FRAME_MS = 30
+ABS_FLOOR_DB = -45.0
+NOISE_MARGIN_DB = 12.0
+NOISE_PERCENTILE = 10.0
+# Speech/music gate: within each block, speech dips between syllables, so a share of its frames falls
+# below half the block's mean power (low short-time energy ratio); sustained music or ambience does not.
+MUSIC_BLOCK_S = 1.0
+MIN_LOW_ENERGY_RATIO = 0.1
+
+
+@dataclass
+class SpeechPlan:
+    """Speech windows (sample offsets) to transcribe, plus how much audio was left out."""
+
+    windows: List[Tuple[int, int]] = field(default_factory=list)
+    total_s: float = 0.0
+    speech_s: float = 0.0
+    music_s: float = 0.0
+    threshold_db: float | None = None
+
+    @property
+    def skipped_s(self) -> float:
+        return max(0.0, self.total_s - self.speech_s)
+
+    def as_dict(self) -> Dict[str, float | int | None]:
+        return {
+            "windows": len(self.windows),
+            "total_s": round(self.total_s, 3),
+            "speech_s": round(self.speech_s, 3),
+            "skipped_s": round(self.skipped_s, 3),
+            "music_s": round(self.music_s, 3),
+            "threshold_db": round(self.threshold_db, 2) if self.threshold_db is not None else None,
+        }
+
+
+def _frame_db(samples: np.ndarray, frame_len: int) -> np.ndarray:
+    count = len(samples) // frame_len
+    if count == 0:
+        return np.zeros(0, dtype=np.float64)
+    frames = np.asarray(samples[: count * frame_len], dtype=np.float32).reshape(count, frame_len)
+    power = np.einsum("ij,ij->i", frames, frames) / float(frame_len)
+    return 10.0 * np.log10(power + 1e-10)
+
+
+def _speech_like(db: np.ndarray, block_frames: int) -> np.ndarray:
+    """Per frame: does its block look like speech (enough low-energy frames) rather than sustained sound?"""
+    power = np.power(10.0, db / 10.0)
+    speech_like = np.zeros(db.size, dtype=bool)
+    for start in range(0, db.size, block_frames):
+        block = power[start : start + block_frames]
+        low_ratio = np.count_nonzero(block < 0.5 * block.mean()) / float(block.size)
+        speech_like[start : start + block_frames] = low_ratio >= MIN_LOW_ENERGY_RATIO
+    return speech_like
+
+
+def _runs(mask: np.ndarray) -> List[Tuple[int, int]]:
+    """Return ``[start, end)`` index pairs of consecutive True values."""
+    if mask.size == 0:
+        return []
+    padded = np.concatenate(([0], mask.astype(np.int8), [0]))
+    edges = np.flatnonzero(np.diff(padded))
+    return [(int(start), int(end)) for start, end in zip(edges[::2], edges[1::2])]
+
+
+def _speech_regions(
+    active: np.ndarray,
+    min_speech_frames: int,
+    min_silence_frames: int,
+) -> List[Tuple[int, int]]:
+    merged: List[Tuple[int, int]] = []
+    for start, end in _runs(active):
+        if merged and start - merged[-1][1] <= min_silence_frames:
+            merged[-1] = (merged[-1][0], end)
+        else:
+            merged.append((start, end))
+    # Drop isolated clicks only after short pauses have been bridged, so syllables survive.
+    return [region for region in merged if region[1] - region[0] >= min_speech_frames]
+
+
+def _split_long_region(
+    db: np.ndarray,
+    start: int,
+    end: int,
+    max_frames: int,
+    min_frames: int,
+) -> List[Tuple[int, int]]:
+    """Cut a region longer than ``max_frames`` at its quietest frames."""
+    pieces: List[Tuple[int, int]] = []
+    while end - start > max_frames:
+        lo = start + min_frames
+        hi = start + max_frames
+        cut = lo + int(np.argmin(db[lo:hi])) if hi > lo else hi
+        pieces.append((start, cut))
+        start = cut
+    pieces.append((start, end))
+    return pieces
+
+
+def plan_speech_windows(
+    samples: np.ndarray,
+    sample_rate: int,
+    max_window_s: float,
+    *,
+    min_window_s: float = 10.0,
+    min_speech_s: float = 0.25,
+    min_silence_s: float = 0.4,
+    max_gap_s: float = 2.0,
+    pad_s: float = 0.2,
+) -> SpeechPlan:
+    """Energy-based VAD: group speech into windows of at most ``max_window_s``, cutting on pauses.
+
+    The threshold adapts to the clip's noise floor (a low percentile of frame energy). Loud stretches
+    then also need speech-like dynamics: in each ``MUSIC_BLOCK_S`` block at least ``MIN_LOW_ENERGY_RATIO``
+    of the frames must fall below half the block's mean power, as the pauses between syllables do.
+    Sustained music or ambience without such dips is skipped (``music_s``); speech over a quieter
+    music bed keeps its dips and is kept, while strongly percussive music with silent gaps can still
+    pass. Gaps longer than ``max_gap_s`` always start a new window, so long silent stretches are never
+    sent to ASR.
+    """
+
+    total = len(samples)
+    plan = SpeechPlan(total_s=total / float(sample_rate) if sample_rate else 0.0)
+    frame_len = max(1, int(sample_rate * FRAME_MS / 1000))
+    db = _frame_db(samples, frame_len)
+    if db.size == 0:
+        return plan
+
+    frame_s = frame_len / float(sample_rate)
+    threshold = max(ABS_FLOOR_DB, float(np.percentile(db, NOISE_PERCENTILE)) + NOISE_MARGIN_DB)
+    plan.threshold_db = threshold
+
+    loud = db > threshold
+    active = loud & _speech_like(db, max(1, int(round(MUSIC_BLOCK_S / frame_s))))
+    plan.music_s = np.count_nonzero(loud & ~active) * frame_s
+
+    regions = _speech_regions(
+        active,
+        min_speech_frames=max(1, int(round(min_speech_s / frame_s))),
+        min_silence_frames=int(round(min_silence_s / frame_s)),
+    )
+    max_frames = max(1, int(max_window_s / frame_s))
+    min_frames = min(max_frames, max(1, int(min_window_s / frame_s)))
+    max_gap_frames = int(round(max_gap_s / frame_s))
+
+    window_frames: List[Tuple[int, int]] = []
+    for region_start, region_end in regions:
+        for start, end in _split_long_region(db, region_start, region_end, max_frames, min_frames):
+            if window_frames:
+                last_start, last_end = window_frames[-1]
+                if start - last_end <= max_gap_frames and end - last_start <= max_frames:
+                    window_frames[-1] = (last_start, end)
+                    continue
+            window_frames.append((start, end))
+
+    pad = int(round(pad_s * sample_rate))
+    previous_end = 0
+    for start_frame, end_frame in window_frames:
+        start = max(previous_end, start_frame * frame_len - pad)
+        end = min(total, end_frame * frame_len + pad)
+        if end_frame == db.size:
+            end = total
+        if end <= start:
+            continue
+        plan.windows.append((start, end))
+        previous_end = end
+
+    plan.speech_s = sum(end - start for start, end in plan.windows) / float(sample_rate)
+    return plan
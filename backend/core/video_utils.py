@@ -1,11 +1,17 @@
 from __future__ import annotations
 
+import bisect
+import functools
+import hashlib
+import heapq
+import logging
 import math
+import multiprocessing
 import os
-import tempfile
 from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
-from typing import Dict, List
+from typing import Dict, Iterable, Iterator, List, Sequence, Tuple
 
 import ffmpeg
 import cv2
@@ -13,19 +19,90 @@ import numpy as np
 from scenedetect import SceneManager, VideoManager
 from scenedetect.detectors import ContentDetector
 
+from . import frame_metrics
+from .artifact_store import get_store
+
+LOGGER = logging.getLogger(__name__)
+
+AUDIO_SAMPLE_RATE = 16000
+# PySceneDetect's auto-downscale target width: cut detection runs on ~256 px wide frames.
+SCENE_DETECT_WIDTH = 256
+# Fast scene detection: narrower frames, and videos at least this long switch to it under "auto".
+SCENE_FAST_WIDTH = 160
+DEFAULT_SCENE_FAST_MIN_S = 300.0
+SCENE_DETECT_MODES = ("auto", "full", "fast")
+# ContentDetector's default min_scene_len; chunks below SCENE_CHUNK_MIN_S seconds are not split further.
+SCENE_MIN_LEN_FRAMES = 15
+DEFAULT_SCENE_CHUNK_MIN_S = 60.0
+# Decode forward instead of seeking when the next needed frame is this close.
+SEEK_GAP_FRAMES = 48
+# Frames whose dHashes differ in at most this many of 64 bits are treated as the same picture.
+DEFAULT_DEDUP_DISTANCE = 6
+# Weight of the local text likelihood in the heuristic score, on top of clarity/entropy/edges (0.5/0.3/0.2).
+DEFAULT_TEXT_WEIGHT = 0.3
+# Sparse sampling: coarse grid step, frame cap, and the closest two adaptive samples may get.
+DEFAULT_GRID_S = 5.0
+DEFAULT_SPARSE_MAX = 400
+ADAPTIVE_MIN_GAP_S = 0.5
+SAMPLING_MODES = ("dense", "sparse", "adaptive")
+# Video fingerprint: this many evenly spaced chunks of the file are hashed instead of the whole file.
+FINGERPRINT_CHUNKS = 16
+FINGERPRINT_CHUNK_BYTES = 64 * 1024
+
+
+def _int_from_env(name: str, default: int) -> int:
+    value = os.getenv(name)
+    if value is None:
+        return default
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        LOGGER.warning("Invalid integer for %s=%s, using default %d", name, value, default)
+        return default
+
+
+def _choice_from_env(name: str, choices: Sequence[str], default: str) -> str:
+    value = os.getenv(name)
+    if value is None:
+        return default
+    choice = value.strip().lower()
+    if choice not in choices:
+        LOGGER.warning("Invalid value for %s=%s, using default %s", name, value, default)
+        return default
+    return choice
+
+
+def _float_from_env(name: str, default: float) -> float:
+    value = os.getenv(name)
+    if value is None:
+        return default
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        LOGGER.warning("Invalid float for %s=%s, using default %.2f", name, value, default)
+        return default
+
+
+# format -> (ffmpeg muxer, codec, default bitrate); lossless codecs ignore the bitrate.
+AUDIO_CODECS = {
+    "flac": ("flac", "flac", None),
+    "opus": ("ogg", "libopus", "24k"),
+    "mp3": ("mp3", "libmp3lame", "32k"),
+}
+
 
 def _ensure_path(path: str | os.PathLike[str]) -> Path:
     return Path(path).expanduser().resolve()
 
 
 def extract_audio(video_path: str) -> str:
-    """提取音频并返回音频文件路径"""
+    """提取音频并返回音频文件路径（写入受容量上限管理的产物存储）"""
     input_path = _ensure_path(video_path)
     if not input_path.exists():
         raise FileNotFoundError(f"Video file does not exist: {input_path}")
 
-    output_dir = input_path.parent
-    output_path = output_dir / f"{input_path.stem}_audio.wav"
+    store = get_store()
+    output_path = store.new_dir(f"{input_path.stem}_audio_") / f"{input_path.stem}_audio.wav"
 
     stream = ffmpeg.input(str(input_path))
     stream = ffmpeg.output(
@@ -36,12 +113,55 @@ def extract_audio(video_path: str) -> str:
         ar=16000,
     )
     ffmpeg.run(stream, overwrite_output=True, capture_stdout=True, capture_stderr=True)
+    store.add([output_path])
 
     return str(output_path)
 
 
+def decode_audio(video_path: str, sample_rate: int = AUDIO_SAMPLE_RATE) -> np.ndarray:
+    """解码音轨为单声道 float32 PCM（内存中，不落盘），可直接切片送入 Whisper"""
+    input_path = _ensure_path(video_path)
+    if not input_path.exists():
+        raise FileNotFoundError(f"Video file does not exist: {input_path}")
+
+    stream = ffmpeg.input(str(input_path))
+    stream = ffmpeg.output(
+        stream.audio,
+        "pipe:",
+        format="f32le",
+        acodec="pcm_f32le",
+        ac=1,
+        ar=sample_rate,
+    )
+    pcm_bytes, _ = ffmpeg.run(stream, capture_stdout=True, capture_stderr=True)
+
+    # bytearray keeps the buffer writable so torch.from_numpy in Whisper does not warn.
+    return np.frombuffer(bytearray(pcm_bytes), dtype=np.float32)
+
+
+def encode_audio(
+    samples: np.ndarray,
+    audio_format: str = "flac",
+    sample_rate: int = AUDIO_SAMPLE_RATE,
+    bitrate: str | None = None,
+) -> bytes:
+    """将单声道 float32 PCM 在内存中压缩为 flac / opus / mp3 字节（不落盘）"""
+    if audio_format not in AUDIO_CODECS:
+        raise ValueError(f"Unsupported audio format: {audio_format}")
+    muxer, codec, default_bitrate = AUDIO_CODECS[audio_format]
+
+    pcm = (np.clip(samples, -1.0, 1.0) * 32767.0).astype("<i2")
+    output_kwargs = {"format": muxer, "acodec": codec, "ac": 1, "ar": sample_rate}
+    if bitrate or default_bitrate:
+        output_kwargs["audio_bitrate"] = bitrate or default_bitrate
+    stream = ffmpeg.input("pipe:", format="s16le", ac=1, ar=sample_rate)
+    stream = ffmpeg.output(stream, "pipe:", **output_kwargs)
+    encoded, _ = ffmpeg.run(stream, input=pcm.tobytes(), capture_stdout=True, capture_stderr=True)
+    return encoded
+
+
 def extract_keyframes(video_path: str, fps: int = 1) -> List[str]:
-    """按每秒 fps 抽帧，返回帧图片路径列表（兼容旧接口）"""
+    """按每秒 fps 抽帧，返回帧图片路径列表（兼容旧接口）；帧写入产物存储，超出容量上限时按 LRU 淘汰"""
     if fps <= 0:
         raise ValueError("fps must be greater than 0")
 
@@ -49,7 +169,8 @@ def extract_keyframes(video_path: str, fps: int = 1) -> List[str]:
     if not input_path.exists():
         raise FileNotFoundError(f"Video file does not exist: {input_path}")
 
-    temp_dir = Path(tempfile.mkdtemp(prefix=f"{input_path.stem}_frames_"))
+    store = get_store()
+    temp_dir = store.new_dir(f"{input_path.stem}_frames_")
     output_template = temp_dir / "frame_%05d.jpg"
 
     stream = ffmpeg.input(str(input_path))
@@ -58,25 +179,59 @@ def extract_keyframes(video_path: str, fps: int = 1) -> List[str]:
     ffmpeg.run(stream, overwrite_output=True, capture_stdout=True, capture_stderr=True)
 
     frame_paths = sorted(str(path) for path in temp_dir.glob("frame_*.jpg"))
+    store.add(frame_paths)
     return frame_paths
 
 
-def detect_scenes(video_path: str) -> List[Dict[str, float]]:
-    """使用 PySceneDetect 切分镜头，返回每个镜头的起止时间"""
+def scene_detect_policy(duration_s: float, mode: str | None = None) -> Dict[str, object]:
+    """镜头检测参数：full 与 PySceneDetect 默认一致（约 256px 宽、逐帧），fast 进一步降采样并跳帧
+
+    ``mode`` 默认取 ``SCENE_DETECT_MODE``；``auto`` 时时长不少于 ``SCENE_FAST_MIN_S`` 秒的视频走 fast，
+    超过 30 分钟的视频每 3 帧检测 1 帧，否则每 2 帧检测 1 帧。
+    """
+    mode = mode.strip().lower() if mode else _choice_from_env("SCENE_DETECT_MODE", SCENE_DETECT_MODES, "auto")
+    if mode not in SCENE_DETECT_MODES:
+        raise ValueError(f"Unsupported scene detection mode: {mode}")
+    if mode == "auto":
+        fast_min_s = _float_from_env("SCENE_FAST_MIN_S", DEFAULT_SCENE_FAST_MIN_S)
+        mode = "fast" if duration_s >= fast_min_s else "full"
+    if mode == "full":
+        return {"mode": "full", "width": SCENE_DETECT_WIDTH, "frame_skip": 0}
+    return {"mode": "fast", "width": SCENE_FAST_WIDTH, "frame_skip": 1 if duration_s < 1800 else 2}
+
+
+def detect_scenes(video_path: str, mode: str | None = None, workers: int | None = None) -> List[Dict[str, float]]:
+    """使用 PySceneDetect 切分镜头，返回每个镜头的起止时间；``mode`` 见 ``scene_detect_policy``
+
+    长视频按时间切成多段、在 ``workers``（默认 ``VIDEO_SCAN_WORKERS``，即 CPU 核数）个进程中并行检测后拼接。
+    """
     input_path = _ensure_path(video_path)
     if not input_path.exists():
         raise FileNotFoundError(f"Video file does not exist: {input_path}")
 
+    video_fps, frame_count = _probe_video(input_path)
+    policy = scene_detect_policy(frame_count / video_fps, mode)
+    if len(_plan_chunks(frame_count, video_fps, 0, workers)) > 1:
+        scan = _scan_video(str(input_path), video_fps, frame_count, policy, workers=workers)
+        return _scenes_from_cuts(scan["cuts"], scan["end"], video_fps)
+
     video_manager = VideoManager([str(input_path)])
     scene_manager = SceneManager()
     scene_manager.add_detector(ContentDetector())
 
-    duration_tc = None
     try:
         video_manager.start()
-        scene_manager.detect_scenes(frame_source=video_manager)
-        scenes = scene_manager.get_scene_list()
+        # VideoManager.get_duration() returns (duration, start, end) timecodes.
         duration_tc = video_manager.get_duration()
+        if isinstance(duration_tc, tuple):
+            duration_tc = duration_tc[0]
+        duration_s = float(duration_tc.get_seconds()) if duration_tc else 0.0
+        if policy["mode"] == "fast":
+            frame_width = int(video_manager.get_framesize()[0] or 0)
+            scene_manager.auto_downscale = False
+            scene_manager.downscale = max(1, frame_width // int(policy["width"]))
+        scene_manager.detect_scenes(frame_source=video_manager, frame_skip=int(policy["frame_skip"]))
+        scenes = scene_manager.get_scene_list()
     finally:
         video_manager.release()
 
@@ -90,8 +245,7 @@ def detect_scenes(video_path: str) -> List[Dict[str, float]]:
         )
 
     if not scene_ranges:
-        duration = float(duration_tc.get_seconds()) if duration_tc else 0.0
-        scene_ranges.append({"start": 0.0, "end": duration})
+        scene_ranges.append({"start": 0.0, "end": duration_s})
 
     return scene_ranges
 
@@ -116,38 +270,406 @@ def extract_frames(video_path: str, fps: int = 1) -> List[Dict[str, object]]:
     return frames
 
 
-def _compute_frame_metrics(image_path: str) -> Dict[str, float]:
-    image = cv2.imread(image_path)
-    if image is None:
-        return {"clarity": 0.0, "entropy": 0.0, "edge_density": 0.0}
+def analyze_video(video_path: str, fps: int = 1, mode: str | None = None) -> Dict[str, List[Dict[str, object]]]:
+    """镜头切分 + 采样帧及其指标，返回 ``{"scenes", "frames"}``
+
+    ``mode``（默认 ``FRAME_SAMPLING_MODE``）：``dense`` 单次解码全片并按 fps 采样；``sparse`` /
+    ``adaptive`` 先用 fast 策略切镜头（``SCENE_DETECT_MODE=full`` 时除外），再只 seek 解码镜头中点与
+    粗网格上的帧（见 ``extract_sparse_frames``）。
+    帧不落盘（``path`` 为 None），需要图片时再调用 ``write_frame_images`` 只写用到的帧。
+    """
+    if fps <= 0:
+        raise ValueError("fps must be greater than 0")
+    mode = mode.strip().lower() if mode else _choice_from_env("FRAME_SAMPLING_MODE", SAMPLING_MODES, "dense")
+    if mode not in SAMPLING_MODES:
+        raise ValueError(f"Unsupported frame sampling mode: {mode}")
+    input_path = _ensure_path(video_path)
+    if not input_path.exists():
+        raise FileNotFoundError(f"Video file does not exist: {input_path}")
+
+    video_fps, frame_count = _probe_video(input_path)
+    if mode != "dense":
+        # 稀疏模式的意义在于比 dense 少解码：切点用 fast 检测（降采样、跳帧且不做采样），除非显式要求 full
+        detect_mode = "full" if _choice_from_env("SCENE_DETECT_MODE", SCENE_DETECT_MODES, "auto") == "full" else "fast"
+        policy = scene_detect_policy(frame_count / video_fps, detect_mode)
+        scan = _scan_video(str(input_path), video_fps, frame_count, policy)
+        scenes = _scenes_from_cuts(scan["cuts"], scan["end"], video_fps)
+        return {"scenes": scenes, "frames": extract_sparse_frames(video_path, scenes, adaptive=mode == "adaptive")}
+
+    policy = scene_detect_policy(frame_count / video_fps)
+    scan = _scan_video(str(input_path), video_fps, frame_count, policy, sample_fps=fps)
+    frames = [
+        {
+            "frame_id": f"frame_{position:05d}",
+            "ts": ts,
+            "path": None,
+            "frame_index": frame_index,
+            "metrics": metrics,
+            "dhash": frame_hash,
+        }
+        for position, (frame_index, ts, metrics, frame_hash) in enumerate(scan["samples"])
+    ]
+    return {"scenes": _scenes_from_cuts(scan["cuts"], scan["end"], video_fps), "frames": frames}
+
+
+def _probe_video(input_path: Path) -> Tuple[float, int]:
+    capture = cv2.VideoCapture(str(input_path))
+    if not capture.isOpened():
+        raise RuntimeError(f"Unable to open video: {input_path}")
+    try:
+        video_fps = float(capture.get(cv2.CAP_PROP_FPS) or 0.0)
+        frame_count = int(capture.get(cv2.CAP_PROP_FRAME_COUNT) or 0)
+    finally:
+        capture.release()
+    return (video_fps if video_fps > 0 else 25.0), max(0, frame_count)
+
 
-    gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
-    clarity = float(cv2.Laplacian(gray, cv2.CV_64F).var())
+def video_fingerprint(video_path: str) -> str:
+    """视频内容指纹：文件大小 + 均匀分布的 16 个 64KB 数据块的 SHA-256，再拼上时长；无需读完整个文件
 
-    hist = cv2.calcHist([gray], [0], None, [256], [0, 256]).ravel()
-    total = float(np.sum(hist)) or 1.0
-    probs = hist / total
-    entropy = float(-np.sum([p * math.log(p + 1e-12) for p in probs]))
+    同一文件（路径、大小、修改时间不变）在进程内只计算一次。
+    """
+    input_path = _ensure_path(video_path)
+    stat = input_path.stat()
+    return _fingerprint(str(input_path), stat.st_size, stat.st_mtime_ns)
 
-    edges = cv2.Canny(gray, 100, 200)
-    edge_density = float(np.mean(edges > 0))
 
+@functools.lru_cache(maxsize=256)
+def _fingerprint(path: str, size: int, mtime_ns: int) -> str:
+    digest = hashlib.sha256(str(size).encode("utf-8"))
+    with open(path, "rb") as video_file:
+        if size <= FINGERPRINT_CHUNKS * FINGERPRINT_CHUNK_BYTES:
+            digest.update(video_file.read())
+        else:
+            span = size - FINGERPRINT_CHUNK_BYTES
+            for idx in range(FINGERPRINT_CHUNKS):
+                video_file.seek(span * idx // (FINGERPRINT_CHUNKS - 1))
+                digest.update(video_file.read(FINGERPRINT_CHUNK_BYTES))
+    video_fps, frame_count = _probe_video(Path(path))
+    return f"{digest.hexdigest()[:32]}-{frame_count / video_fps:.2f}s"
+
+
+def _scenes_from_cuts(cuts: Iterable[int], end_frame: int, video_fps: float) -> List[Dict[str, float]]:
+    boundaries = sorted({int(cut) for cut in cuts if 0 < int(cut) < end_frame})
+    if not boundaries:
+        return [{"start": 0.0, "end": end_frame / video_fps}]
+    edges = [0, *boundaries, end_frame]
+    return [{"start": start / video_fps, "end": end / video_fps} for start, end in zip(edges[:-1], edges[1:])]
+
+
+def _plan_chunks(
+    frame_count: int, video_fps: float, overlap: int, workers: int | None = None
+) -> List[Tuple[int, int, int | None]]:
+    """把视频切成 ``(起始帧, 保留起点, 结束帧)`` 区间；起始帧向前多取 ``overlap`` 帧给检测器预热"""
+    workers = _int_from_env("VIDEO_SCAN_WORKERS", os.cpu_count() or 1) if workers is None else workers
+    min_chunk_frames = max(1.0, _float_from_env("SCENE_CHUNK_MIN_S", DEFAULT_SCENE_CHUNK_MIN_S) * video_fps)
+    count = max(1, min(workers, int(frame_count // min_chunk_frames)))
+    bounds = [round(idx * frame_count / count) for idx in range(count + 1)]
+    return [
+        (max(0, keep_from - overlap), keep_from, None if idx == count - 1 else bounds[idx + 1])
+        for idx, keep_from in enumerate(bounds[:-1])
+    ]
+
+
+def _scan_range(
+    video_path: str,
+    video_fps: float,
+    start_frame: int,
+    keep_from: int,
+    end_frame: int | None,
+    detect_width: int,
+    detect_every: int,
+    sample_fps: float | None,
+    metrics_workers: int | None = None,
+) -> Dict[str, object]:
+    """解码 ``[start_frame, end_frame)``：检测镜头切点，并按 sample_fps 采样帧计算指标
+
+    ``keep_from`` 之前的帧只用于检测器预热，其中的切点与采样都丢弃。可在子进程中运行。
+    """
+    capture = cv2.VideoCapture(video_path)
+    if start_frame:
+        capture.set(cv2.CAP_PROP_POS_FRAMES, start_frame)
+    detector = ContentDetector()
+    cuts: List[int] = []
+    sample_info: List[Tuple[int, float]] = []
+    batcher = frame_metrics.MetricsBatcher(workers=metrics_workers)
+    half_frame = 0.5 / video_fps
+    sample_idx = 0
+    if sample_fps and keep_from:
+        sample_idx = int(((keep_from - 1) / video_fps + half_frame) * sample_fps) + 1
+    frame_num = start_frame
+    detect_size = None
+    try:
+        while (end_frame is None or frame_num < end_frame) and capture.grab():
+            ts = frame_num / video_fps
+            sample = bool(sample_fps) and frame_num >= keep_from and ts + half_frame >= sample_idx / sample_fps
+            detect = frame_num % detect_every == 0
+            # Frames needed neither for detection nor sampling are decoded but never converted.
+            ok, image = capture.retrieve() if sample or detect else (False, None)
+            if not ok:
+                frame_num += 1
+                continue
+            if detect:
+                if detect_size is None:
+                    height, width = image.shape[:2]
+                    factor = max(1.0, width / float(detect_width))
+                    detect_size = (max(1, round(width / factor)), max(1, round(height / factor)))
+                small = image if detect_size == (image.shape[1], image.shape[0]) else cv2.resize(
+                    image, detect_size, interpolation=cv2.INTER_LINEAR
+                )
+                cuts.extend(cut for cut in detector.process_frame(frame_num, small) if cut >= keep_from)
+
+            if sample:
+                sample_info.append((frame_num, round(sample_idx / sample_fps, 3)))
+                batcher.add(frame_metrics.to_gray(image))
+                sample_idx = int((ts + half_frame) * sample_fps) + 1
+            frame_num += 1
+        cuts.extend(cut for cut in detector.post_process(frame_num) or [] if cut >= keep_from)
+        samples = [
+            (frame_index, ts, metrics, frame_hash)
+            for (frame_index, ts), metrics, frame_hash in zip(sample_info, batcher.results(), batcher.hashes)
+        ]
+    finally:
+        capture.release()
+        batcher.close()
+    return {"cuts": cuts, "samples": samples, "end": frame_num}
+
+
+def _scan_video(
+    video_path: str,
+    video_fps: float,
+    frame_count: int,
+    policy: Dict[str, object],
+    sample_fps: float | None = None,
+    workers: int | None = None,
+) -> Dict[str, object]:
+    """按 CPU 核数把视频分段并行扫描，再按帧号拼接切点与采样帧"""
+    detect_every = int(policy["frame_skip"]) + 1
+    # Warm-up must cover ContentDetector's min_scene_len, so a cut right after a chunk edge is still seen.
+    overlap = max(int(round(video_fps)), (SCENE_MIN_LEN_FRAMES + 1) * detect_every)
+    chunks = _plan_chunks(frame_count, video_fps, overlap, workers)
+    args = (video_path, video_fps)
+    scan_kwargs = {"detect_width": int(policy["width"]), "detect_every": detect_every, "sample_fps": sample_fps}
+    if len(chunks) == 1:
+        return _scan_range(*args, *chunks[0], **scan_kwargs)
+
+    # Spawned, not forked: the pipeline calls this from a worker thread while ASR / iFlow threads hold locks.
+    # Spawn re-runs the main script in each worker, so app/ui.py only renders the page under ``__main__``.
+    with ProcessPoolExecutor(max_workers=len(chunks), mp_context=multiprocessing.get_context("spawn")) as executor:
+        futures = [executor.submit(_scan_range, *args, *chunk, metrics_workers=0, **scan_kwargs) for chunk in chunks]
+        parts = [future.result() for future in futures]
+
+    cuts: List[int] = []
+    for cut in sorted(cut for part in parts for cut in part["cuts"]):
+        if not cuts or cut - cuts[-1] >= SCENE_MIN_LEN_FRAMES:
+            cuts.append(cut)
     return {
-        "clarity": clarity,
-        "entropy": entropy,
-        "edge_density": edge_density,
+        "cuts": cuts,
+        "samples": [sample for part in parts for sample in part["samples"]],
+        "end": parts[-1]["end"],
     }
 
 
-def _normalize(values: List[float]) -> List[float]:
-    if not values:
+def write_frame_images(
+    video_path: str,
+    frames: Iterable[Dict[str, object]],
+    output_dir: str | os.PathLike[str] | None = None,
+) -> List[Dict[str, object]]:
+    """把 ``analyze_video`` 采样到、但尚未落盘的帧写成 JPEG，原地补全 ``path``
+
+    未指定 ``output_dir`` 时写入产物存储（``artifact_store``），由其按容量上限统一淘汰。
+    """
+    pending = sorted(
+        (frame for frame in frames if not frame.get("path") and frame.get("frame_index") is not None),
+        key=lambda item: int(item["frame_index"]),
+    )
+    if not pending:
+        return pending
+
+    input_path = _ensure_path(video_path)
+    store = None if output_dir else get_store()
+    target_dir = Path(output_dir) if output_dir else store.new_dir(f"{input_path.stem}_frames_")
+    target_dir.mkdir(parents=True, exist_ok=True)
+
+    capture = cv2.VideoCapture(str(input_path))
+    try:
+        by_index = {int(frame["frame_index"]): frame for frame in pending}
+        for frame_index, image in _iter_frames_at(capture, list(by_index)):
+            frame = by_index[frame_index]
+            output_path = target_dir / f"{frame['frame_id']}.jpg"
+            if cv2.imwrite(str(output_path), image):
+                frame["path"] = str(output_path)
+    finally:
+        capture.release()
+    if store is not None:
+        store.add(frame["path"] for frame in pending if frame.get("path"))
+    return pending
+
+
+def _iter_frames_at(capture: "cv2.VideoCapture", frame_indices: Sequence[int]) -> Iterator[Tuple[int, np.ndarray]]:
+    """按帧号升序解码指定帧：相距较近时顺序 grab，否则 seek（从前一个关键帧解码到目标帧）"""
+    position = None
+    for target in sorted(set(frame_indices)):
+        if position is None or target < position or target - position > SEEK_GAP_FRAMES:
+            capture.set(cv2.CAP_PROP_POS_FRAMES, target)
+            position = target
+        while position < target and capture.grab():
+            position += 1
+        ok, image = capture.read()
+        position += 1
+        if ok:
+            yield target, image
+
+
+def _sparse_timestamps(scenes: List[Dict[str, float]], duration: float, grid_s: float, adaptive: bool) -> List[float]:
+    """镜头中点 + 粗网格；自适应模式下每个镜头额外取 1/4、3/4 处，用于判断镜头内画面是否变化"""
+    targets = set()
+    for scene in scenes:
+        start, end = float(scene["start"]), float(scene["end"])
+        targets.add(round((start + end) / 2, 3))
+        if adaptive and end - start >= 2 * ADAPTIVE_MIN_GAP_S:
+            targets.add(round(start + (end - start) / 4, 3))
+            targets.add(round(start + 3 * (end - start) / 4, 3))
+    if grid_s > 0:
+        targets.update(round(step * grid_s, 3) for step in range(int(duration // grid_s) + 1))
+    return sorted(ts for ts in targets if 0.0 <= ts <= duration)
+
+
+def extract_sparse_frames(
+    video_path: str,
+    scenes: List[Dict[str, float]],
+    grid_s: float | None = None,
+    adaptive: bool = False,
+    max_frames: int | None = None,
+) -> List[Dict[str, object]]:
+    """只解码目标时间点（镜头中点 + 每 ``grid_s`` 秒的粗网格）的帧，返回与 ``analyze_video`` 相同结构的帧列表
+
+    ``adaptive`` 为 True 时，镜头内相邻采样点的 dHash 差异超过去重阈值，就在两点之间继续加密采样，
+    静止镜头保持稀疏；总帧数不超过 ``max_frames``（默认 ``FRAME_SPARSE_MAX``）。
+    """
+    input_path = _ensure_path(video_path)
+    if not input_path.exists():
+        raise FileNotFoundError(f"Video file does not exist: {input_path}")
+
+    grid_s = _float_from_env("FRAME_GRID_S", DEFAULT_GRID_S) if grid_s is None else grid_s
+    max_frames = _int_from_env("FRAME_SPARSE_MAX", DEFAULT_SPARSE_MAX) if max_frames is None else max_frames
+    change_distance = max(0, _int_from_env("KEYFRAME_DEDUP_DISTANCE", DEFAULT_DEDUP_DISTANCE))
+
+    capture = cv2.VideoCapture(str(input_path))
+    if not capture.isOpened():
+        raise RuntimeError(f"Unable to open video: {input_path}")
+    samples: Dict[int, Tuple[float, np.ndarray, int]] = {}
+    try:
+        video_fps = float(capture.get(cv2.CAP_PROP_FPS) or 0.0)
+        if not video_fps > 0:
+            video_fps = 25.0
+        frame_count = int(capture.get(cv2.CAP_PROP_FRAME_COUNT) or 0)
+        duration = max([frame_count / video_fps] + [float(scene["end"]) for scene in scenes])
+        last_index = max(0, frame_count - 1) if frame_count else None
+
+        def decode(timestamps: Iterable[float]) -> None:
+            wanted: Dict[int, float] = {}
+            for ts in timestamps:
+                frame_index = int(round(ts * video_fps))
+                if last_index is not None:
+                    frame_index = min(frame_index, last_index)
+                if frame_index not in samples and len(samples) + len(wanted) < max_frames:
+                    wanted.setdefault(frame_index, ts)
+            for frame_index, image in _iter_frames_at(capture, list(wanted)):
+                gray = frame_metrics.to_gray(image)
+                samples[frame_index] = (wanted[frame_index], gray, frame_metrics.dhash(gray))
+
+        decode(_sparse_timestamps(scenes, duration, grid_s, adaptive))
+
+        # 镜头按起点归属：边界时间点属于后一个镜头
+        scene_starts = sorted(float(scene["start"]) for scene in scenes)
+        while adaptive and len(samples) < max_frames:
+            refine: List[float] = []
+            ordered = sorted(samples.values(), key=lambda item: item[0])
+            for (ts_a, _, hash_a), (ts_b, _, hash_b) in zip(ordered, ordered[1:]):
+                same_scene = bisect.bisect_right(scene_starts, ts_a) == bisect.bisect_right(scene_starts, ts_b)
+                if (
+                    same_scene
+                    and ts_b - ts_a >= 2 * ADAPTIVE_MIN_GAP_S
+                    and frame_metrics.hamming(hash_a, hash_b) > change_distance
+                ):
+                    refine.append(round((ts_a + ts_b) / 2, 3))
+            before = len(samples)
+            decode(refine)
+            if len(samples) == before:
+                break
+    finally:
+        capture.release()
+
+    batcher = frame_metrics.MetricsBatcher()
+    ordered_indices = sorted(samples, key=lambda idx: samples[idx][0])
+    for frame_index in ordered_indices:
+        batcher.add(samples[frame_index][1])
+    frames: List[Dict[str, object]] = []
+    for position, (frame_index, metrics) in enumerate(zip(ordered_indices, batcher.results())):
+        ts, _, frame_hash = samples[frame_index]
+        frames.append(
+            {
+                "frame_id": f"frame_{position:05d}",
+                "ts": round(ts, 3),
+                "path": None,
+                "frame_index": frame_index,
+                "metrics": metrics,
+                "dhash": frame_hash,
+            }
+        )
+    return frames
+
+
+def _compute_frame_metrics(image_path: str) -> Dict[str, float]:
+    return frame_metrics.metrics_for_paths([image_path])[0]
+
+
+def _normalize(values: Sequence[float]) -> np.ndarray:
+    values = np.asarray(values, dtype=np.float64)
+    if not values.size:
         return values
-    min_v = min(values)
-    max_v = max(values)
+    min_v = float(values.min())
+    max_v = float(values.max())
     if math.isclose(max_v, min_v):
-        return [0.0 for _ in values]
-    span = max_v - min_v
-    return [(v - min_v) / span for v in values]
+        return np.zeros_like(values)
+    return (values - min_v) / (max_v - min_v)
+
+
+def _near_duplicates(hashes: Sequence[int | None], scores: np.ndarray, max_distance: int) -> Dict[int, int]:
+    """按 dHash 汉明距离聚类，返回 {被去重帧下标: 保留帧下标}；max_distance < 0 时不去重"""
+    if max_distance < 0:
+        return {}
+    leaders = frame_metrics.HashIndex(max_distance)
+    duplicates: Dict[int, int] = {}
+    # 按得分从高到低贪心聚类，簇首即簇内最优帧；稳定排序保证同分帧按时间先后处理
+    for idx in np.argsort(-scores, kind="stable").tolist():
+        frame_hash = hashes[idx]
+        if frame_hash is None:
+            continue
+        leader = leaders.find(int(frame_hash))
+        if leader is None:
+            leaders.add(idx, int(frame_hash))
+        else:
+            duplicates[idx] = leader
+    return duplicates
+
+
+def _scene_indices(ts: np.ndarray, scenes: Sequence[Dict[str, float]]) -> List[int | None]:
+    """每帧所属镜头下标（落在两个镜头交界处的帧归前一个镜头），不在任何镜头内为 None"""
+    starts = np.array([float(scene["start"]) for scene in scenes])
+    ends = np.array([float(scene["end"]) for scene in scenes])
+    candidate = np.minimum(np.searchsorted(ends, ts, side="left"), len(scenes) - 1)
+    inside = (starts[candidate] <= ts) & (ts <= ends[candidate])
+    return [int(idx) if ok else None for idx, ok in zip(candidate.tolist(), inside.tolist())]
+
+
+def _nearest(sorted_values: List[float], target: float) -> int:
+    """有序列表中最接近 target 的位置，距离相同取最靠前的一个"""
+    pos = bisect.bisect_left(sorted_values, target)
+    if pos == len(sorted_values) or (pos > 0 and target - sorted_values[pos - 1] <= sorted_values[pos] - target):
+        pos = bisect.bisect_left(sorted_values, sorted_values[pos - 1])
+    return pos
 
 
 def select_keyframes(
@@ -155,8 +677,13 @@ def select_keyframes(
     frames: List[Dict[str, object]],
     k: int = 9,
     budget: int = 15,
+    video_path: str | None = None,
 ) -> Dict[str, List[Dict[str, object]]]:
-    """根据镜头和启发式 + 轻问答筛选关键帧"""
+    """根据镜头和启发式 + 轻问答筛选关键帧
+
+    ``frames`` 可直接来自 ``analyze_video``（已带 metrics、未落盘），此时需传入 ``video_path``，
+    只有送入轻问答的候选帧才会写成 JPEG。筛选全程基于下标数组，只有输出的帧才会复制成新的 dict。
+    """
 
     if k <= 0:
         raise ValueError("k must be greater than 0")
@@ -166,82 +693,92 @@ def select_keyframes(
     if not frames:
         return {"chosen": [], "rejected": []}
 
-    sorted_frames = [dict(frame) for frame in sorted(frames, key=lambda item: float(item.get("ts", 0.0)))]
+    sorted_frames = sorted(frames, key=lambda item: float(item.get("ts", 0.0)))
+    count = len(sorted_frames)
+    ts_values = [float(frame.get("ts", 0.0)) for frame in sorted_frames]
 
     if not scenes:
-        last_ts = float(sorted_frames[-1]["ts"])
-        scenes = [{"start": 0.0, "end": last_ts}]
-
-    # 预处理场景索引
-    frame_to_scene: Dict[int | None, List[Dict[str, object]]] = defaultdict(list)
+        scenes = [{"start": 0.0, "end": ts_values[-1]}]
     scene_boundaries = sorted(scenes, key=lambda s: s["start"])
-    scene_idx = 0
-    for frame in sorted_frames:
-        ts = float(frame.get("ts", 0.0))
-        while scene_idx + 1 < len(scene_boundaries) and ts > scene_boundaries[scene_idx]["end"]:
-            scene_idx += 1
-        if (
-            scene_idx < len(scene_boundaries)
-            and scene_boundaries[scene_idx]["start"] <= ts <= scene_boundaries[scene_idx]["end"]
-        ):
-            frame["scene_index"] = scene_idx
-            frame_to_scene[scene_idx].append(frame)
-        else:
-            frame["scene_index"] = None
-            frame_to_scene[None].append(frame)
-
-    # 计算启发式指标
-    clarity_values: List[float] = []
-    entropy_values: List[float] = []
-    edge_values: List[float] = []
-    for frame in sorted_frames:
-        metrics = _compute_frame_metrics(frame["path"])
-        frame["metrics"] = metrics
-        clarity_values.append(metrics["clarity"])
-        entropy_values.append(metrics["entropy"])
-        edge_values.append(metrics["edge_density"])
-
-    clarity_norm = _normalize(clarity_values)
-    entropy_norm = _normalize(entropy_values)
-    edge_norm = _normalize(edge_values)
-
-    for frame, c, e, ed in zip(sorted_frames, clarity_norm, entropy_norm, edge_norm):
-        frame["score"] = 0.5 * c + 0.3 * e + 0.2 * ed
-
-    # 阶段 A：场景中位帧
-    median_candidates: List[Dict[str, object]] = []
-    for idx, scene in enumerate(scene_boundaries):
-        frames_in_scene = frame_to_scene.get(idx, [])
-        if not frames_in_scene:
-            continue
-        mid_ts = (scene["start"] + scene["end"]) / 2
-        median_candidates.append(
-            min(frames_in_scene, key=lambda f: abs(float(f.get("ts", 0.0)) - mid_ts))
-        )
-
-    # 阶段 A：启发式 Top-N
-    max_candidates = min(len(sorted_frames), max(k, budget * 2))
-    heuristic_sorted = sorted(sorted_frames, key=lambda item: item["score"], reverse=True)
-
-    candidate_pool: List[Dict[str, object]] = []
-    seen_ids = set()
-
-    for frame in median_candidates:
-        if frame["frame_id"] not in seen_ids:
-            candidate_pool.append(frame)
-            seen_ids.add(frame["frame_id"])
+    scene_of = _scene_indices(np.asarray(ts_values), scene_boundaries)
+
+    # 计算启发式指标（未带 metrics 的帧按批读取、降采样后统一计算）
+    metrics = [frame.get("metrics") for frame in sorted_frames]
+    hashes: List[int | None] = [frame.get("dhash") for frame in sorted_frames]
+    unscored = [idx for idx in range(count) if not metrics[idx]]
+    computed_hashes: Dict[int, int | None] = {}
+    if unscored:
+        scored, new_hashes = frame_metrics.score_paths([sorted_frames[idx]["path"] for idx in unscored])
+        for idx, frame_scores, frame_hash in zip(unscored, scored, new_hashes):
+            metrics[idx] = frame_scores
+            if "dhash" not in sorted_frames[idx]:
+                computed_hashes[idx] = frame_hash
+                hashes[idx] = frame_hash
+
+    scores = (
+        0.5 * _normalize([item["clarity"] for item in metrics])
+        + 0.3 * _normalize([item["entropy"] for item in metrics])
+        + 0.2 * _normalize([item["edge_density"] for item in metrics])
+        # 本地文字可能性：招牌/价目表类画面无需消耗 VL 预算即可进入候选池（旧缓存中无该字段时按 0 计）
+        + _float_from_env("KEYFRAME_TEXT_WEIGHT", DEFAULT_TEXT_WEIGHT)
+        * _normalize([item.get("text_score", 0.0) for item in metrics])
+    )
 
-    for frame in heuristic_sorted:
-        if frame["frame_id"] in seen_ids:
+    def annotated(idx: int, **extra: object) -> Dict[str, object]:
+        entry = {**sorted_frames[idx], "metrics": metrics[idx], **extra}
+        if idx in computed_hashes:
+            entry["dhash"] = computed_hashes[idx]
+        entry["scene_index"] = scene_of[idx]
+        entry["score"] = float(scores[idx])
+        return entry
+
+    # 阶段 A：感知哈希去重，每个近重复簇只保留得分最高的一帧。静态或慢速画面去重后可能不足 k 帧，
+    # 此时逐步收紧汉明距离阈值；仍不够再按得分回填近重复帧，直到凑满 k 帧或用完全部帧
+    target = min(k, count)
+    distance = _int_from_env("KEYFRAME_DEDUP_DISTANCE", DEFAULT_DEDUP_DISTANCE)
+    duplicates = _near_duplicates(hashes, scores, distance)
+    while count - len(duplicates) < target and distance > 0:
+        distance -= 1
+        duplicates = _near_duplicates(hashes, scores, distance)
+    shortfall = target - (count - len(duplicates))
+    for idx in heapq.nlargest(shortfall, duplicates, key=scores.__getitem__) if shortfall > 0 else []:
+        del duplicates[idx]
+    eligible = [idx for idx in range(count) if idx not in duplicates]
+
+    # 阶段 A：场景中位帧（每个镜头内对时间戳二分查找）
+    scene_members: Dict[int, List[int]] = defaultdict(list)
+    for idx in eligible:
+        if scene_of[idx] is not None:
+            scene_members[scene_of[idx]].append(idx)
+    median_candidates: List[int] = []
+    for scene_idx, scene in enumerate(scene_boundaries):
+        members = scene_members.get(scene_idx)
+        if not members:
             continue
-        candidate_pool.append(frame)
-        seen_ids.add(frame["frame_id"])
-        if len(candidate_pool) >= max_candidates:
-            break
+        mid_ts = (scene["start"] + scene["end"]) / 2
+        median_candidates.append(members[_nearest([ts_values[idx] for idx in members], mid_ts)])
+
+    # 阶段 A：中位帧优先，再用启发式 Top-N 补足轻问答预算
+    pool_size = min(budget, len(eligible))
+    pool = median_candidates[:pool_size]
+    in_pool = set(pool)
+    if len(pool) < pool_size:
+        for idx in heapq.nlargest(pool_size, eligible, key=scores.__getitem__):
+            if idx in in_pool:
+                continue
+            pool.append(idx)
+            in_pool.add(idx)
+            if len(pool) >= pool_size:
+                break
 
     # 阶段 B：轻问答筛选
-    vlm_budget = min(budget, len(candidate_pool))
-    candidate_pool = candidate_pool[:vlm_budget]
+    candidate_pool = [annotated(idx) for idx in pool]
+    if video_path and any(not frame.get("path") for frame in candidate_pool):
+        write_frame_images(video_path, candidate_pool)
+        kept = [(idx, frame) for idx, frame in zip(pool, candidate_pool) if frame.get("path")]
+        pool = [idx for idx, _ in kept]
+        candidate_pool = [frame for _, frame in kept]
+        in_pool = set(pool)
 
     try:
         from . import visual_extractor
@@ -262,6 +799,7 @@ def select_keyframes(
                 "has_readable_text": None,
                 "representativeness": None,
                 "brief": "",
+                "vlm_error": "missing from light_rank results",
             },
         )
 
@@ -277,39 +815,46 @@ def select_keyframes(
             vlm_score += 0.2
         frame["final_score"] = 0.6 * frame.get("score", 0.0) + vlm_score
 
-    ranked_candidates = sorted(candidate_pool, key=lambda item: item.get("final_score", 0.0), reverse=True)
+    ranked = sorted(
+        range(len(candidate_pool)), key=lambda pos: candidate_pool[pos].get("final_score", 0.0), reverse=True
+    )
 
-    chosen: List[Dict[str, object]] = []
+    chosen: List[int] = []
+    chosen_set = set()
     used_scene = set()
-    for frame in ranked_candidates:
-        scene_idx = frame.get("scene_index")
+    for pos in ranked:
+        scene_idx = candidate_pool[pos].get("scene_index")
         if scene_idx is not None and scene_idx not in used_scene:
-            chosen.append(frame)
+            chosen.append(pos)
+            chosen_set.add(pos)
             used_scene.add(scene_idx)
         if len(chosen) >= k:
             break
 
     if len(chosen) < k:
-        for frame in ranked_candidates:
-            if frame in chosen:
+        for pos in ranked:
+            if pos in chosen_set:
                 continue
-            chosen.append(frame)
+            chosen.append(pos)
+            chosen_set.add(pos)
             if len(chosen) >= k:
                 break
 
-    chosen_ids = {frame["frame_id"] for frame in chosen}
     rejected: List[Dict[str, object]] = []
-    for frame in ranked_candidates:
-        if frame["frame_id"] in chosen_ids:
-            continue
-        rejected.append({**frame, "reason": "lower_score"})
+    for pos in ranked:
+        if pos not in chosen_set:
+            rejected.append({**candidate_pool[pos], "reason": "lower_score"})
 
-    if len(candidate_pool) < len(sorted_frames):
-        skipped = [frame for frame in sorted_frames if frame["frame_id"] not in {f["frame_id"] for f in candidate_pool}]
-        for frame in skipped:
-            rejected.append({**frame, "reason": "not_sent_to_vlm"})
+    for idx in range(count):
+        if idx in in_pool:
+            continue
+        if idx in duplicates:
+            leader_id = sorted_frames[duplicates[idx]]["frame_id"]
+            rejected.append(annotated(idx, reason="near_duplicate", duplicate_of=leader_id))
+        else:
+            rejected.append(annotated(idx, reason="not_sent_to_vlm"))
 
     return {
-        "chosen": chosen[:k],
+        "chosen": [candidate_pool[pos] for pos in chosen[:k]],
         "rejected": rejected,
     }
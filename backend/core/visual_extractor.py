@@ -1,11 +1,16 @@
 from __future__ import annotations
 
+import asyncio
+import contextlib
+import hashlib
 import json
 import logging
 import os
 import re
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
-from typing import Any, Dict, List
+from typing import Any, Dict, List, Optional, Sequence
 
 from shared import iflow_api
 
@@ -26,6 +31,29 @@ def _timeout_from_env(name: str, default: float) -> float:
 
 
 VISION_TIMEOUT_S = _timeout_from_env("VISION_TIMEOUT_S", 45.0)
+DEFAULT_LIGHT_RANK_CHUNK = 8
+DEFAULT_VISUAL_BATCH_SIZE = 1
+
+_FRAME_CACHE_DIR = Path(iflow_api.get_runtime_config()["cache_dir"]) / "visual_frames"
+_FRAME_CACHE_VERSION = 1
+
+
+def _bool_from_env(name: str, default: bool) -> bool:
+    value = os.getenv(name)
+    if value is None:
+        return default
+    return value.strip().lower() in {"1", "true", "yes", "on"}
+
+
+def _int_from_env(name: str, default: int) -> int:
+    value = os.getenv(name)
+    if value is None:
+        return default
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        LOGGER.warning("Invalid integer for %s=%s, using default %d", name, value, default)
+        return default
 
 
 def _call_iflow(messages: List[Dict], image_paths: List[str]) -> Any:
@@ -91,16 +119,43 @@ def _extract_json_object(text: str) -> Dict[str, Any]:
     return {}
 
 
-def _parse_content_to_dict(content: Any) -> Dict[str, Any]:
+def _extract_json_array(text: str) -> Optional[List[Any]]:
+    text = text.strip()
+    if not text:
+        return None
+
+    decoder = json.JSONDecoder()
+    for match in re.finditer(r"\[", text):
+        try:
+            obj, _ = decoder.raw_decode(text[match.start() :])
+        except json.JSONDecodeError:
+            continue
+        if isinstance(obj, list):
+            return obj
+
+    LOGGER.debug("Failed to extract JSON array from: %s", text)
+    return None
+
+
+def _content_text(content: Any) -> str:
     if isinstance(content, list):
-        text = "".join(part.get("text", "") for part in content)
-    else:
-        text = str(content)
+        return "".join(part.get("text", "") for part in content)
+    return str(content)
+
 
-    parsed = _extract_json_object(text)
+def _parse_content_to_dict(content: Any) -> Dict[str, Any]:
+    parsed = _extract_json_object(_content_text(content))
     if not parsed:
         return {}
+    return _normalize_visual(parsed)
+
+
+def _has_visual_keys(parsed: Dict[str, Any]) -> bool:
+    return any(raw_key in _VISUAL_KEY_ALIASES or raw_key in _VISUAL_SCHEMA for raw_key in parsed)
+
 
+def _normalize_visual(parsed: Dict[str, Any]) -> Dict[str, Any]:
+    """把模型返回的 JSON 对象（别名、字符串列表等）规整为 ``_VISUAL_SCHEMA`` 的字段"""
     normalized: Dict[str, Any] = {}
     for raw_key, value in parsed.items():
         alias = _VISUAL_KEY_ALIASES.get(raw_key, raw_key if raw_key in _VISUAL_SCHEMA else None)
@@ -145,11 +200,30 @@ def _parse_content_to_dict(content: Any) -> Dict[str, Any]:
     return result
 
 
-def light_rank(image_paths: List[str]) -> List[Dict]:
-    """对候选帧进行轻量问答筛选"""
+def _empty_rank(path: str, full_schema: bool = False, error: Optional[str] = None) -> Dict:
+    """没有可用评分的占位结果；``error`` 记录请求失败或响应缺失的原因，调用方据此判断结果是否可缓存"""
+    item = {"path": path, "has_landmark": None, "has_readable_text": None, "representativeness": None, "brief": ""}
+    if full_schema:
+        item["visual"] = None
+    if error is not None:
+        item["vlm_error"] = error
+    return item
+
+
+_LIGHT_RANK_FULL_SCHEMA_PROMPT = (
+    " Also include the keys place (string or null), activities (array of strings), objects (array of strings), "
+    "mood (string or null) and visible_text (string or null, listing readable numbers or words) "
+    "describing only what is visible; use null (or [] for arrays) when unsure "
+    "and do not guess cities, prices, or hidden details."
+)
 
-    if not image_paths:
-        return []
+
+def _light_rank_chunk(image_paths: List[str], full_schema: bool = False) -> List[Dict]:
+    """一次请求评估一块候选帧；响应无法解析时只影响本块
+
+    ``full_schema`` 为 True 时同时收集完整视觉字段，放在每项的 ``visual`` 中（无可用字段时为 None）。
+    响应中缺失或无法解析的帧返回带 ``vlm_error`` 的占位结果。
+    """
 
     contents: List[Dict] = [
         {
@@ -164,7 +238,8 @@ def light_rank(image_paths: List[str]) -> List[Dict]:
                 "representativeness should be a number between 0 and 1 reflecting how well the frame summarizes the scene. "
                 "brief should be a concise Chinese phrase mentioning key objects or actions and extract explicit keywords such as ¥, 元, 门票, 开放时间, 站, 出口, 博物馆 when visible. "
                 "Do not guess the city or location unless text explicitly states it."
-            ),
+            )
+            + (_LIGHT_RANK_FULL_SCHEMA_PROMPT if full_schema else ""),
         }
     ]
 
@@ -186,36 +261,74 @@ def light_rank(image_paths: List[str]) -> List[Dict]:
         },
     ]
 
-    content = _call_iflow(messages, resolved_paths)
-
-    if isinstance(content, list):
-        text = "".join(part.get("text", "") for part in content)
-    else:
-        text = str(content)
-
-    text = text.strip()
-    try:
-        parsed = json.loads(text)
-    except json.JSONDecodeError:
+    text = _content_text(_call_iflow(messages, resolved_paths))
+    parsed = _extract_json_array(text)
+    if parsed is None:
         LOGGER.error("Failed to parse light_rank JSON response: %s", text)
         parsed = []
 
     results: List[Dict] = []
     for idx, path in enumerate(image_paths):
-        data = parsed[idx] if idx < len(parsed) and isinstance(parsed[idx], dict) else {}
-        results.append(
-            {
-                "path": path,
-                "has_landmark": data.get("has_landmark"),
-                "has_readable_text": data.get("has_readable_text"),
-                "representativeness": data.get("representativeness"),
-                "brief": data.get("brief", ""),
-            }
-        )
+        if idx >= len(parsed) or not isinstance(parsed[idx], dict):
+            error = "missing from light_rank response" if parsed else "unparseable light_rank response"
+            results.append(_empty_rank(path, full_schema, error))
+            continue
+        data = parsed[idx]
+        item = {
+            "path": path,
+            "has_landmark": data.get("has_landmark"),
+            "has_readable_text": data.get("has_readable_text"),
+            "representativeness": data.get("representativeness"),
+            "brief": data.get("brief", ""),
+        }
+        if full_schema:
+            item["visual"] = _normalize_visual(data) if _has_visual_keys(data) else None
+        results.append(item)
 
     return results
 
 
+def light_rank(
+    image_paths: List[str],
+    chunk_size: Optional[int] = None,
+    full_schema: Optional[bool] = None,
+) -> List[Dict]:
+    """对候选帧进行轻量问答筛选
+
+    候选帧按 ``chunk_size``（默认 ``LIGHT_RANK_CHUNK_SIZE``）分块并发请求，每块是独立的请求、独立命中缓存，
+    结果按输入顺序合并；某一块失败只会让该块的帧没有评分（占位结果带 ``vlm_error``），全部失败时才抛出异常。
+    ``full_schema``（默认 ``LIGHT_RANK_FULL_SCHEMA``）为 True 时顺带收集完整视觉字段（``visual``），
+    ``extract_visual_facts`` 可直接复用，入选帧无需再做第二次视觉请求。
+    """
+
+    if not image_paths:
+        return []
+
+    if full_schema is None:
+        full_schema = _bool_from_env("LIGHT_RANK_FULL_SCHEMA", False)
+    chunk_size = chunk_size or _int_from_env("LIGHT_RANK_CHUNK_SIZE", DEFAULT_LIGHT_RANK_CHUNK)
+    chunk_size = max(1, chunk_size)
+    chunks = [list(image_paths[start : start + chunk_size]) for start in range(0, len(image_paths), chunk_size)]
+    if len(chunks) == 1:
+        return _light_rank_chunk(chunks[0], full_schema)
+
+    parts: List[List[Dict]] = []
+    errors: List[Exception] = []
+    # A local pool only fans the chunks out; iflow_api's own executor still caps concurrent requests.
+    with ThreadPoolExecutor(max_workers=min(len(chunks), iflow_api.MAX_WORKERS)) as executor:
+        futures = [executor.submit(_light_rank_chunk, chunk, full_schema) for chunk in chunks]
+        for idx, (chunk, future) in enumerate(zip(chunks, futures), start=1):
+            try:
+                parts.append(future.result())
+            except Exception as exc:  # noqa: BLE001
+                LOGGER.error("light_rank chunk %d/%d failed: %s", idx, len(chunks), exc)
+                errors.append(exc)
+                parts.append([_empty_rank(path, full_schema, str(exc)) for path in chunk])
+    if len(errors) == len(chunks):
+        raise errors[0]
+    return [item for part in parts for item in part]
+
+
 def analyze_frame(image_path: str) -> Dict:
     """调用 iFlow Qwen3-VL-Plus 模型，识别图片中的地点、活动、物体、情绪、可读文字，返回 JSON 字典"""
     image_path_str = str(Path(image_path).expanduser().resolve())
@@ -259,12 +372,247 @@ def analyze_frame(image_path: str) -> Dict:
     return {key: (value.copy() if isinstance(value, list) else value) for key, value in _VISUAL_SCHEMA.items()}
 
 
-def extract_visual_facts(frame_paths: List[str]) -> List[Dict]:
-    """对多帧调用 analyze_frame，返回列表形式 JSON 结果"""
-    results: List[Dict] = []
-    for frame_path in frame_paths:
+def _frame_number(entry: Dict[str, Any]) -> Optional[int]:
+    try:
+        return int(entry["frame"])
+    except (KeyError, TypeError, ValueError):
+        return None
+
+
+def analyze_frames_batch(image_paths: List[str]) -> List[Optional[Dict]]:
+    """一次请求分析多帧，返回与输入对齐的结果列表；模型未给出或无法解析的帧为 None
+
+    要求模型返回按帧序号（``frame``，从 1 开始）标注的 JSON 数组，每一项按 ``_normalize_visual`` 规整。
+    序号缺失、重复或超出 1..N 时不信任序号，改按数组位置对齐并记录警告。
+    """
+    resolved_paths = [str(Path(image_path).expanduser().resolve()) for image_path in image_paths]
+    contents: List[Dict] = [
+        {
+            "type": "input_text",
+            "text": (
+                f"Analyze each of the following {len(resolved_paths)} frames separately, "
+                "strictly based on visible evidence. List readable numbers or words in visible_text. "
+                "If any field is missing, set it to null (or [] for arrays)."
+            ),
+        }
+    ]
+    for idx, image_path_str in enumerate(resolved_paths, start=1):
+        contents.append({"type": "input_text", "text": f"Frame {idx}:"})
+        contents.append({"type": "input_image", "image_path": image_path_str})
+
+    messages = [
+        {
+            "role": "system",
+            "content": (
+                "You are a precise vision analyst for travel videos. Only describe what is visible in each image. "
+                "Respond strictly with a JSON array containing one object per frame, each with keys: "
+                "frame (the frame number), place (string or null), activities (array of strings), "
+                "objects (array of strings), mood (string or null), visible_text (string or null). "
+                "If unsure, use null and do not guess cities, prices, or hidden details."
+            ),
+        },
+        {
+            "role": "user",
+            "content": contents,
+        },
+    ]
+
+    text = _content_text(_call_iflow(messages, resolved_paths))
+    parsed = _extract_json_array(text)
+    if parsed is None:
+        LOGGER.warning("Batched visual extraction returned no JSON array: %s", text)
+        parsed = []
+
+    entries = [(position, entry) for position, entry in enumerate(parsed, start=1) if isinstance(entry, dict)]
+    numbers = [_frame_number(entry) for _, entry in entries]
+    in_range = all(number is not None and 1 <= number <= len(resolved_paths) for number in numbers)
+    if in_range and len(set(numbers)) == len(numbers):
+        by_frame = {number: entry for number, (_, entry) in zip(numbers, entries)}
+    else:
+        # 0 起编号、重复或越界的序号会把结果挂到错误的帧上，此时退回按数组位置对齐
+        LOGGER.warning(
+            "Batched visual extraction returned frame numbers %s for %d frames; matching by position",
+            numbers,
+            len(resolved_paths),
+        )
+        by_frame = dict(entries)
+
+    results: List[Optional[Dict]] = []
+    for idx in range(1, len(resolved_paths) + 1):
+        entry = by_frame.get(idx)
+        results.append(_normalize_visual(entry) if entry is not None and _has_visual_keys(entry) else None)
+    return results
+
+
+def _frame_cache_key(image_path: str) -> Optional[str]:
+    """Hash of the image bytes, model and upload preprocessing; a frame hits no matter which batch it was sent in."""
+    try:
+        digest = hashlib.sha256(Path(image_path).expanduser().read_bytes())
+    except OSError:
+        return None
+    options = json.dumps(iflow_api.image_options(), sort_keys=True)
+    digest.update(f"{IFLOW_MODEL_VISION}:{_FRAME_CACHE_VERSION}:{options}".encode("utf-8"))
+    return digest.hexdigest()
+
+
+def _load_frame_cache(cache_key: str) -> Optional[Dict]:
+    path = _FRAME_CACHE_DIR / f"{cache_key}.json"
+    if not path.exists():
+        return None
+    try:
+        with path.open("r", encoding="utf-8") as cache_file:
+            return json.load(cache_file)["visual"]
+    except Exception as exc:  # noqa: BLE001
+        LOGGER.warning("Failed to read visual frame cache %s: %s", path, exc)
+        return None
+
+
+def _store_frame_cache(cache_key: str, visual: Dict) -> None:
+    path = _FRAME_CACHE_DIR / f"{cache_key}.json"
+    temp_path = path.with_suffix(f".{threading.get_ident()}.tmp")
+    try:
+        _FRAME_CACHE_DIR.mkdir(parents=True, exist_ok=True)
+        with temp_path.open("w", encoding="utf-8") as cache_file:
+            json.dump({"visual": visual}, cache_file, ensure_ascii=False)
+        os.replace(temp_path, path)
+    except Exception as exc:  # noqa: BLE001
+        LOGGER.warning("Failed to write visual frame cache %s: %s", path, exc)
+        with contextlib.suppress(FileNotFoundError):
+            temp_path.unlink()
+
+
+def clear_frame_cache() -> int:
+    """删除按帧缓存的视觉结果，返回删除的文件数"""
+    removed = 0
+    for path in _FRAME_CACHE_DIR.glob("*.json"):
+        with contextlib.suppress(FileNotFoundError):
+            path.unlink()
+            removed += 1
+    return removed
+
+
+def _visual_workers(frame_count: int, max_workers: Optional[int]) -> int:
+    return max(1, min(frame_count, max_workers or iflow_api.MAX_WORKERS))
+
+
+def extract_visual_facts(
+    frame_paths: List[str],
+    max_workers: Optional[int] = None,
+    batch_size: Optional[int] = None,
+    prefetched: Optional[Sequence[Optional[Dict]]] = None,
+    keep_failed: bool = False,
+) -> List[Optional[Dict]]:
+    """对多帧并发调用 analyze_frame，按输入顺序返回列表形式 JSON 结果
+
+    并发数默认等于 iFlow 的 ``MAX_WORKERS``；单帧失败只记录日志并从结果中略去，不影响其他帧。
+    ``batch_size``（默认 ``VISUAL_BATCH_SIZE``）大于 1 时改为每个请求分析多帧，见 ``_extract_batched``。
+    ``prefetched`` 与 ``frame_paths`` 一一对应（如 light_rank 开启完整字段时得到的 ``visual``），
+    已有结果的帧直接复用，只有为 None 的帧才会请求 VLM。
+    ``keep_failed`` 为 True 时失败的帧保留为 None，结果与 ``frame_paths`` 一一对应。
+    """
+    if not frame_paths:
+        return []
+
+    outcomes: List[Optional[Dict]] = [None] * len(frame_paths)
+    if prefetched is not None:
+        for idx, visual in enumerate(prefetched[: len(frame_paths)]):
+            outcomes[idx] = visual or None
+    pending = [idx for idx, visual in enumerate(outcomes) if visual is None]
+    if len(pending) < len(frame_paths):
+        LOGGER.info(
+            "Reusing prefetched visual facts for %d of %d frames", len(frame_paths) - len(pending), len(frame_paths)
+        )
+
+    if pending:
+        pending_paths = [frame_paths[idx] for idx in pending]
+        batch_size = batch_size or _int_from_env("VISUAL_BATCH_SIZE", DEFAULT_VISUAL_BATCH_SIZE)
+        if batch_size > 1:
+            analyzed = _extract_batched(pending_paths, batch_size, max_workers)
+        else:
+            analyzed = _analyze_each(pending_paths, max_workers)
+        for idx, visual in zip(pending, analyzed):
+            outcomes[idx] = visual
+
+    if keep_failed:
+        return outcomes
+    return [visual for visual in outcomes if visual is not None]
+
+
+def _analyze_each(frame_paths: List[str], max_workers: Optional[int]) -> List[Optional[Dict]]:
+    """逐帧并发调用 analyze_frame，结果与输入对齐，失败的帧为 None"""
+    with ThreadPoolExecutor(max_workers=_visual_workers(len(frame_paths), max_workers)) as executor:
+        futures = [executor.submit(analyze_frame, frame_path) for frame_path in frame_paths]
+
+    results: List[Optional[Dict]] = []
+    for frame_path, future in zip(frame_paths, futures):
         try:
-            results.append(analyze_frame(frame_path))
+            results.append(future.result())
         except Exception as exc:  # noqa: BLE001
             LOGGER.error("Failed to analyze frame %s: %s", frame_path, exc)
+            results.append(None)
+    return results
+
+
+def _extract_batched(frame_paths: List[str], batch_size: int, max_workers: Optional[int]) -> List[Optional[Dict]]:
+    """按帧缓存 → 多帧批量请求 → 批量结果中缺失或无法解析的帧逐帧回退调用 analyze_frame
+
+    返回结果与输入对齐，仍然失败的帧为 None。
+    """
+    outcomes: List[Optional[Dict]] = [None] * len(frame_paths)
+    cache_keys = [_frame_cache_key(frame_path) for frame_path in frame_paths]
+    pending: List[int] = []
+    for idx, cache_key in enumerate(cache_keys):
+        cached = _load_frame_cache(cache_key) if cache_key else None
+        if cached is not None:
+            outcomes[idx] = cached
+        else:
+            pending.append(idx)
+
+    batches = [pending[start : start + batch_size] for start in range(0, len(pending), batch_size)]
+    if batches:
+        with ThreadPoolExecutor(max_workers=_visual_workers(len(batches), max_workers)) as executor:
+            futures = [
+                executor.submit(analyze_frames_batch, [frame_paths[idx] for idx in batch]) for batch in batches
+            ]
+        for batch, future in zip(batches, futures):
+            try:
+                batch_results = future.result()
+            except Exception as exc:  # noqa: BLE001
+                LOGGER.error("Batched visual extraction failed for %d frames: %s", len(batch), exc)
+                continue
+            for idx, visual in zip(batch, batch_results):
+                if visual is None:
+                    continue
+                outcomes[idx] = visual
+                if cache_keys[idx]:
+                    _store_frame_cache(cache_keys[idx], visual)
+
+    fallback = [idx for idx in pending if outcomes[idx] is None]
+    if fallback:
+        LOGGER.info("Falling back to single-frame analysis for %d frames", len(fallback))
+        analyzed = _analyze_each([frame_paths[idx] for idx in fallback], max_workers)
+        for idx, visual in zip(fallback, analyzed):
+            outcomes[idx] = visual
+
+    return outcomes
+
+
+async def extract_visual_facts_async(frame_paths: List[str], max_workers: Optional[int] = None) -> List[Dict]:
+    """``extract_visual_facts`` 的 asyncio 版本：阻塞的 iFlow 调用在线程中执行，结果与失败处理相同"""
+    if not frame_paths:
+        return []
+
+    semaphore = asyncio.Semaphore(_visual_workers(len(frame_paths), max_workers))
+
+    async def analyze(frame_path: str) -> Dict:
+        async with semaphore:
+            return await asyncio.to_thread(analyze_frame, frame_path)
+
+    outcomes = await asyncio.gather(*(analyze(frame_path) for frame_path in frame_paths), return_exceptions=True)
+    results: List[Dict] = []
+    for frame_path, outcome in zip(frame_paths, outcomes):
+        if isinstance(outcome, Exception):
+            LOGGER.error("Failed to analyze frame %s: %s", frame_path, outcome)
+            continue
+        results.append(outcome)
     return results
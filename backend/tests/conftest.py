@@ -1,6 +1,15 @@
+import contextlib
 import sys
 import types
 
+# Prefer real numpy/cv2/scenedetect when installed so the lightweight stubs in test_asr only apply to bare environments.
+with contextlib.suppress(ImportError):
+    import numpy  # noqa: F401
+with contextlib.suppress(ImportError):
+    import cv2  # noqa: F401
+with contextlib.suppress(ImportError):
+    import scenedetect.detectors  # noqa: F401
+
 
 if "tenacity" not in sys.modules:
     class _RetryError(Exception):
@@ -0,0 +1,57 @@
+import os
+import sys
+import time
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).resolve().parents[2]))
+
+from backend.core.artifact_store import ArtifactStore
+
+
+def _write(directory: Path, name: str, size: int) -> Path:
+    path = directory / name
+    path.write_bytes(b"x" * size)
+    return path
+
+
+def test_store_evicts_least_recently_used_unpinned_files(tmp_path):
+    store = ArtifactStore(tmp_path / "store", max_bytes=300, min_age_s=0)
+    run = store.new_dir("clip_frames_")
+    first, second, third = (_write(run, f"frame_{idx}.jpg", 100) for idx in range(3))
+    store.add([first, second, third])
+    store.acquire([first])
+    store.touch([second])
+
+    fourth = _write(store.new_dir("clip_frames_"), "frame_3.jpg", 100)
+    store.add([fourth])
+
+    assert not third.exists()  # oldest unpinned file goes first
+    assert first.exists() and second.exists() and fourth.exists()
+    stats = store.stats()
+    assert stats["used_bytes"] == 300 and stats["files"] == 3
+    assert stats["pinned_files"] == 1 and stats["evictions"] == 1 and stats["evicted_bytes"] == 100
+
+    store.release([first])
+    fifth = _write(run, "frame_4.jpg", 100)
+    store.add([fifth])
+    assert not first.exists() and second.exists()
+
+    assert store.clear() == 3
+    assert list((tmp_path / "store").iterdir()) == []  # emptied run directories are removed too
+
+
+def test_store_protects_recent_files_and_adopts_leftovers(tmp_path):
+    root = tmp_path / "store"
+    leftover = _write(Path(ArtifactStore(root, max_bytes=10**6).new_dir("old_")), "audio.wav", 200)
+    os.utime(leftover, (time.time() - 3600, time.time() - 3600))
+
+    store = ArtifactStore(root, max_bytes=150, min_age_s=60)
+    assert store.stats()["used_bytes"] == 200
+
+    fresh = [_write(store.new_dir("new_"), f"frame_{idx}.jpg", 100) for idx in range(2)]
+    store.add(fresh)
+
+    assert not leftover.exists()
+    assert all(path.exists() for path in fresh)  # over quota, but a run in progress keeps its files
+    assert store.stats()["used_bytes"] == 200
+    assert store.clear() == 0 and all(path.exists() for path in fresh)  # clearing spares them as well
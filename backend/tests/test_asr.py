@@ -1,4 +1,5 @@
 import sys
+import threading
 import types
 from pathlib import Path
 
@@ -64,7 +65,7 @@ sys.modules.setdefault(
     types.SimpleNamespace(ContentDetector=lambda *args, **kwargs: object()),
 )
 
-from backend.core import asr
+from backend.core import asr, asr_backends
 
 
 def test_post_process_text_normalizes_punctuation():
@@ -73,25 +74,24 @@ def test_post_process_text_normalizes_punctuation():
     assert processed == "你好，世界！123。"
 
 
-def test_transcribe_prefers_whisper(monkeypatch, tmp_path):
-    audio_path = tmp_path / "audio.wav"
-    audio_path.write_bytes(b"fake")
+def test_transcribe_prefers_whisper(monkeypatch):
+    audio = [0.0] * 16
 
-    monkeypatch.setattr(asr, "extract_audio", lambda _: str(audio_path))
+    monkeypatch.setattr(asr, "decode_audio", lambda _: audio)
+    monkeypatch.setenv("ASR_VAD_ENABLE", "false")
     monkeypatch.setenv("WHISPER_ENABLE", "true")
     monkeypatch.setenv("ASR_TIMEOUT_S", "5")
     monkeypatch.setenv("ASR_SEGMENT_S", "40")
 
-    fake_module = object()
-    monkeypatch.setattr(asr, "_load_whisper", lambda: fake_module)
+    fake_backend = types.SimpleNamespace(name="fake")
+    monkeypatch.setattr(asr, "_select_local_backend", lambda: fake_backend)
 
     captured = {}
 
-    def fake_whisper(audio, module, segment_length):
-        captured["audio"] = audio
-        captured["module"] = module
-        captured["segment_length"] = segment_length
-        return [
+    def fake_local(windows, backend, deadline):
+        captured["windows"] = windows
+        captured["backend"] = backend
+        yield 0, [
             {
                 "start": 0.0,
                 "end": 1.0,
@@ -99,8 +99,8 @@ def test_transcribe_prefers_whisper(monkeypatch, tmp_path):
             }
         ]
 
-    monkeypatch.setattr(asr, "_transcribe_with_whisper", fake_whisper)
-    monkeypatch.setattr(asr, "_transcribe_with_iflow", lambda *args, **kwargs: pytest.fail("Fallback should not run"))
+    monkeypatch.setattr(asr, "_iter_local", fake_local)
+    monkeypatch.setattr(asr, "_iter_iflow", lambda *args, **kwargs: pytest.fail("Fallback should not run"))
 
     result = asr.transcribe("dummy.mp4")
 
@@ -112,17 +112,16 @@ def test_transcribe_prefers_whisper(monkeypatch, tmp_path):
         }
     ]
     assert captured == {
-        "audio": str(audio_path),
-        "module": fake_module,
-        "segment_length": 40.0,
+        "windows": [(0.0, 0.001, audio)],
+        "backend": fake_backend,
     }
 
 
-def test_transcribe_falls_back_to_iflow(monkeypatch, tmp_path):
-    audio_path = tmp_path / "audio.wav"
-    audio_path.write_bytes(b"fake")
+def test_transcribe_falls_back_to_iflow(monkeypatch):
+    audio = [0.0] * 16
 
-    monkeypatch.setattr(asr, "extract_audio", lambda _: str(audio_path))
+    monkeypatch.setattr(asr, "decode_audio", lambda _: audio)
+    monkeypatch.setenv("ASR_VAD_ENABLE", "false")
     monkeypatch.setenv("WHISPER_ENABLE", "false")
     monkeypatch.setenv("ASR_TIMEOUT_S", "7")
     monkeypatch.setenv("ASR_SEGMENT_S", "10")
@@ -137,20 +136,361 @@ def test_transcribe_falls_back_to_iflow(monkeypatch, tmp_path):
 
     captured = {}
 
-    def fake_iflow(audio, segment_length, timeout):
-        captured["audio"] = audio
-        captured["segment_length"] = segment_length
+    def fake_iflow(windows, timeout, deadline):
+        captured["windows"] = windows
         captured["timeout"] = timeout
-        return fallback_segments
+        yield 0, fallback_segments
 
-    monkeypatch.setattr(asr, "_load_whisper", lambda: None)
-    monkeypatch.setattr(asr, "_transcribe_with_iflow", fake_iflow)
+    monkeypatch.setattr(asr, "_select_local_backend", lambda: None)
+    monkeypatch.setattr(asr, "_iter_iflow", fake_iflow)
 
-    result = asr.transcribe("dummy.mp4")
+    stats = {}
+    result = asr.transcribe("dummy.mp4", stats=stats)
 
     assert result == fallback_segments
+    assert stats["partial"] is False
     assert captured == {
-        "audio": str(audio_path),
-        "segment_length": 30.0,
+        "windows": [(0.0, 0.001, audio)],
         "timeout": 7.0,
     }
+
+
+def test_split_audio_segments_slices_decoded_buffer(monkeypatch):
+    monkeypatch.setattr(asr, "AUDIO_SAMPLE_RATE", 10)
+    samples = list(range(700))  # 70 s at 10 Hz
+
+    windows = list(asr._split_audio_segments(samples, 30.0))
+
+    assert [(start, end) for start, end, _ in windows] == [(0.0, 30.0), (30.0, 60.0), (60.0, 70.0)]
+    assert windows[1][2][0] == 300 and len(windows[2][2]) == 100
+    assert list(asr._split_audio_segments([], 30.0)) == []
+
+
+def test_iflow_segments_run_concurrently_and_keep_order(monkeypatch):
+    windows = [
+        (0.0, 30.0, "seg0"),
+        (30.0, 60.0, "seg1"),
+        (60.0, 75.0, "seg2"),
+    ]
+    texts = {"seg0": "第一段。", "seg1": "", "seg2": "第三段。"}
+    barrier = threading.Barrier(len(windows), timeout=2)
+
+    def fake_call(payload, audio_format, timeout):
+        barrier.wait()  # every segment request is in flight at once
+        return texts[payload.decode()]
+
+    monkeypatch.setenv("ASR_CACHE_ENABLE", "false")
+    monkeypatch.setattr(asr, "_encode_iflow_audio", lambda samples: (samples.encode(), "mp3"))
+    monkeypatch.setattr(asr.iflow_api, "MAX_WORKERS", 4)
+    monkeypatch.setattr(asr, "_call_iflow_for_segment", fake_call)
+
+    results = list(asr._iter_iflow(windows, 5.0))
+
+    assert results == [
+        (0, [{"start": 0.0, "end": 30.0, "text": "第一段。"}]),
+        (1, []),
+        (2, [{"start": 60.0, "end": 75.0, "text": "第三段。"}]),
+    ]
+
+
+def test_transcribe_iter_streams_and_resumes_on_iflow(monkeypatch):
+    audio = list(range(40))
+    monkeypatch.setattr(asr, "AUDIO_SAMPLE_RATE", 1)
+    monkeypatch.setattr(asr, "decode_audio", lambda _: audio)
+    monkeypatch.setenv("ASR_VAD_ENABLE", "false")
+    monkeypatch.setenv("WHISPER_ENABLE", "true")
+    monkeypatch.setenv("ASR_SEGMENT_S", "30")
+    monkeypatch.setattr(asr, "_select_local_backend", lambda: types.SimpleNamespace(name="fake"))
+
+    def flaky_whisper(windows, backend, deadline):
+        start, end, _ = windows[0]
+        yield 0, [{"start": start, "end": 31.0, "text": "前半段。"}]
+        raise RuntimeError("whisper crashed")
+
+    captured = {}
+
+    def fake_iflow(windows, timeout, deadline):
+        captured["windows"] = [(start, end) for start, end, _ in windows]
+        yield 0, [{"start": 29.0, "end": 40.0, "text": "后半段。"}]
+
+    monkeypatch.setattr(asr, "_iter_local", flaky_whisper)
+    monkeypatch.setattr(asr, "_iter_iflow", fake_iflow)
+
+    stream = asr.transcribe_iter("dummy.mp4")
+    first = next(stream)
+
+    assert first == {"start": 0.0, "end": 31.0, "text": "前半段。"}
+    assert "windows" not in captured  # iFlow is only consulted once Whisper fails
+    assert list(stream) == [{"start": 31.0, "end": 40.0, "text": "后半段。"}]
+    assert captured["windows"] == [(30.0, 40.0)]
+
+
+def test_whisper_model_is_loaded_once_per_process(monkeypatch):
+    registry = asr_backends.model_registry.ModelRegistry()
+    monkeypatch.setattr(asr_backends.model_registry, "REGISTRY", registry)
+    monkeypatch.setattr(asr_backends, "_preferred_sizes", lambda: ("tiny", "small"))
+
+    loads = []
+    start_gate = threading.Event()
+
+    def load_model(size):
+        start_gate.wait(timeout=2)
+        loads.append(size)
+        if size == "tiny" and len(loads) == 1:
+            raise RuntimeError("download failed")
+        return object()
+
+    backend = asr_backends.OpenAIWhisperBackend(types.SimpleNamespace(load_model=load_model))
+    monkeypatch.setattr(asr, "_select_local_backend", lambda: backend)
+
+    handles = []
+    threads = [threading.Thread(target=lambda: handles.append(backend.load())) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    start_gate.set()
+    for thread in threads:
+        thread.join(timeout=2)
+
+    assert loads == ["tiny", "small"]  # tiny failed once, small loaded, no reloads afterwards
+    assert len({id(handle) for handle in handles}) == 1
+    stats = asr.whisper_stats()
+    assert stats["ready"] is True
+    assert stats["name"] == "small"
+    assert stats["hits"] == 4
+    assert stats["load_time_s"] >= 0.0
+
+
+def test_whisper_stats_does_not_import_the_backend(monkeypatch, tmp_path):
+    # An installed but heavy whisper package: importing it would pull in torch.
+    package = tmp_path / "whisper"
+    package.mkdir()
+    (package / "__init__.py").write_text("raise AssertionError('whisper imported')\n")
+    monkeypatch.syspath_prepend(str(tmp_path))
+    monkeypatch.delitem(sys.modules, "whisper", raising=False)
+    monkeypatch.setattr(asr_backends.model_registry, "REGISTRY", asr_backends.model_registry.ModelRegistry())
+    monkeypatch.setenv("WHISPER_BACKEND", "openai")
+    monkeypatch.delenv("WHISPER_ENABLE", raising=False)
+
+    assert asr.whisper_stats() == {}
+    assert isinstance(asr._select_local_backend(), asr_backends.OpenAIWhisperBackend)
+    assert "whisper" not in sys.modules
+
+
+def test_segment_cache_skips_model_for_repeated_audio(monkeypatch, tmp_path):
+    import numpy as np
+
+    monkeypatch.setattr(asr, "_SEGMENT_CACHE_DIR", tmp_path)
+    monkeypatch.setattr(asr_backends.model_registry, "REGISTRY", asr_backends.model_registry.ModelRegistry())
+    monkeypatch.setattr(asr_backends, "_preferred_sizes", lambda: ("tiny",))
+    monkeypatch.setenv("ASR_CACHE_ENABLE", "true")
+
+    calls = []
+
+    class FakeModel:
+        def transcribe(self, window, **kwargs):
+            calls.append(len(window))
+            return {"segments": [{"start": 0.5, "end": 2.0, "text": "你好"}]}
+
+    loads = []
+    backend = asr_backends.OpenAIWhisperBackend(
+        types.SimpleNamespace(load_model=lambda size: loads.append(size) or FakeModel())
+    )
+    clip = np.linspace(-0.5, 0.5, 48, dtype=np.float32)
+    audio = np.concatenate([clip, clip])
+
+    first = list(asr._iter_local([(0.0, 3.0, audio[:48])], backend))
+    # The same PCM re-submitted later in another upload hits the cache and keeps its own offset.
+    second = list(asr._iter_local([(10.0, 13.0, audio[48:])], backend))
+
+    assert first == [(0, [{"start": 0.5, "end": 2.0, "text": "你好。"}])]
+    assert second == [(0, [{"start": 10.5, "end": 12.0, "text": "你好。"}])]
+    assert calls == [48] and loads == ["tiny"]
+    assert asr.clear_segment_cache() == 1
+
+
+def test_segment_cache_keys_name_the_model_that_loaded(monkeypatch, tmp_path):
+    import numpy as np
+
+    monkeypatch.setattr(asr, "_SEGMENT_CACHE_DIR", tmp_path)
+    monkeypatch.setattr(asr_backends.model_registry, "REGISTRY", asr_backends.model_registry.ModelRegistry())
+    monkeypatch.setattr(asr_backends, "_preferred_sizes", lambda: ("tiny", "small"))
+    monkeypatch.setenv("ASR_CACHE_ENABLE", "true")
+    models = []
+    monkeypatch.setattr(
+        asr, "_segment_cache_key", lambda samples, backend, model_name, params: models.append(model_name) or model_name
+    )
+
+    class FakeModel:
+        def transcribe(self, window, **kwargs):
+            return {"segments": [{"start": 0.0, "end": 1.0, "text": "你好"}]}
+
+    def load_model(size):
+        if size == "tiny":
+            raise RuntimeError("download failed")
+        return FakeModel()
+
+    backend = asr_backends.OpenAIWhisperBackend(types.SimpleNamespace(load_model=load_model))
+    list(asr._iter_local([(0.0, 1.0, np.zeros(16, dtype=np.float32))], backend))
+
+    assert models == ["openai:small", "openai:small"]  # the lookup and the store use the same key
+
+
+def test_local_stop_at_deadline_does_not_run_past_cache_hits(monkeypatch):
+    import numpy as np
+
+    monkeypatch.setenv("ASR_CACHE_ENABLE", "true")
+    cached = {1: [{"start": 0.0, "end": 1.0, "text": "缓存。"}], 3: []}
+    monkeypatch.setattr(asr, "_segment_cache_key", lambda samples, *args: int(samples[0]))
+    monkeypatch.setattr(asr, "_load_segment_cache", cached.get)
+    monkeypatch.setattr(asr, "_store_segment_cache", lambda key, segments: None)
+
+    def stops_after_first(windows, deadline):
+        assert [int(samples[0]) for _, _, samples in windows] == [0, 2]
+        yield 0, [{"start": 0.0, "end": 1.0, "text": "你好"}]  # then the deadline passes
+
+    backend = types.SimpleNamespace(cache_name=lambda: "tiny", transcribe_windows=stops_after_first)
+    windows = [(10.0 * idx, 10.0 * idx + 10.0, np.full(4, idx, dtype=np.float32)) for idx in range(4)]
+
+    result = list(asr._iter_local(windows, backend))
+
+    # Window 2 was neither cached nor transcribed, so nothing after it is yielded and the caller resumes there.
+    assert [idx for idx, _ in result] == [0, 1]
+    assert result[1][1] == [{"start": 10.0, "end": 11.0, "text": "缓存。"}]
+
+
+def test_faster_backend_batches_windows_and_maps_timestamps(monkeypatch):
+    import numpy as np
+
+    monkeypatch.setattr(asr_backends.model_registry, "REGISTRY", asr_backends.model_registry.ModelRegistry())
+    monkeypatch.setattr(asr_backends, "_preferred_sizes", lambda: ("tiny",))
+    monkeypatch.setattr(asr_backends, "AUDIO_SAMPLE_RATE", 10)
+    monkeypatch.setenv("WHISPER_BATCH_SIZE", "8")
+    calls = []
+
+    class FakePipeline:
+        def __init__(self, model):
+            self.model = model
+
+        def transcribe(self, audio, clip_timestamps, batch_size, **kwargs):
+            calls.append((len(audio), clip_timestamps, batch_size))
+            segments = [types.SimpleNamespace(start=c["start"] + 1.0, end=c["end"], text="段") for c in clip_timestamps]
+            return iter(segments), None
+
+    fake_module = types.SimpleNamespace(
+        WhisperModel=lambda size, **kwargs: ("model", size, kwargs["compute_type"]),
+        BatchedInferencePipeline=FakePipeline,
+    )
+    backend = asr_backends.FasterWhisperBackend(fake_module)
+    # A 40 s window is split into two clips; a 5 s window shares the same forward pass.
+    windows = [(100.0, 140.0, np.zeros(400, dtype=np.float32)), (200.0, 205.0, np.zeros(50, dtype=np.float32))]
+
+    results = list(backend.transcribe_windows(windows))
+
+    assert len(calls) == 1
+    assert calls[0][1] == [{"start": 0.0, "end": 30.0}, {"start": 30.0, "end": 40.0}, {"start": 40.0, "end": 45.0}]
+    assert [idx for idx, _ in results] == [0, 1]
+    assert [(seg["start"], seg["end"]) for seg in results[0][1]] == [(101.0, 130.0), (131.0, 140.0)]
+    assert [(seg["start"], seg["end"]) for seg in results[1][1]] == [(201.0, 205.0)]
+    assert backend.cache_name() == "faster:tiny:int8"
+
+
+def test_iflow_uploads_compressed_audio_and_caches_on_encoded_bytes(monkeypatch, tmp_path):
+    import numpy as np
+
+    monkeypatch.setattr(asr, "_SEGMENT_CACHE_DIR", tmp_path)
+    monkeypatch.setenv("ASR_CACHE_ENABLE", "true")
+    monkeypatch.setenv("ASR_IFLOW_AUDIO_FORMAT", "opus")
+    encoded = []
+
+    def fake_encode(samples, audio_format, bitrate=None):
+        encoded.append(audio_format)
+        return b"OggS" + bytes(len(samples) // 10)
+
+    calls = []
+
+    def fake_chat_completion(model, messages, **kwargs):
+        calls.append(messages[1]["content"][0])
+        return {"choices": [{"message": {"content": "你好"}}]}
+
+    monkeypatch.setattr(asr, "encode_audio", fake_encode)
+    monkeypatch.setattr(asr.iflow_api, "chat_completion", fake_chat_completion)
+    samples = np.zeros(160, dtype=np.float32)
+
+    assert asr._transcribe_iflow_window(samples, 5.0) == "你好。"
+    assert asr._transcribe_iflow_window(samples.copy(), 5.0) == "你好。"
+
+    assert encoded == ["opus", "opus"]
+    assert len(calls) == 1 and calls[0]["audio_format"] == "opus"
+    assert asr.base64.b64decode(calls[0]["audio"]).startswith(b"OggS")
+
+    def broken_encode(*args, **kwargs):
+        raise RuntimeError("ffmpeg missing")
+
+    monkeypatch.setattr(asr, "encode_audio", broken_encode)
+    payload, audio_format = asr._encode_iflow_audio(samples)
+    assert audio_format == "wav" and payload.startswith(b"RIFF")
+
+
+def test_iflow_deadline_returns_finished_windows_without_waiting(monkeypatch):
+    windows = [(30.0 * i, 30.0 * (i + 1), f"seg{i}") for i in range(5)]
+    release = threading.Event()
+    started = []
+
+    def fake_call(payload, audio_format, timeout):
+        started.append(payload.decode())
+        if payload in (b"seg1", b"seg3"):
+            release.wait(timeout=5)  # stuck requests
+        return f"{payload.decode()}。"
+
+    monkeypatch.setenv("ASR_CACHE_ENABLE", "false")
+    monkeypatch.setattr(asr.iflow_api, "MAX_WORKERS", 2)
+    monkeypatch.setattr(asr, "_encode_iflow_audio", lambda samples: (samples.encode(), "mp3"))
+    monkeypatch.setattr(asr, "_call_iflow_for_segment", fake_call)
+
+    results = list(asr._iter_iflow(windows, 5.0, asr.Deadline(0.3)))
+    release.set()
+
+    # seg1/seg3 never finished; seg4 was still queued when the deadline passed and is never sent.
+    assert [idx for idx, _ in results] == [0, 2]
+    assert "seg4" not in started
+
+
+def test_whisper_stops_at_deadline_and_marks_partial(monkeypatch):
+    import time
+
+    import numpy as np
+
+    monkeypatch.setattr(asr_backends.model_registry, "REGISTRY", asr_backends.model_registry.ModelRegistry())
+    monkeypatch.setattr(asr_backends, "_preferred_sizes", lambda: ("tiny",))
+    monkeypatch.setattr(asr, "AUDIO_SAMPLE_RATE", 1)
+    monkeypatch.setattr(asr, "decode_audio", lambda _: np.zeros(300, dtype=np.float32))
+    monkeypatch.setenv("ASR_VAD_ENABLE", "false")
+    monkeypatch.setenv("ASR_CACHE_ENABLE", "false")
+    monkeypatch.setenv("ASR_SEGMENT_S", "30")
+    monkeypatch.setenv("ASR_TIMEOUT_S", "0.3")
+    calls = []
+
+    class SlowModel:
+        def transcribe(self, window, **kwargs):
+            calls.append(len(window))
+            time.sleep(0.2)
+            return {"text": "慢"}
+
+    backend = asr_backends.OpenAIWhisperBackend(types.SimpleNamespace(load_model=lambda size: SlowModel()))
+    monkeypatch.setattr(asr, "_select_local_backend", lambda: backend)
+    captured = {}
+
+    def slow_iflow(windows, timeout, deadline):
+        captured["windows"] = [(start, end) for start, end, _ in windows]
+        yield 0, [{"start": windows[0][0], "end": windows[0][1], "text": "补。"}]
+
+    monkeypatch.setattr(asr, "_iter_iflow", slow_iflow)
+
+    stats = {}
+    result = asr.transcribe("dummy.mp4", stats=stats)
+    time.sleep(0.5)
+
+    assert len(calls) <= 3  # the Whisper worker stopped instead of running all 10 windows
+    assert result[0]["text"] == "慢。"
+    assert captured["windows"][-1] == (270.0, 300.0) and len(captured["windows"]) >= 10 - len(calls)
+    assert stats["partial"] is True
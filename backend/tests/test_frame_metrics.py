@@ -0,0 +1,100 @@
+import math
+import sys
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).resolve().parents[2]))
+
+import pytest
+
+cv2 = pytest.importorskip("cv2")
+if not hasattr(cv2, "Laplacian"):
+    pytest.skip("OpenCV is stubbed in this environment", allow_module_level=True)
+
+import numpy as np
+
+from backend.core import frame_metrics
+
+
+def _frames(count, shape=(90, 160)):
+    rng = np.random.default_rng(1)
+    frames = []
+    for idx in range(count):
+        image = rng.integers(0, 40 + 20 * idx, size=(*shape, 3), dtype=np.uint8)
+        cv2.rectangle(image, (10, 10), (60 + idx, 60), (255, 255, 255), -1)
+        frames.append(image)
+    return frames
+
+
+def test_batch_metrics_match_per_frame_reference():
+    frames = _frames(5)
+    grays = [frame_metrics.to_gray(frame) for frame in frames]
+
+    batched = frame_metrics.batch_metrics(grays)
+    # Mixed shapes take the per-frame histogram path and must agree with the stacked one.
+    mixed = frame_metrics.batch_metrics(grays[:2] + [frame_metrics.to_gray(_frames(1, (40, 70))[0])])
+
+    for gray, metrics in zip(grays, batched):
+        hist = cv2.calcHist([gray], [0], None, [256], [0, 256]).ravel()
+        probs = hist / float(np.sum(hist))
+        entropy = float(-np.sum([p * math.log(p + 1e-12) for p in probs]))
+        assert metrics["entropy"] == pytest.approx(entropy, rel=1e-6)
+        assert metrics["clarity"] == pytest.approx(cv2.Laplacian(gray, cv2.CV_64F).var())
+        assert metrics["edge_density"] == pytest.approx(float(np.mean(cv2.Canny(gray, 100, 200) > 0)))
+    assert mixed[:2] == batched[:2]
+
+
+def test_batcher_downscales_and_keeps_order_across_processes():
+    frames = _frames(7, shape=(720, 1280))
+    assert frame_metrics.to_gray(frames[0], max_edge=320).shape == (180, 320)
+
+    serial = frame_metrics.MetricsBatcher(workers=0, batch_size=3)
+    pooled = frame_metrics.MetricsBatcher(workers=2, batch_size=3)
+    for frame in frames:
+        serial.add(frame_metrics.to_gray(frame, max_edge=320))
+        pooled.add(frame_metrics.to_gray(frame, max_edge=320))
+    serial.add(None)
+    pooled.add(None)
+
+    serial_results = serial.results()
+    assert pooled.results() == serial_results
+    assert len(serial_results) == 8 and serial_results[-1] == frame_metrics.EMPTY_METRICS
+
+
+def test_hash_index_matches_brute_force_earliest_match():
+    rng = np.random.default_rng(2)
+    bases = [int(value) for value in rng.integers(0, 2**63, size=20)]
+    for max_distance in (0, 3, 6, 12):
+        index = frame_metrics.HashIndex(max_distance)
+        added = []
+        for step in range(400):
+            value = bases[step % 20]
+            for bit in rng.choice(64, size=int(rng.integers(0, 10)), replace=False):
+                value ^= 1 << int(bit)
+            expected = next((key for key, other in added if frame_metrics.hamming(value, other) <= max_distance), None)
+            assert index.find(value) == expected
+            if expected is None:
+                index.add(step, value)
+                added.append((step, value))
+
+
+def test_text_likelihood_flags_signage_but_not_plain_scenes_or_texture(monkeypatch):
+    rng = np.random.default_rng(3)
+
+    def camera(image):
+        gray = cv2.GaussianBlur(cv2.cvtColor(image, cv2.COLOR_BGR2GRAY), (3, 3), 0)
+        return np.clip(gray.astype(np.int16) + rng.integers(-4, 5, gray.shape), 0, 255).astype(np.uint8)
+
+    scene = np.full((270, 480, 3), (90, 140, 60), dtype=np.uint8)
+    cv2.circle(scene, (240, 135), 80, (200, 200, 200), -1)
+    sign = scene.copy()
+    cv2.rectangle(sign, (40, 40), (440, 120), (255, 255, 255), -1)
+    cv2.putText(sign, "TICKET 40 YUAN", (50, 100), cv2.FONT_HERSHEY_SIMPLEX, 1.2, (0, 0, 0), 3, cv2.LINE_AA)
+    texture = rng.integers(0, 255, size=(270, 480, 3), dtype=np.uint8)
+
+    assert frame_metrics.text_likelihood(camera(sign)) > 0.2
+    assert frame_metrics.text_likelihood(camera(scene)) == 0.0
+    assert frame_metrics.text_likelihood(camera(texture)) < 0.1
+
+    assert frame_metrics.batch_metrics([camera(sign)])[0]["text_score"] > 0.2
+    monkeypatch.setenv("FRAME_TEXT_SCORE_ENABLE", "0")
+    assert frame_metrics.batch_metrics([camera(sign)])[0]["text_score"] == 0.0
@@ -0,0 +1,69 @@
+import base64
+import hashlib
+import sys
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).resolve().parents[2]))
+
+import cv2
+import numpy as np
+
+from shared import iflow_api
+
+
+def _decode(data_url):
+    header, payload = data_url.split(",", 1)
+    raw = base64.b64decode(payload)
+    return header, raw, cv2.imdecode(np.frombuffer(raw, dtype=np.uint8), cv2.IMREAD_UNCHANGED)
+
+
+def test_encode_image_downscales_recompresses_and_hashes_sent_bytes(tmp_path, monkeypatch):
+    for name in ("VISION_IMAGE_MAX_EDGE", "VISION_IMAGE_QUALITY", "VISION_IMAGE_FORMAT", "VISION_IMAGE_GRAYSCALE"):
+        monkeypatch.delenv(name, raising=False)
+    rng = np.random.default_rng(4)
+    image = cv2.resize(rng.integers(0, 255, size=(90, 160, 3), dtype=np.uint8), (3840, 2160))
+    path = tmp_path / "frame.jpg"
+    cv2.imwrite(str(path), image, [cv2.IMWRITE_JPEG_QUALITY, 95])
+    before = iflow_api.image_stats()
+
+    data_url, sha1, original_size, sent_size = iflow_api._encode_image(str(path))
+
+    header, raw, decoded = _decode(data_url)
+    assert header == "data:image/jpeg;base64"
+    assert decoded.shape == (720, 1280, 3)
+    assert original_size == path.stat().st_size and sent_size == len(raw) < original_size // 4
+    assert sha1 == hashlib.sha1(raw).hexdigest()
+
+    _, gray_sha1, _, _ = iflow_api._encode_image({"path": str(path), "grayscale": True, "format": "webp"})
+    monkeypatch.setenv("VISION_IMAGE_FORMAT", "webp")
+    monkeypatch.setenv("VISION_IMAGE_GRAYSCALE", "1")
+    webp_url, webp_sha1, _, _ = iflow_api._encode_image(str(path))
+    header, webp_raw, decoded = _decode(webp_url)
+    assert header == "data:image/webp;base64"
+    assert decoded.ndim == 2 or (decoded[..., 0] == decoded[..., 2]).all()  # WebP decodes grey as 3 channels
+    assert webp_sha1 == gray_sha1 != sha1  # settings change the uploaded bytes and therefore the cache key
+
+    sent = []
+    monkeypatch.setattr(iflow_api, "_CACHE_DIR", tmp_path)
+    monkeypatch.setattr(iflow_api, "_execute_with_pool", lambda payload, timeout_s: sent.append(payload) or {"ok": 1})
+    content = [{"type": "input_image", "image_path": str(path)} for _ in range(2)]
+    for _ in range(2):  # the second call is a cache hit and uploads nothing
+        iflow_api.chat_vision("vl", [{"role": "user", "content": content}], [str(path), str(path)])
+
+    assert len(sent) == 1
+    assert [_decode(part["image_url"])[1] for part in sent[0]["messages"][0]["content"]] == [webp_raw, webp_raw]
+    stats = iflow_api.image_stats()
+    assert stats["images"] - before["images"] == 2
+    assert stats["saved_bytes"] - before["saved_bytes"] > original_size
+
+
+def test_small_images_are_sent_unchanged(tmp_path, monkeypatch):
+    monkeypatch.delenv("VISION_IMAGE_FORMAT", raising=False)
+    monkeypatch.delenv("VISION_IMAGE_GRAYSCALE", raising=False)
+    path = tmp_path / "small.jpg"
+    cv2.imwrite(str(path), np.full((120, 160, 3), 128, dtype=np.uint8), [cv2.IMWRITE_JPEG_QUALITY, 60])
+
+    data_url, sha1, original_size, sent_size = iflow_api._encode_image(str(path))
+
+    assert base64.b64decode(data_url.split(",", 1)[1]) == path.read_bytes()
+    assert original_size == sent_size and sha1 == hashlib.sha1(path.read_bytes()).hexdigest()
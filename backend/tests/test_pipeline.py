@@ -0,0 +1,211 @@
+import sys
+import threading
+import time
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).resolve().parents[2]))
+
+import pytest
+
+from backend.core import pipeline
+
+
+def test_run_stages_overlaps_independent_branches():
+    barrier = threading.Barrier(2, timeout=2)
+
+    def branch(value):
+        def run():
+            barrier.wait()  # both branches must be running at the same time
+            return value
+
+        return run
+
+    stages = [
+        pipeline.Stage("merge", lambda left, right: left + right, ("left", "right")),
+        pipeline.Stage("left", branch(1)),
+        pipeline.Stage("right", branch(2)),
+    ]
+
+    results, timings = pipeline.run_stages(stages, max_workers=2)
+
+    assert results == {"left": 1, "right": 2, "merge": 3}
+    assert set(timings) == {"left", "right", "merge", "total"}
+    assert timings["merge"]["start"] >= max(timings["left"]["end"], timings["right"]["end"])
+
+
+def test_run_stages_reports_failing_stage():
+    def boom():
+        raise ValueError("bad input")
+
+    stages = [
+        pipeline.Stage("ok", lambda: 1),
+        pipeline.Stage("broken", boom),
+        pipeline.Stage("after", lambda broken: broken, ("broken",)),
+    ]
+
+    with pytest.raises(pipeline.PipelineError) as excinfo:
+        pipeline.run_stages(stages)
+
+    assert excinfo.value.stage == "broken"
+    assert isinstance(excinfo.value.__cause__, ValueError)
+
+
+def test_run_stages_fails_without_waiting_for_running_siblings():
+    release = threading.Event()
+
+    def boom():
+        raise ValueError("bad input")
+
+    stages = [pipeline.Stage("slow", lambda: release.wait(5)), pipeline.Stage("broken", boom)]
+
+    started = time.monotonic()
+    with pytest.raises(pipeline.PipelineError):
+        pipeline.run_stages(stages, max_workers=2)
+    elapsed = time.monotonic() - started
+    release.set()
+
+    assert elapsed < 2
+
+
+def test_run_stages_rejects_cycles_and_unknown_deps():
+    with pytest.raises(ValueError):
+        pipeline.run_stages([pipeline.Stage("a", lambda b: b, ("b",)), pipeline.Stage("b", lambda a: a, ("a",))])
+    with pytest.raises(ValueError):
+        pipeline.run_stages([pipeline.Stage("a", lambda missing: missing, ("missing",))])
+
+
+def test_run_pipeline_wires_stage_outputs(monkeypatch):
+    chosen = [{"frame_id": "frame_00000", "path": "/tmp/f0.jpg"}]
+
+    def fake_transcribe_iter(path, stats=None):
+        stats["vad"] = {"skipped_s": 2.0}
+        yield {"start": 0.0, "end": 1.0, "text": "你好。"}
+
+    monkeypatch.setattr(pipeline.asr, "transcribe_iter", fake_transcribe_iter)
+    monkeypatch.setattr(
+        pipeline.video_utils,
+        "analyze_video",
+        lambda path, fps=1: {"scenes": [{"start": 0.0, "end": 1.0}], "frames": [{"frame_id": "frame_00000"}]},
+    )
+    monkeypatch.setattr(
+        pipeline.video_utils,
+        "select_keyframes",
+        lambda scenes, frames, k=9, budget=15, video_path=None: {"chosen": chosen, "rejected": []},
+    )
+    monkeypatch.setattr(pipeline.visual_extractor, "extract_visual_facts", lambda paths, **kwargs: [{"place": "外滩"}])
+    monkeypatch.setattr(pipeline.fact_extractor, "extract_facts", lambda asr_data, visual: {"地点": "外滩"})
+    monkeypatch.setattr(pipeline.evidence, "build_evidences", lambda asr_data, selection, visual: [])
+    monkeypatch.setattr(
+        pipeline.evidence,
+        "attach_facts",
+        lambda facts, evidences: {"facts_strict": {"地点": facts["地点"]}, "missing": ["费用"]},
+    )
+    captured = {}
+
+    def fake_generate_post(payload):
+        captured["payload"] = payload
+        return {"title": "标题", "markdown": "正文"}
+
+    monkeypatch.setattr(pipeline.post_writer, "generate_post", fake_generate_post)
+
+    streamed = []
+    result = pipeline.run_pipeline("video.mp4", vl_budget=5, on_asr_segment=streamed.append)
+
+    assert result["frames"] == chosen
+    assert streamed == result["asr"] == [{"start": 0.0, "end": 1.0, "text": "你好。"}]
+    assert result["visual"] == [{"place": "外滩", "image_path": "/tmp/f0.jpg"}]
+    assert result["post"] == {"title": "标题", "markdown": "正文"}
+    assert captured["payload"] == {"地点": "外滩", "missing": ["费用"]}
+    assert result["asr_stats"] == {"vad": {"skipped_s": 2.0}}
+    assert "asr" in result["timings"] and "total" in result["timings"]
+
+
+def test_run_pipeline_reuses_cached_stages_by_fingerprint(monkeypatch, tmp_path):
+    frame_path = tmp_path / "frame_00000.jpg"
+    frame_path.write_bytes(b"jpeg")
+    calls = []
+
+    def fake_transcribe_iter(path, stats=None):
+        calls.append("asr")
+        stats["vad"] = {"skipped_s": 1.0}
+        yield {"start": 0.0, "end": 1.0, "text": "你好。"}
+
+    def fake_select(scenes, frames, k=9, budget=15, video_path=None):
+        calls.append(f"keyframes:{budget}")
+        return {"chosen": [{"frame_id": "frame_00000", "path": str(frame_path), "frame_index": 0}], "rejected": []}
+
+    def fake_visual(paths, **kwargs):
+        calls.append("visual")
+        return [{"place": "外滩"}]
+
+    def fake_analyze(path, fps=1):
+        calls.append("video")
+        return {"scenes": [{"start": 0.0, "end": 1.0}], "frames": [{"frame_id": "frame_00000", "frame_index": 0}]}
+
+    monkeypatch.setattr(pipeline.video_utils, "video_fingerprint", lambda path: "abc-10.00s")
+    monkeypatch.setattr(pipeline.asr, "transcribe_iter", fake_transcribe_iter)
+    monkeypatch.setattr(pipeline.video_utils, "analyze_video", fake_analyze)
+    monkeypatch.setattr(pipeline.video_utils, "select_keyframes", fake_select)
+    monkeypatch.setattr(pipeline.visual_extractor, "extract_visual_facts", fake_visual)
+    monkeypatch.setattr(pipeline.fact_extractor, "extract_facts", lambda asr_data, visual: {})
+    monkeypatch.setattr(pipeline.evidence, "build_evidences", lambda asr_data, selection, visual: [])
+    monkeypatch.setattr(pipeline.evidence, "attach_facts", lambda facts, evidences: {"facts_strict": {}, "missing": []})
+    monkeypatch.setattr(pipeline.post_writer, "generate_post", lambda payload: {"title": "", "markdown": ""})
+    cache = pipeline.stage_cache.StageCache(tmp_path / "stages")
+
+    def run(budget):
+        stats, report, streamed = {}, {}, []
+        stages = pipeline.build_stages(
+            "clip.mp4", budget, stats=stats, on_asr_segment=streamed.append, cache=cache, cache_report=report
+        )
+        results, _ = pipeline.run_stages(stages)
+        return results, stats, report, streamed
+
+    first, _, first_report, _ = run(15)
+    second, stats, report, streamed = run(15)
+    assert calls == ["asr", "video", "keyframes:15", "visual"]
+    assert first_report["hits"] == []
+    assert sorted(report["hits"]) == ["asr", "keyframes", "video", "visual"]
+    assert second["visual"] == first["visual"] == [{"place": "外滩", "image_path": str(frame_path)}]
+    assert streamed == second["asr"] and stats["vad"] == {"skipped_s": 1.0}
+
+    calls.clear()
+    _, _, report, _ = run(30)  # a new budget re-runs selection only; the visual key follows the chosen frames
+    assert calls == ["keyframes:30"]
+    assert sorted(report["hits"]) == ["asr", "video", "visual"]
+
+
+def test_stage_cache_skips_results_degraded_by_vlm_failures(monkeypatch, tmp_path):
+    frame_paths = [str(tmp_path / f"frame_{idx:05d}.jpg") for idx in range(2)]
+    for frame_path in frame_paths:
+        Path(frame_path).write_bytes(b"jpeg")
+    chosen = [{"frame_id": Path(p).stem, "path": p, "frame_index": idx} for idx, p in enumerate(frame_paths)]
+    calls = []
+
+    def fake_select(scenes, frames, k=9, budget=15, video_path=None):
+        calls.append("keyframes")
+        rejected = [{"frame_id": "frame_00009", "vlm": {"vlm_error": "timeout"}, "reason": "lower_score"}]
+        return {"chosen": chosen, "rejected": rejected}
+
+    def fake_visual(paths, keep_failed=False, **kwargs):
+        calls.append("visual")
+        return [None, {"place": "外滩"}] if keep_failed else [{"place": "外滩"}]
+
+    monkeypatch.setattr(pipeline.video_utils, "video_fingerprint", lambda path: "abc-10.00s")
+    monkeypatch.setattr(pipeline.asr, "transcribe_iter", lambda path, stats=None: iter([]))
+    monkeypatch.setattr(pipeline.video_utils, "analyze_video", lambda path, fps=1: {"scenes": [], "frames": []})
+    monkeypatch.setattr(pipeline.video_utils, "select_keyframes", fake_select)
+    monkeypatch.setattr(pipeline.visual_extractor, "extract_visual_facts", fake_visual)
+    cache = pipeline.stage_cache.StageCache(tmp_path / "stages")
+
+    for _ in range(2):
+        stages = pipeline.build_stages("clip.mp4", 15, cache=cache, cache_report={})
+        results, _ = pipeline.run_stages([stage for stage in stages if stage.name in {"video", "keyframes", "visual"}])
+
+    assert calls == ["keyframes", "visual", "keyframes", "visual"]  # neither degraded result was replayed
+    assert results["visual"] == [{"place": "外滩", "image_path": frame_paths[1]}]  # facts stay with their frame
+
+
+def test_vlm_batching_knobs_are_part_of_the_stage_cache_keys():
+    assert "LIGHT_RANK_CHUNK_SIZE" in pipeline.KEYFRAME_CACHE_ENV
+    assert "VISUAL_BATCH_SIZE" in pipeline.VISUAL_CACHE_ENV
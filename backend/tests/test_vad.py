@@ -0,0 +1,77 @@
+import sys
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).resolve().parents[2]))
+
+import numpy as np
+
+from backend.core import vad
+
+RATE = 16000
+
+
+def _silence(seconds):
+    rng = np.random.default_rng(0)
+    return (rng.standard_normal(int(seconds * RATE)) * 1e-4).astype(np.float32)
+
+
+def _speech(seconds):
+    t = np.arange(int(seconds * RATE)) / RATE
+    syllables = (np.floor(t / 0.1) % 3 != 2).astype(np.float32)  # 200 ms voiced, 100 ms pause
+    return (0.3 * np.sin(2 * np.pi * 220 * t) * syllables).astype(np.float32)
+
+
+def test_plan_skips_silence_between_speech():
+    samples = np.concatenate([_silence(5), _speech(10), _silence(20), _speech(5), _silence(3)])
+
+    plan = vad.plan_speech_windows(samples, RATE, max_window_s=45.0)
+
+    spans = [(start / RATE, end / RATE) for start, end in plan.windows]
+    assert len(spans) == 2
+    assert abs(spans[0][0] - 5.0) < 0.5 and abs(spans[0][1] - 15.0) < 0.5
+    assert abs(spans[1][0] - 35.0) < 0.5 and abs(spans[1][1] - 40.0) < 0.5
+    assert plan.skipped_s > 25.0
+    assert plan.as_dict()["windows"] == 2
+
+
+def test_plan_cuts_long_speech_within_max_window():
+    samples = _speech(100)
+
+    plan = vad.plan_speech_windows(samples, RATE, max_window_s=30.0)
+
+    assert len(plan.windows) >= 4
+    assert all((end - start) / RATE <= 30.0 + 0.5 for start, end in plan.windows)
+    assert plan.windows[0][0] == 0 and plan.windows[-1][1] == len(samples)
+    assert plan.skipped_s < 1.0
+
+
+def test_plan_ignores_steady_background_and_empty_audio():
+    t = np.arange(20 * RATE) / RATE
+    steady = (0.2 * np.sin(2 * np.pi * 440 * t)).astype(np.float32)
+
+    assert vad.plan_speech_windows(steady, RATE, max_window_s=45.0).windows == []
+    empty = vad.plan_speech_windows(np.zeros(0, dtype=np.float32), RATE, max_window_s=45.0)
+    assert empty.windows == [] and empty.skipped_s == 0.0
+
+
+def _music(seconds):
+    rng = np.random.default_rng(1)
+    t = np.arange(int(seconds * RATE)) / RATE
+    notes = np.array([220.0, 247.0, 262.0, 294.0, 330.0, 349.0, 392.0])[(np.floor(t / 0.5) % 7).astype(int)]
+    chords = sum(np.sin(2 * np.pi * notes * ratio * t) for ratio in (1.0, 1.25, 1.5))
+    beat = np.exp(-(t % 0.5) / 0.03) * rng.standard_normal(t.size)  # a decaying hit every half second
+    return (0.1 * chords + 0.3 * beat).astype(np.float32)
+
+
+def test_plan_skips_music_without_speech_but_keeps_speech_over_music():
+    samples = np.concatenate([_music(20), _speech(10), _silence(5)])
+
+    plan = vad.plan_speech_windows(samples, RATE, max_window_s=45.0)
+
+    spans = [(start / RATE, end / RATE) for start, end in plan.windows]
+    assert len(spans) == 1
+    assert abs(spans[0][0] - 20.0) < 1.0 and abs(spans[0][1] - 30.0) < 0.5
+    assert plan.as_dict()["music_s"] > 18.0
+
+    narrated = _speech(10) + 0.3 * _music(10)
+    assert vad.plan_speech_windows(narrated, RATE, max_window_s=45.0).speech_s > 9.5
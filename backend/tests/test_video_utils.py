@@ -0,0 +1,280 @@
+import sys
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).resolve().parents[2]))
+
+import pytest
+
+cv2 = pytest.importorskip("cv2")
+if not hasattr(cv2, "VideoWriter"):
+    pytest.skip("OpenCV is stubbed in this environment", allow_module_level=True)
+
+import numpy as np
+
+from backend.core import video_utils
+
+
+def _write_two_shot_video(path, fps=10, seconds_per_shot=2):
+    writer = cv2.VideoWriter(str(path), cv2.VideoWriter_fourcc(*"MJPG"), fps, (320, 240))
+    if not writer.isOpened():
+        pytest.skip("MJPG writer unavailable")
+    for idx in range(2 * seconds_per_shot * fps):
+        first_shot = idx < seconds_per_shot * fps
+        image = np.full((240, 320, 3), 30 if first_shot else 210, dtype=np.uint8)
+        colour = (0, 0, 255) if first_shot else (255, 0, 0)
+        cv2.putText(image, str(idx), (60, 140), cv2.FONT_HERSHEY_SIMPLEX, 2, colour, 3)
+        writer.write(image)
+    writer.release()
+
+
+def _write_static_then_moving_video(path, fps=10, seconds_per_shot=10):
+    writer = cv2.VideoWriter(str(path), cv2.VideoWriter_fourcc(*"MJPG"), fps, (320, 240))
+    if not writer.isOpened():
+        pytest.skip("MJPG writer unavailable")
+    shot_frames = seconds_per_shot * fps
+    for idx in range(2 * shot_frames):
+        if idx < shot_frames:
+            image = np.full((240, 320, 3), 30, dtype=np.uint8)
+            cv2.putText(image, "A", (60, 140), cv2.FONT_HERSHEY_SIMPLEX, 3, (0, 0, 255), 5)
+        else:
+            image = np.full((240, 320, 3), 200, dtype=np.uint8)
+            x = int((idx - shot_frames) / shot_frames * 280)
+            cv2.rectangle(image, (x, 40), (x + 40, 200), (0, 0, 0), -1)
+        writer.write(image)
+    writer.release()
+
+
+def test_analyze_video_detects_scenes_and_samples_frames_in_one_pass(tmp_path):
+    video = tmp_path / "clip.avi"
+    _write_two_shot_video(video)
+
+    result = video_utils.analyze_video(str(video), fps=1)
+
+    assert [(round(s["start"], 2), round(s["end"], 2)) for s in result["scenes"]] == [(0.0, 2.0), (2.0, 4.0)]
+    frames = result["frames"]
+    assert [frame["ts"] for frame in frames] == [0.0, 1.0, 2.0, 3.0]
+    assert [frame["frame_index"] for frame in frames] == [0, 10, 20, 30]
+    assert all(frame["path"] is None for frame in frames)
+    assert set(frames[0]["metrics"]) == {"clarity", "entropy", "edge_density", "text_score"}
+    assert all(isinstance(frame["dhash"], int) for frame in frames)
+    assert not list(tmp_path.glob("*.jpg"))
+
+    written = video_utils.write_frame_images(str(video), [frames[2]], output_dir=tmp_path / "out")
+
+    assert written == [frames[2]]
+    assert sorted(p.name for p in (tmp_path / "out").glob("*.jpg")) == ["frame_00002.jpg"]
+    image = cv2.imread(frames[2]["path"])
+    assert image is not None and image.mean() > 150  # the seek landed in the second shot
+
+
+def test_select_keyframes_drops_near_duplicates_before_light_rank(monkeypatch):
+    from backend.core import visual_extractor
+
+    sent = []
+    monkeypatch.setattr(visual_extractor, "light_rank", lambda paths: sent.extend(paths) or [])
+    monkeypatch.delenv("KEYFRAME_DEDUP_DISTANCE", raising=False)
+    static = 0x0F0F_F0F0_3C3C_C3C3
+
+    def frame(idx, clarity, frame_hash):
+        return {
+            "frame_id": f"frame_{idx:05d}",
+            "ts": float(idx),
+            "path": f"/tmp/f{idx}.jpg",
+            "metrics": {"clarity": clarity, "entropy": 1.0, "edge_density": 0.1},
+            "dhash": frame_hash,
+        }
+
+    frames = [
+        frame(0, 10.0, static),
+        frame(1, 30.0, static ^ 0b1),  # best of the static shot
+        frame(2, 20.0, static ^ 0b110),
+        frame(3, 5.0, ~static & (2**64 - 1)),
+    ]
+
+    result = video_utils.select_keyframes([{"start": 0.0, "end": 3.0}], frames, k=2, budget=15)
+
+    assert sorted(sent) == ["/tmp/f1.jpg", "/tmp/f3.jpg"]
+    assert sorted(item["frame_id"] for item in result["chosen"]) == ["frame_00001", "frame_00003"]
+    duplicates = {
+        item["frame_id"]: item["duplicate_of"] for item in result["rejected"] if item["reason"] == "near_duplicate"
+    }
+    assert duplicates == {"frame_00000": "frame_00001", "frame_00002": "frame_00001"}
+
+
+def test_select_keyframes_backfills_near_duplicates_on_static_footage(monkeypatch):
+    from backend.core import visual_extractor
+
+    monkeypatch.setattr(visual_extractor, "light_rank", lambda paths: [])
+    monkeypatch.delenv("KEYFRAME_DEDUP_DISTANCE", raising=False)
+    static = 0x0F0F_F0F0_3C3C_C3C3
+    clarity = [10.0, 40.0, 20.0, 70.0, 30.0, 60.0, 50.0, 5.0]
+    frames = [
+        {
+            "frame_id": f"frame_{idx:05d}",
+            "ts": float(idx),
+            "path": f"/tmp/f{idx}.jpg",
+            "metrics": {"clarity": value, "entropy": 1.0, "edge_density": 0.1},
+            "dhash": static ^ (idx % 2),  # every frame is within one bit of the others
+        }
+        for idx, value in enumerate(clarity)
+    ]
+
+    result = video_utils.select_keyframes([{"start": 0.0, "end": 7.0}], frames, k=4, budget=15)
+
+    # Even exact-hash dedup leaves two frames; the sharpest near-duplicates fill the rest of the grid.
+    assert sorted(item["frame_id"] for item in result["chosen"]) == [
+        "frame_00001", "frame_00003", "frame_00005", "frame_00006"
+    ]
+    assert sorted(item["reason"] for item in result["rejected"]) == ["near_duplicate"] * 4
+
+    few = video_utils.select_keyframes([{"start": 0.0, "end": 7.0}], frames[:3], k=9, budget=15)
+    assert len(few["chosen"]) == 3 and few["rejected"] == []
+
+
+def test_select_keyframes_lifts_text_frames_into_the_pool(monkeypatch):
+    from backend.core import visual_extractor
+
+    sent = []
+    monkeypatch.setattr(visual_extractor, "light_rank", lambda paths: sent.extend(paths) or [])
+    monkeypatch.delenv("KEYFRAME_TEXT_WEIGHT", raising=False)
+
+    def frame(idx, clarity, text_score):
+        return {
+            "frame_id": f"frame_{idx:05d}",
+            "ts": float(idx),
+            "path": f"/tmp/f{idx}.jpg",
+            "metrics": {"clarity": clarity, "entropy": 1.0, "edge_density": 0.1, "text_score": text_score},
+            "dhash": (0xFFFF << (16 * idx)) & (2**64 - 1),
+        }
+
+    # Frame 1 is the scene median; the second pool slot goes to the price board (frame 3) over a sharper view.
+    frames = [frame(0, 10.0, 0.0), frame(1, 5.0, 0.0), frame(2, 12.0, 0.0), frame(3, 11.0, 0.8)]
+    video_utils.select_keyframes([{"start": 0.0, "end": 3.0}], frames, k=1, budget=2)
+    assert sorted(sent) == ["/tmp/f1.jpg", "/tmp/f3.jpg"]
+
+    sent.clear()
+    monkeypatch.setenv("KEYFRAME_TEXT_WEIGHT", "0")
+    video_utils.select_keyframes([{"start": 0.0, "end": 3.0}], frames, k=1, budget=2)
+    assert sorted(sent) == ["/tmp/f1.jpg", "/tmp/f2.jpg"]
+
+
+def test_sparse_modes_decode_only_target_timestamps(tmp_path):
+    video = tmp_path / "clip.avi"
+    _write_static_then_moving_video(video)
+
+    sparse = video_utils.analyze_video(str(video), mode="sparse")
+    scenes = sparse["scenes"]
+    adaptive = video_utils.extract_sparse_frames(str(video), scenes, grid_s=10.0, adaptive=True)
+
+    assert [(round(s["start"]), round(s["end"])) for s in scenes] == [(0, 10), (10, 20)]
+    # Scene midpoints (5 s, 15 s) plus the default 5 s grid; nothing else is decoded.
+    assert [frame["ts"] for frame in sparse["frames"]] == [0.0, 5.0, 10.0, 15.0, 20.0]
+    assert all(frame["path"] is None and "metrics" in frame for frame in sparse["frames"])
+    static_ts = [frame["ts"] for frame in adaptive if frame["ts"] < 10.0]
+    moving_ts = [frame["ts"] for frame in adaptive if frame["ts"] >= 10.0]
+    assert static_ts == [0.0, 2.5, 5.0, 7.5]  # the static shot keeps its coarse samples
+    assert len(moving_ts) > 2 * len(static_ts)  # the moving shot is refined
+
+
+def test_fast_scene_detection_policy_and_accuracy(tmp_path, monkeypatch):
+    monkeypatch.delenv("SCENE_DETECT_MODE", raising=False)
+    monkeypatch.delenv("SCENE_FAST_MIN_S", raising=False)
+    assert video_utils.scene_detect_policy(60.0)["mode"] == "full"
+    assert video_utils.scene_detect_policy(600.0) == {"mode": "fast", "width": 160, "frame_skip": 1}
+    assert video_utils.scene_detect_policy(3600.0)["frame_skip"] == 2
+    assert video_utils.scene_detect_policy(3600.0, mode="full")["frame_skip"] == 0
+
+    video = tmp_path / "clip.avi"
+    _write_static_then_moving_video(video)
+
+    full = video_utils.detect_scenes(str(video), mode="full")
+    fast = video_utils.detect_scenes(str(video), mode="fast")
+
+    assert len(fast) == len(full) == 2
+    assert abs(fast[1]["start"] - full[1]["start"]) <= 0.2
+
+
+def test_malformed_video_env_values_fall_back_to_defaults(monkeypatch, caplog):
+    monkeypatch.setenv("SCENE_DETECT_MODE", "turbo")
+    monkeypatch.setenv("SCENE_FAST_MIN_S", "five minutes")
+    monkeypatch.setenv("SCENE_CHUNK_MIN_S", "1m")
+
+    with caplog.at_level("WARNING", logger="backend.core.video_utils"):
+        assert video_utils.scene_detect_policy(600.0)["mode"] == "fast"  # auto with the 300 s default
+        assert len(video_utils._plan_chunks(10 * 600, 10.0, 16, workers=4)) == 4  # default 60 s chunks
+
+    warned = " ".join(caplog.messages)
+    assert all(name in warned for name in ("SCENE_DETECT_MODE", "SCENE_FAST_MIN_S", "SCENE_CHUNK_MIN_S"))
+    with pytest.raises(ValueError):
+        video_utils.scene_detect_policy(600.0, mode="turbo")  # an explicit argument is still checked
+
+
+def test_parallel_chunked_scan_matches_single_process(tmp_path, monkeypatch):
+    video = tmp_path / "shots.avi"
+    writer = cv2.VideoWriter(str(video), cv2.VideoWriter_fourcc(*"MJPG"), 10, (320, 240))
+    if not writer.isOpened():
+        pytest.skip("MJPG writer unavailable")
+    shades = [(20, 20, 20), (230, 230, 230), (20, 20, 220), (230, 230, 20)]
+    for idx in range(120):
+        image = np.full((240, 320, 3), shades[idx // 30], dtype=np.uint8)
+        cv2.putText(image, str(idx), (60, 140), cv2.FONT_HERSHEY_SIMPLEX, 2, (255, 255, 255), 3)
+        writer.write(image)
+    writer.release()
+    monkeypatch.setenv("SCENE_CHUNK_MIN_S", "1")
+    monkeypatch.setenv("SCENE_DETECT_MODE", "full")
+
+    # Chunk edges fall exactly on the cuts at 3 s, 6 s and 9 s.
+    assert [chunk[1] for chunk in video_utils._plan_chunks(120, 10.0, 16, workers=4)] == [0, 30, 60, 90]
+    monkeypatch.setenv("VIDEO_SCAN_WORKERS", "1")
+    single = video_utils.analyze_video(str(video), fps=2)
+    monkeypatch.setenv("VIDEO_SCAN_WORKERS", "4")
+    parallel = video_utils.analyze_video(str(video), fps=2)
+    scenes = video_utils.detect_scenes(str(video))
+
+    assert [(s["start"], s["end"]) for s in single["scenes"]] == [(0.0, 3.0), (3.0, 6.0), (6.0, 9.0), (9.0, 12.0)]
+    assert parallel["scenes"] == single["scenes"] == scenes
+    assert parallel["frames"] == single["frames"]
+    assert len(single["frames"]) == 24
+
+
+def test_spawned_scan_workers_do_not_rerun_the_streamlit_script(tmp_path, monkeypatch):
+    pytest.importorskip("streamlit")
+    import types
+
+    video = tmp_path / "shots.avi"
+    _write_two_shot_video(video, seconds_per_shot=3)
+    # Streamlit runs app/ui.py as a fake __main__ module; spawn re-runs that file in every worker.
+    fake_main = types.ModuleType("__main__")
+    fake_main.__file__ = str(Path(__file__).resolve().parents[2] / "app" / "ui.py")
+    monkeypatch.setitem(sys.modules, "__main__", fake_main)
+    # Rendering the page opens the artifact store, which creates this directory.
+    monkeypatch.setenv("ARTIFACT_STORE_DIR", str(tmp_path / "store"))
+    monkeypatch.setenv("SCENE_CHUNK_MIN_S", "1")
+
+    scan = video_utils._scan_video(str(video), 10.0, 60, video_utils.scene_detect_policy(6.0, "full"), workers=2)
+
+    assert scan["end"] == 60
+    assert not (tmp_path / "store").exists()
+
+
+def test_select_keyframes_scales_and_keeps_output_contract(monkeypatch):
+    from backend.core import visual_extractor
+    from tools.bench_keyframes import synthetic_frames
+
+    sent = []
+    monkeypatch.setattr(visual_extractor, "light_rank", lambda paths: sent.extend(paths) or [])
+    monkeypatch.delenv("KEYFRAME_DEDUP_DISTANCE", raising=False)
+    data = synthetic_frames(12000, scene_len=30)
+    frames = list(reversed(data["frames"]))  # input order must not matter
+
+    result = video_utils.select_keyframes(data["scenes"], frames, k=9, budget=15)
+
+    chosen, rejected = result["chosen"], result["rejected"]
+    assert len(sent) == 15 and len(chosen) == 9
+    assert len({frame["scene_index"] for frame in chosen}) == 9
+    assert sorted(item["frame_id"] for item in chosen + rejected) == sorted(f["frame_id"] for f in frames)
+    reasons = {item["reason"] for item in rejected}
+    assert reasons == {"lower_score", "near_duplicate", "not_sent_to_vlm"}
+    duplicate = next(item for item in rejected if item["reason"] == "near_duplicate")
+    assert {"score", "scene_index", "metrics", "duplicate_of"} <= set(duplicate)
+    assert all("reason" not in frame and "score" not in frame for frame in frames)  # inputs are left untouched
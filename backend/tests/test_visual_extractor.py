@@ -0,0 +1,160 @@
+import json
+import sys
+import threading
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).resolve().parents[2]))
+
+from backend.core import visual_extractor
+
+
+def _frame_names(messages):
+    return [
+        part["text"].split(": ", 1)[1]
+        for part in messages[1]["content"]
+        if part["type"] == "input_text" and part["text"].startswith("Frame ")
+    ]
+
+
+def test_light_rank_sends_chunks_concurrently_and_merges_in_order(monkeypatch):
+    paths = [f"/tmp/frame_{idx:02d}.jpg" for idx in range(7)]
+    barrier = threading.Barrier(3, timeout=2)
+
+    def fake_call(messages, image_paths):
+        barrier.wait()  # every chunk is in flight at the same time
+        names = _frame_names(messages)
+        if "frame_03.jpg" in names:
+            return "sorry, I cannot help with that"
+        return "```json\n" + json.dumps([{"representativeness": int(name[6:8]) / 10} for name in names]) + "\n```"
+
+    monkeypatch.setattr(visual_extractor, "_call_iflow", fake_call)
+
+    results = visual_extractor.light_rank(paths, chunk_size=3)
+
+    assert [item["path"] for item in results] == paths
+    # The chunk with a malformed answer (frames 3-5) loses its scores; the others keep theirs.
+    assert [item["representativeness"] for item in results] == [0.0, 0.1, 0.2, None, None, None, 0.6]
+
+
+def test_extract_visual_facts_runs_frames_concurrently_and_keeps_order(monkeypatch):
+    import asyncio
+
+    paths = ["/tmp/a.jpg", "/tmp/b.jpg", "/tmp/c.jpg"]
+    barrier = threading.Barrier(3, timeout=2)
+
+    def fake_analyze(path):
+        barrier.wait()
+        if path.endswith("b.jpg"):
+            raise RuntimeError("vision timeout")
+        return {"place": Path(path).stem}
+
+    monkeypatch.setattr(visual_extractor, "analyze_frame", fake_analyze)
+
+    assert visual_extractor.extract_visual_facts(paths, max_workers=3) == [{"place": "a"}, {"place": "c"}]
+    barrier.reset()
+    assert asyncio.run(visual_extractor.extract_visual_facts_async(paths, max_workers=3)) == [
+        {"place": "a"},
+        {"place": "c"},
+    ]
+
+
+def test_batched_visual_extraction_falls_back_per_frame_and_caches(monkeypatch, tmp_path):
+    paths = []
+    for idx in range(5):
+        path = tmp_path / f"f{idx}.jpg"
+        path.write_bytes(f"image-{idx}".encode())
+        paths.append(str(path))
+    requests, singles = [], []
+
+    def fake_call(messages, image_paths):
+        requests.append([Path(path).name for path in image_paths])
+        if len(image_paths) == 2:
+            return "no json here"
+        # Entries are matched by frame number, not position; frame 2 is unusable.
+        return json.dumps(
+            [
+                {"frame": 3, "地点": "外滩", "activities": "拍照、散步"},
+                {"frame": 1, "place": "豫园", "text": "¥40"},
+                {"frame": 2, "note": "unclear"},
+            ]
+        )
+
+    def fake_analyze(path):
+        singles.append(Path(path).name)
+        return {"place": f"single-{Path(path).stem}"}
+
+    monkeypatch.setattr(visual_extractor, "_FRAME_CACHE_DIR", tmp_path / "cache")
+    monkeypatch.setattr(visual_extractor, "_call_iflow", fake_call)
+    monkeypatch.setattr(visual_extractor, "analyze_frame", fake_analyze)
+
+    results = visual_extractor.extract_visual_facts(paths, batch_size=3)
+
+    assert sorted(requests) == [["f0.jpg", "f1.jpg", "f2.jpg"], ["f3.jpg", "f4.jpg"]]  # batches run concurrently
+    assert sorted(singles) == ["f1.jpg", "f3.jpg", "f4.jpg"]
+    assert results[0] == {"place": "豫园", "activities": [], "objects": [], "mood": None, "visible_text": "¥40"}
+    assert results[2]["place"] == "外滩" and results[2]["activities"] == ["拍照", "散步"]
+    assert [item["place"] for item in results[1::2]] == ["single-f1", "single-f3"]
+
+    requests.clear()
+    again = visual_extractor.extract_visual_facts(list(reversed(paths)), batch_size=3)
+    assert requests == [["f4.jpg", "f3.jpg", "f1.jpg"]]  # frames 0 and 2 come from the per-frame cache
+    assert again[-1] == results[0]
+
+    assert visual_extractor.clear_frame_cache() == 4  # frames 0 and 2, then 4 and 1 from the second batch
+    assert not list((tmp_path / "cache").glob("*.json"))
+    requests.clear()
+    visual_extractor.extract_visual_facts(paths[:1], batch_size=3)
+    assert requests == [["f0.jpg"]]  # a cleared frame is analyzed again
+
+
+def test_batched_visual_extraction_matches_by_position_when_frame_numbers_are_off(monkeypatch, caplog):
+    replies = [
+        [{"frame": 0, "place": "豫园"}, {"frame": 1, "place": "外滩"}, {"frame": 2, "place": "武康路"}],  # 0-based
+        [{"frame": 1, "place": "豫园"}, {"frame": 1, "place": "外滩"}, {"frame": 3, "place": "武康路"}],  # repeated
+        [{"frame": 3, "place": "武康路"}, {"frame": 1, "place": "豫园"}],  # trusted, frame 2 skipped
+    ]
+    monkeypatch.setattr(visual_extractor, "_call_iflow", lambda messages, image_paths: json.dumps(replies.pop(0)))
+    paths = ["/tmp/a.jpg", "/tmp/b.jpg", "/tmp/c.jpg"]
+
+    with caplog.at_level("WARNING", logger="backend.core.visual_extractor"):
+        zero_based = visual_extractor.analyze_frames_batch(paths)
+        repeated = visual_extractor.analyze_frames_batch(paths)
+        skipped = visual_extractor.analyze_frames_batch(paths)
+
+    assert [item["place"] for item in zero_based] == ["豫园", "外滩", "武康路"]
+    assert [item["place"] for item in repeated] == ["豫园", "外滩", "武康路"]
+    assert [item and item["place"] for item in skipped] == ["豫园", None, "武康路"]
+    assert sum("matching by position" in record.getMessage() for record in caplog.records) == 2
+
+
+def test_full_schema_light_rank_is_reused_by_extract_visual_facts(monkeypatch):
+    paths = ["/tmp/a.jpg", "/tmp/b.jpg"]
+    prompts, singles = [], []
+
+    def fake_call(messages, image_paths):
+        prompts.append(messages[1]["content"][0]["text"])
+        return json.dumps(
+            [
+                {"representativeness": 0.8, "place": "豫园", "activities": ["拍照"], "visible_text": "¥40"},
+                {"representativeness": 0.3},
+            ]
+        )
+
+    def fake_analyze(path):
+        singles.append(path)
+        return {"place": "single"}
+
+    monkeypatch.setattr(visual_extractor, "_call_iflow", fake_call)
+    monkeypatch.setattr(visual_extractor, "analyze_frame", fake_analyze)
+    monkeypatch.setenv("LIGHT_RANK_FULL_SCHEMA", "1")
+
+    ranked = visual_extractor.light_rank(paths)
+
+    assert "visible_text" in prompts[0]
+    assert ranked[0]["visual"]["place"] == "豫园" and ranked[0]["visual"]["visible_text"] == "¥40"
+    assert ranked[1]["visual"] is None  # no visual keys answered, so this frame is analyzed again
+
+    results = visual_extractor.extract_visual_facts(paths, prefetched=[item["visual"] for item in ranked])
+
+    assert singles == ["/tmp/b.jpg"]
+    assert results == [ranked[0]["visual"], {"place": "single"}]
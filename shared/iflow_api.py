@@ -11,7 +11,7 @@ import threading
 import time
 from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
-from typing import Any, Dict, List, Sequence
+from typing import Any, Callable, Dict, List, Sequence
 
 import requests
 from tenacity import RetryError, retry, retry_if_exception_type, stop_after_attempt, wait_random_exponential
@@ -37,6 +37,13 @@ if _PROXIES:
 
 _EXECUTOR = ThreadPoolExecutor(max_workers=MAX_WORKERS)
 
+# Vision uploads are downscaled / recompressed before base64 encoding (see _preprocess_image).
+DEFAULT_IMAGE_MAX_EDGE = 1280
+DEFAULT_IMAGE_QUALITY = 85
+IMAGE_FORMATS = {"jpeg": (".jpg", "image/jpeg"), "webp": (".webp", "image/webp")}
+_IMAGE_STATS_LOCK = threading.Lock()
+_IMAGE_STATS = {"images": 0, "original_bytes": 0, "sent_bytes": 0}
+
 
 class IFlowRetryableError(Exception):
     """Errors that should trigger a retry."""
@@ -89,15 +96,113 @@ def _store_cache(cache_key: str, data: Dict[str, Any]) -> None:
         LOGGER.warning("Failed to write cache %s: %s", path, exc)
 
 
+def _int_from_env(name: str, default: int) -> int:
+    value = os.getenv(name)
+    if value is None:
+        return default
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        LOGGER.warning("Invalid integer for %s=%s, using default %d", name, value, default)
+        return default
+
+
+def _bool_from_env(name: str, default: bool) -> bool:
+    value = os.getenv(name)
+    if value is None:
+        return default
+    return value.strip().lower() in {"1", "true", "yes", "on"}
+
+
+def image_options(**overrides: Any) -> Dict[str, Any]:
+    """Preprocessing applied to vision images: ``VISION_IMAGE_*`` settings updated with non-None overrides."""
+    image_format = os.getenv("VISION_IMAGE_FORMAT", "jpeg").strip().lower()
+    if image_format not in IMAGE_FORMATS:
+        LOGGER.warning("Unsupported VISION_IMAGE_FORMAT=%s, using jpeg", image_format)
+        image_format = "jpeg"
+    options = {
+        "max_edge": _int_from_env("VISION_IMAGE_MAX_EDGE", DEFAULT_IMAGE_MAX_EDGE),
+        "quality": _int_from_env("VISION_IMAGE_QUALITY", DEFAULT_IMAGE_QUALITY),
+        "format": image_format,
+        "grayscale": _bool_from_env("VISION_IMAGE_GRAYSCALE", False),
+    }
+    options.update({key: value for key, value in overrides.items() if key in options and value is not None})
+    return options
+
+
+def _preprocess_image(image_bytes: bytes, mime: str, options: Dict[str, Any]) -> tuple[bytes, str]:
+    """Downscale to ``max_edge``, optionally drop colour and re-encode; returns the bytes to upload and their mime.
+
+    The original bytes are kept when OpenCV is unavailable, the image cannot be decoded, or nothing needed
+    changing and re-encoding would not make the file smaller.
+    """
+    try:
+        import cv2
+        import numpy as np
+    except ImportError:
+        return image_bytes, mime
+
+    image = cv2.imdecode(np.frombuffer(image_bytes, dtype=np.uint8), cv2.IMREAD_COLOR)
+    if image is None:
+        return image_bytes, mime
+
+    extension, target_mime = IMAGE_FORMATS.get(options["format"], IMAGE_FORMATS["jpeg"])
+    changed = target_mime != mime
+    height, width = image.shape[:2]
+    max_edge = int(options["max_edge"])
+    if max_edge > 0 and max(height, width) > max_edge:
+        scale = max_edge / float(max(height, width))
+        size = (max(1, round(width * scale)), max(1, round(height * scale)))
+        image = cv2.resize(image, size, interpolation=cv2.INTER_AREA)
+        changed = True
+    if options["grayscale"]:
+        image = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+        changed = True
+
+    quality = max(1, min(100, int(options["quality"])))
+    quality_flag = cv2.IMWRITE_WEBP_QUALITY if extension == ".webp" else cv2.IMWRITE_JPEG_QUALITY
+    ok, encoded = cv2.imencode(extension, image, [quality_flag, quality])
+    if not ok:
+        return image_bytes, mime
+    processed = encoded.tobytes()
+    if not changed and len(processed) >= len(image_bytes):
+        return image_bytes, mime
+    return processed, target_mime
+
+
+def _record_image_bytes(original: int, sent: int) -> None:
+    with _IMAGE_STATS_LOCK:
+        _IMAGE_STATS["images"] += 1
+        _IMAGE_STATS["original_bytes"] += original
+        _IMAGE_STATS["sent_bytes"] += sent
+
+
+def image_stats() -> Dict[str, int]:
+    """Totals over this process: images uploaded, their size on disk, the size actually sent, and the saving."""
+    with _IMAGE_STATS_LOCK:
+        stats = dict(_IMAGE_STATS)
+    stats["saved_bytes"] = stats["original_bytes"] - stats["sent_bytes"]
+    return stats
+
+
 def _infer_mime(path: Path) -> str:
     mime, _ = mimetypes.guess_type(str(path))
     return mime or "image/jpeg"
 
 
-def _encode_image(entry: Any) -> tuple[str, str]:
+def _encode_image(entry: Any) -> tuple[str, str, int, int]:
+    """Data URL, sha1 of the uploaded bytes, original size and uploaded size for one image entry.
+
+    File paths go through ``_preprocess_image``; a dict entry may override the ``VISION_IMAGE_*`` settings
+    with ``max_edge``, ``quality``, ``format`` or ``grayscale`` (e.g. grayscale for text-only checks).
+    Data URLs are sent as given. The sha1 is taken after preprocessing, so cached responses follow the
+    bytes the model actually saw.
+    """
+    overrides: Dict[str, Any] = {}
     if isinstance(entry, dict):
         path = entry.get("path") or entry.get("image_path")
         data_url = entry.get("data") or entry.get("image_url")
+        overrides = {key: entry.get(key) for key in ("max_edge", "quality", "format", "grayscale")}
     else:
         path = entry
         data_url = None
@@ -116,18 +221,18 @@ def _encode_image(entry: Any) -> tuple[str, str]:
         except Exception as exc:  # noqa: BLE001
             raise ValueError("Invalid data URL provided for vision call") from exc
         sha1 = hashlib.sha1(raw_bytes).hexdigest()
-        return data_url, sha1
+        return data_url, sha1, len(raw_bytes), len(raw_bytes)
 
     if not path:
         raise ValueError("Image entry must contain a path or data URL")
 
     file_path = Path(path).expanduser().resolve()
     with open(file_path, "rb") as image_file:
-        image_bytes = image_file.read()
+        original_bytes = image_file.read()
+    image_bytes, mime = _preprocess_image(original_bytes, _infer_mime(file_path), image_options(**overrides))
     sha1 = hashlib.sha1(image_bytes).hexdigest()
     b64 = base64.b64encode(image_bytes).decode("utf-8")
-    mime = _infer_mime(file_path)
-    return f"data:{mime};base64,{b64}", sha1
+    return f"data:{mime};base64,{b64}", sha1, len(original_bytes), len(image_bytes)
 
 
 def _prepare_messages(messages: Sequence[Any], image_payloads: Sequence[str]) -> List[Dict[str, Any]]:
@@ -223,6 +328,7 @@ def _chat_common(
     *,
     cache_messages: Sequence[Any] | None = None,
     extra_cache_key: str = "",
+    on_send: Callable[[], None] | None = None,
     **payload_overrides: Any,
 ) -> Dict[str, Any]:
     cache_basis = cache_messages if cache_messages is not None else payload_messages
@@ -241,6 +347,8 @@ def _chat_common(
         cached = _load_cache(cache_key)
     if cached is not None:
         return cached
+    if on_send is not None:
+        on_send()
 
     payload: Dict[str, Any] = {
         "model": model,
@@ -271,10 +379,27 @@ def chat_vision(
     """Call iFlow vision chat endpoint with retries, concurrency control, and caching."""
     image_payloads: List[str] = []
     image_hash_parts: List[str] = []
+    image_sizes: List[tuple[int, int]] = []
     for image in images:
-        data_url, sha1 = _encode_image(image)
+        data_url, sha1, original_size, sent_size = _encode_image(image)
         image_payloads.append(data_url)
         image_hash_parts.append(sha1)
+        image_sizes.append((original_size, sent_size))
+
+    def _record_upload() -> None:
+        # Only requests that miss the response cache actually upload the images.
+        for original_size, sent_size in image_sizes:
+            _record_image_bytes(original_size, sent_size)
+        if image_sizes:
+            original_total = sum(original for original, _ in image_sizes)
+            sent_total = sum(sent for _, sent in image_sizes)
+            LOGGER.debug(
+                "Vision payload: %d images, %d -> %d bytes (saved %d)",
+                len(image_sizes),
+                original_total,
+                sent_total,
+                original_total - sent_total,
+            )
 
     sanitized_messages = copy.deepcopy(messages)
     for message in sanitized_messages:
@@ -298,6 +423,7 @@ def chat_vision(
         timeout_s,
         cache_messages=sanitized_messages,
         extra_cache_key=extra_key,
+        on_send=_record_upload,
         **payload_overrides,
     )
 
@@ -323,4 +449,5 @@ def get_runtime_config() -> Dict[str, Any]:
         "max_workers": MAX_WORKERS,
         "retries": 3,
         "cache_dir": str(_CACHE_DIR),
+        "image_options": image_options(),
     }
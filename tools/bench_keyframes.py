@@ -0,0 +1,102 @@
+"""Time keyframe selection on synthetic frame lists of 10k+ frames (no video decoding, no VLM calls).
+
+Usage:
+    python -m tools.bench_keyframes [--frames 10000 50000] [--scene-len 30] [--repeat 3] [--json]
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import random
+import sys
+import time
+from pathlib import Path
+from typing import Dict, List, Sequence
+
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+
+from backend.core import video_utils, visual_extractor  # noqa: E402
+
+
+def synthetic_frames(count: int, scene_len: int = 30, seed: int = 0) -> Dict[str, List[Dict[str, object]]]:
+    """One frame per second; frames of a scene share a base dHash with a few flipped bits, like a static shot."""
+    rng = random.Random(seed)
+    scenes: List[Dict[str, float]] = []
+    frames: List[Dict[str, object]] = []
+    base_hash = 0
+    for idx in range(count):
+        if idx % scene_len == 0:
+            end = float(min(idx + scene_len, count))
+            scenes.append({"start": float(idx), "end": end})
+            base_hash = rng.getrandbits(64)
+        frame_hash = base_hash
+        for _ in range(rng.randint(0, 12)):
+            frame_hash ^= 1 << rng.randrange(64)
+        frames.append(
+            {
+                "frame_id": f"frame_{idx:05d}",
+                "ts": float(idx),
+                "path": f"/tmp/frame_{idx:05d}.jpg",
+                "metrics": {
+                    "clarity": rng.uniform(0.0, 500.0),
+                    "entropy": rng.uniform(3.0, 5.5),
+                    "edge_density": rng.uniform(0.0, 0.3),
+                },
+                "dhash": frame_hash,
+            }
+        )
+    return {"scenes": scenes, "frames": frames}
+
+
+def run_benchmark(sizes: Sequence[int], scene_len: int = 30, repeat: int = 3) -> Dict[str, Dict[str, float]]:
+    report: Dict[str, Dict[str, float]] = {}
+    light_rank = visual_extractor.light_rank
+    # Only the selection engine is timed: the light-rank VLM call is replaced by a no-op.
+    visual_extractor.light_rank = lambda paths: []
+    try:
+        for size in sizes:
+            data = synthetic_frames(size, scene_len=scene_len)
+            timings: List[float] = []
+            for _ in range(repeat):
+                started = time.perf_counter()
+                result = video_utils.select_keyframes(data["scenes"], data["frames"])
+                timings.append(time.perf_counter() - started)
+            reasons: Dict[str, int] = {}
+            for item in result["rejected"]:
+                reasons[item["reason"]] = reasons.get(item["reason"], 0) + 1
+            best = min(timings)
+            report[str(size)] = {
+                "seconds": round(best, 4),
+                "us_per_frame": round(best / size * 1e6, 2),
+                "scenes": len(data["scenes"]),
+                "chosen": len(result["chosen"]),
+                "near_duplicate": reasons.get("near_duplicate", 0),
+            }
+    finally:
+        visual_extractor.light_rank = light_rank
+    return report
+
+
+def main(argv: Sequence[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--frames", type=int, nargs="+", default=[10000, 50000], help="frame counts to benchmark")
+    parser.add_argument("--scene-len", type=int, default=30, help="frames per synthetic scene")
+    parser.add_argument("--repeat", type=int, default=3, help="runs per size; the fastest is reported")
+    parser.add_argument("--json", action="store_true", help="print the raw report as JSON")
+    args = parser.parse_args(argv)
+
+    report = run_benchmark(args.frames, scene_len=args.scene_len, repeat=args.repeat)
+    if args.json:
+        print(json.dumps(report, ensure_ascii=False, indent=2))
+        return 0
+    for size, row in report.items():
+        print(
+            f"{size:>7} frames: {row['seconds']:.3f}s  {row['us_per_frame']:.1f}us/frame  "
+            f"{row['scenes']} scenes  {row['near_duplicate']} near-duplicates  {row['chosen']} chosen"
+        )
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
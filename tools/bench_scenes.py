@@ -0,0 +1,115 @@
+"""Compare fast and full scene detection: speed (x real time) and cut accuracy against full mode.
+
+With ``--sampling`` it instead times ``analyze_video`` in the dense, sparse and adaptive sampling modes.
+
+Usage:
+    python -m tools.bench_scenes samples/sample.mp4 [--tolerance 0.5] [--json] [--sampling]
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import sys
+import time
+from pathlib import Path
+from typing import Dict, List, Sequence
+
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+
+from backend.core import video_utils  # noqa: E402
+
+
+def _cuts(scenes: Sequence[Dict[str, float]]) -> List[float]:
+    return [float(scene["start"]) for scene in scenes[1:]]
+
+
+def compare_cuts(reference: Sequence[float], candidate: Sequence[float], tolerance: float) -> Dict[str, float]:
+    """Greedy one-to-one matching of cut times within ``tolerance`` seconds."""
+    remaining = sorted(candidate)
+    offsets: List[float] = []
+    for cut in sorted(reference):
+        best = min(remaining, key=lambda item: abs(item - cut), default=None)
+        if best is not None and abs(best - cut) <= tolerance:
+            offsets.append(abs(best - cut))
+            remaining.remove(best)
+    matched = len(offsets)
+    precision = matched / len(candidate) if candidate else 1.0
+    recall = matched / len(reference) if reference else 1.0
+    f1 = 2 * precision * recall / (precision + recall) if precision + recall else 0.0
+    return {
+        "precision": round(precision, 3),
+        "recall": round(recall, 3),
+        "f1": round(f1, 3),
+        "mean_offset_s": round(sum(offsets) / matched, 3) if matched else 0.0,
+    }
+
+
+def run_benchmark(video_path: str, tolerance: float = 0.5) -> Dict[str, Dict[str, float]]:
+    report: Dict[str, Dict[str, float]] = {}
+    cuts: Dict[str, List[float]] = {}
+    for mode in ("full", "fast"):
+        started = time.perf_counter()
+        scenes = video_utils.detect_scenes(video_path, mode=mode)
+        elapsed = time.perf_counter() - started
+        duration = float(scenes[-1]["end"]) if scenes else 0.0
+        cuts[mode] = _cuts(scenes)
+        report[mode] = {
+            "seconds": round(elapsed, 3),
+            "x_realtime": round(duration / elapsed, 2) if elapsed > 0 else 0.0,
+            "scenes": len(scenes),
+        }
+    report["fast"].update(compare_cuts(cuts["full"], cuts["fast"], tolerance))
+    return report
+
+
+def run_sampling_benchmark(video_path: str, fps: int = 1) -> Dict[str, Dict[str, float]]:
+    report: Dict[str, Dict[str, float]] = {}
+    for mode in video_utils.SAMPLING_MODES:
+        started = time.perf_counter()
+        result = video_utils.analyze_video(video_path, fps=fps, mode=mode)
+        elapsed = time.perf_counter() - started
+        duration = float(result["scenes"][-1]["end"]) if result["scenes"] else 0.0
+        report[mode] = {
+            "seconds": round(elapsed, 3),
+            "x_realtime": round(duration / elapsed, 2) if elapsed > 0 else 0.0,
+            "scenes": len(result["scenes"]),
+            "frames": len(result["frames"]),
+        }
+    return report
+
+
+def main(argv: Sequence[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("video", help="path to the video to benchmark")
+    parser.add_argument("--tolerance", type=float, default=0.5, help="max cut offset in seconds counted as a match")
+    parser.add_argument("--json", action="store_true", help="print the raw report as JSON")
+    parser.add_argument("--sampling", action="store_true", help="time analyze_video per frame sampling mode instead")
+    args = parser.parse_args(argv)
+
+    if args.sampling:
+        report = run_sampling_benchmark(args.video)
+    else:
+        report = run_benchmark(args.video, tolerance=args.tolerance)
+    if args.json:
+        print(json.dumps(report, ensure_ascii=False, indent=2))
+        return 0
+    if args.sampling:
+        for mode, row in report.items():
+            print(
+                f"{mode:>8}: {row['seconds']:.2f}s  {row['x_realtime']:.1f}x real time  "
+                f"{row['scenes']} scenes  {row['frames']} frames"
+            )
+        return 0
+    for mode, row in report.items():
+        print(f"{mode:>4}: {row['seconds']:.2f}s  {row['x_realtime']:.1f}x real time  {row['scenes']} scenes")
+    fast = report["fast"]
+    print(
+        f"fast vs full cuts (±{args.tolerance}s): precision {fast['precision']:.3f}  recall {fast['recall']:.3f}  "
+        f"F1 {fast['f1']:.3f}  mean offset {fast['mean_offset_s']:.3f}s"
+    )
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())